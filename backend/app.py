@@ -1,18 +1,80 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from starlette.datastructures import Headers
+from pydantic import ValidationError
+from typing import Callable, List, Optional, Dict, Tuple
+from functools import partial
 from datetime import datetime
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
 from loguru import logger
 import json
 import time
-import re
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 import yt_dlp
 import mimetypes
+import hashlib
+import uuid
+from jobs import AnalysisJob, InFlightJobs, JobQueue, QueueFullError
+from workspace import Workspace, WorkspaceFullError, process_alive
+from models import (
+    AnalysisResult,
+    AnalysisState,
+    BatchAnalysis,
+    BatchItem,
+    BatchRequest,
+    FollowUpAnswer,
+    FollowUpQuestion,
+    OfflineAnalysis,
+    OfflineSegment,
+    ProcessingStep,
+    TriageResult,
+    VideoAnalysis,
+    ANALYSIS_SERVER_FIELDS,
+    FOLLOW_UP_SERVER_FIELDS,
+)
+from metrics import metrics
+from cache import ResultCache, create_cache_backend, make_cache_key
+from gemini_files import GeminiFileRegistry
+from gemini_poller import FileActivationPoller, FileProcessingError, video_duration
+from gemini_scheduler import GeminiScheduler, OperationLimits
+from gemini_batch import BatchEntry, FakeBatchService, GeminiBatchService, OfflineBatcher
+from context_cache import ContextCache, FakeContextCacheService, GeminiContextCacheService
+from state_store import create_state_store
+from events import PreviewBuffer, ProgressBroker, format_sse
+from progress import DownloadProgressReporter
+from downloads import DownloadSettings, YoutubeDownloader, extract_youtube_id
+from preprocess import TranscodeSettings, ffmpeg_path, probe_duration, transcode_video
+from audio import AudioSettings, AudioSkeleton, analyze_audio, audio_available
+from keyframes import KeyframeSample, KeyframeSettings, keyframes_available, sample_keyframes
+from prompts import (
+    ANALYSIS_INSTRUCTIONS,
+    ANALYSIS_REQUEST,
+    AUDIO_TURNS,
+    CONTINUATION_REQUEST,
+    FOLLOW_UP_REQUEST,
+    KEYFRAME_REQUEST,
+    SEGMENT_REQUEST,
+    TRIAGE_INSTRUCTIONS,
+    TRIAGE_REQUEST,
+)
+from response_schema import gemini_schema
+from salvage import (
+    IncrementalObjectParser,
+    analysis_sections,
+    build_partial_result,
+    salvage_analysis,
+    salvage_json_object,
+    validate_sections,
+)
+from segments import Segment, format_timestamp, localize_result, localize_section, merge_results, plan_segments
+from triage import select_segments
 
 # Load environment variables
 load_dotenv()
@@ -28,11 +90,31 @@ logger.add(
     diagnose=True
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clear out what earlier runs left in the workspace before taking jobs
+    workspace.collect_orphans()
+    # Start the background analysis workers alongside the server
+    await job_queue.start()
+    await offline_batcher.start()
+    resume_offline_analyses()
+    yield
+    for task in [*batch_feeders, *offline_completions]:
+        task.cancel()
+    await job_queue.stop()
+    await offline_batcher.stop()
+    if context_cache is not None:
+        await context_cache.close()
+    download_executor.shutdown(wait=False, cancel_futures=True)
+    preprocess_executor.shutdown(wait=False, cancel_futures=True)
+    audio_executor.shutdown(wait=False, cancel_futures=True)
+
 # Initialize FastAPI
 app = FastAPI(
     title="Political Video Analysis API",
     description="AI-powered analysis of political videos using Google Gemini",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS (adjust allowed origins as needed)
@@ -44,6 +126,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class UploadSizeLimit:
+    """Caps the body of upload requests at MAX_UPLOAD_BYTES while it is received.
+
+    The form parser spools the whole multipart body to a temporary file
+    before the endpoint runs, so the limit cannot be enforced there. Requests
+    announcing a larger Content-Length are rejected before anything is read;
+    for the others (chunked, or understating their size) the bytes are
+    counted as they arrive and the request fails with a 413 once they pass
+    the limit, leaving the spool no larger than MAX_UPLOAD_BYTES.
+    """
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+        detail = f"Upload exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes"
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+            logger.warning(f"Rejected upload of {content_length} bytes (limit {MAX_UPLOAD_BYTES})")
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_BYTES:
+                    logger.warning(f"Cut off an upload after {received} bytes (limit {MAX_UPLOAD_BYTES})")
+                    # Passed through by the form parsing, unlike other errors (which become a 400)
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+app.add_middleware(UploadSizeLimit, path="/analyze/upload")
+
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
@@ -51,398 +176,1957 @@ if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY is required")
 
 client = genai.Client(api_key=GEMINI_API_KEY)
-MODEL_NAME = "gemini-2.0-flash"  # Using the pro model for better analysis
+# Model for the full analysis; TRIAGE_MODEL does the cheap first pass
+MODEL_NAME = os.getenv("ANALYSIS_MODEL", "gemini-2.0-flash")
+
+# Background job settings: how many analyses run at once and how many may wait
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "16"))
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "100"))
+# Jobs of /analyze/batch wait in a separate lane of BATCH_QUEUE_SIZE, behind interactive requests
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "10"))
+# yt-dlp only has a blocking API, so downloads get their own thread pool
+YTDLP_THREADS = int(os.getenv("YTDLP_THREADS", "4"))
+# YouTube videos are fetched in the smallest format at least YOUTUBE_MIN_HEIGHT tall (by default the height
+# preprocessing scales to), fragmented formats over YOUTUBE_CONCURRENT_FRAGMENTS connections; what yt-dlp
+# extracts about a video is reused for YOUTUBE_INFO_CACHE_TTL seconds
+DOWNLOAD_SETTINGS = DownloadSettings(
+    min_height=int(os.getenv("YOUTUBE_MIN_HEIGHT", os.getenv("PREPROCESS_MAX_HEIGHT", "480"))),
+    min_audio_bitrate=float(os.getenv("YOUTUBE_MIN_AUDIO_BITRATE", "48")),
+    concurrent_fragments=int(os.getenv("YOUTUBE_CONCURRENT_FRAGMENTS", "4")),
+)
+YOUTUBE_INFO_CACHE_TTL = float(os.getenv("YOUTUBE_INFO_CACHE_TTL", "1800"))
+
+# Direct uploads are copied to the job directory in chunks and capped in size (by UploadSizeLimit)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Every job gets a directory in WORKSPACE_DIR (those left there by processes that are gone are removed on
+# startup). Jobs reserve WORKSPACE_OVERHEAD times their video's size (the transcode and
+# keyframes live next to it) within WORKSPACE_QUOTA_BYTES and keeping WORKSPACE_MIN_FREE_BYTES of the disk
+# free. Queued jobs wait up to WORKSPACE_WAIT_TIMEOUT seconds for room; uploads are refused at once with a
+# 503 asking to retry after UPLOAD_RETRY_AFTER seconds, as the request would otherwise hang. Not counted:
+# the copy of an upload the form parser spools to the system temp directory (TMPDIR) before the endpoint
+# runs, up to MAX_UPLOAD_BYTES per upload in progress
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "temp")
+WORKSPACE_QUOTA_BYTES = int(os.getenv("WORKSPACE_QUOTA_BYTES", str(20 * 1024 * 1024 * 1024)))
+WORKSPACE_MIN_FREE_BYTES = int(os.getenv("WORKSPACE_MIN_FREE_BYTES", str(1024 * 1024 * 1024)))
+WORKSPACE_OVERHEAD = float(os.getenv("WORKSPACE_OVERHEAD", "2"))
+WORKSPACE_WAIT_TIMEOUT = float(os.getenv("WORKSPACE_WAIT_TIMEOUT", "600"))
+UPLOAD_RETRY_AFTER = int(os.getenv("UPLOAD_RETRY_AFTER", "30"))
+# Reserved for a video whose size is not known in advance
+WORKSPACE_DEFAULT_VIDEO_BYTES = int(os.getenv("WORKSPACE_DEFAULT_VIDEO_BYTES", str(200 * 1024 * 1024)))
+# Videos up to WORKSPACE_TMPFS_MAX_BYTES are kept in this memory-backed directory (e.g. /dev/shm/analysis)
+# while the jobs there reserve less than WORKSPACE_TMPFS_QUOTA_BYTES; disabled when empty
+WORKSPACE_TMPFS_DIR = os.getenv("WORKSPACE_TMPFS_DIR", "")
+WORKSPACE_TMPFS_MAX_BYTES = int(os.getenv("WORKSPACE_TMPFS_MAX_BYTES", str(64 * 1024 * 1024)))
+WORKSPACE_TMPFS_QUOTA_BYTES = int(os.getenv("WORKSPACE_TMPFS_QUOTA_BYTES", str(512 * 1024 * 1024)))
+
+# Finished analyses are cached by video content + model + prompt ('memory', 'sqlite' or 'none')
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.sqlite3")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+# Follow-up answers go to their own table of the same backend, so that the many small answers neither
+# evict analyses nor skew the result cache's hit rate
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(RESULT_CACHE_TTL)))
+# Where analysis states are kept ('memory' or 'sqlite') and for how long
+STATE_STORE_BACKEND = os.getenv("STATE_STORE_BACKEND", "memory")
+STATE_STORE_PATH = os.getenv("STATE_STORE_PATH", "analysis_states.sqlite3")
+STATE_STORE_MAX_ENTRIES = int(os.getenv("STATE_STORE_MAX_ENTRIES", "10000"))
+STATE_STORE_TTL = float(os.getenv("STATE_STORE_TTL", str(24 * 3600)))
+
+# Event streams re-check the store this often (seconds) to follow jobs run by other workers
+EVENT_STREAM_POLL_INTERVAL = float(os.getenv("EVENT_STREAM_POLL_INTERVAL", "1.0"))
+EVENT_STREAM_KEEPALIVE = 15.0
+
+# Download progress is published on >= PROGRESS_MIN_STEP changes, at most PROGRESS_MAX_RATE per second
+PROGRESS_MIN_STEP = float(os.getenv("PROGRESS_MIN_STEP", "0.01"))
+PROGRESS_MAX_RATE = float(os.getenv("PROGRESS_MAX_RATE", "4"))
+
+# Optional ffmpeg pass that shrinks videos before they are uploaded to Gemini
+PREPROCESS_VIDEO = os.getenv("PREPROCESS_VIDEO", "true").lower() == "true"
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "2"))
+TRANSCODE_SETTINGS = TranscodeSettings(
+    max_height=int(os.getenv("PREPROCESS_MAX_HEIGHT", "480")),
+    fps=float(os.getenv("PREPROCESS_FPS", "5")),
+    video_bitrate=os.getenv("PREPROCESS_VIDEO_BITRATE", "400k"),
+    keep_audio=os.getenv("PREPROCESS_KEEP_AUDIO", "true").lower() == "true",
+    audio_bitrate=os.getenv("PREPROCESS_AUDIO_BITRATE", "64k"),
+)
 
-# ==============================
-# Pydantic Models (Upgraded)
-# ==============================
+# Speaker turns detected locally in the soundtrack (needs NumPy and ffmpeg) are passed to the model as
+# exact timestamps; segments with less than AUDIO_MIN_SPEECH_FRACTION of speech are not analyzed
+AUDIO_SKELETON = os.getenv("AUDIO_SKELETON", "true").lower() == "true"
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", "2"))
+AUDIO_MIN_SPEECH_FRACTION = float(os.getenv("AUDIO_MIN_SPEECH_FRACTION", "0.05"))
+AUDIO_SETTINGS = AudioSettings(
+    vad_margin_db=float(os.getenv("AUDIO_VAD_MARGIN_DB", "12")),
+    change_sigma=float(os.getenv("AUDIO_CHANGE_SIGMA", "1.5")),
+)
+
+# What interactive analyses send to Gemini: 'video' uploads the whole file; 'keyframes' (needs NumPy and
+# ffmpeg) sends at most KEYFRAME_BUDGET frames chosen locally at shot changes and moments of motion, plus
+# the soundtrack as compressed audio unless KEYFRAME_AUDIO is off, inline with one request and without an
+# upload. Keyframe analyses cover the whole video at once (no segments or triage) and cannot take
+# follow-up questions; offline jobs always upload the video
+ANALYSIS_INPUT = os.getenv("ANALYSIS_INPUT", "video")
+KEYFRAME_SETTINGS = KeyframeSettings(
+    max_frames=int(os.getenv("KEYFRAME_BUDGET", "32")),
+    sample_fps=float(os.getenv("KEYFRAME_SAMPLE_FPS", "2")),
+    scene_threshold=float(os.getenv("KEYFRAME_SCENE_THRESHOLD", "0.12")),
+    min_gap=float(os.getenv("KEYFRAME_MIN_GAP", "2")),
+    keep_audio=os.getenv("KEYFRAME_AUDIO", "true").lower() == "true",
+    audio_bitrate=os.getenv("KEYFRAME_AUDIO_BITRATE", "16k"),
+)
+
+# Responses cut off by the output token limit are salvaged; optionally ask again for only the missing sections
+CONTINUE_PARTIAL_RESULTS = os.getenv("CONTINUE_PARTIAL_RESULTS", "true").lower() == "true"
+
+# Stream analyses from Gemini and publish each section as soon as it is complete
+STREAM_ANALYSIS = os.getenv("STREAM_ANALYSIS", "true").lower() == "true"
+
+# Videos longer than SEGMENT_MIN_DURATION seconds are analyzed in overlapping windows in parallel
+SEGMENT_VIDEOS = os.getenv("SEGMENT_VIDEOS", "true").lower() == "true"
+SEGMENT_MIN_DURATION = float(os.getenv("SEGMENT_MIN_DURATION", "600"))
+SEGMENT_LENGTH = float(os.getenv("SEGMENT_LENGTH", "300"))
+SEGMENT_OVERLAP = float(os.getenv("SEGMENT_OVERLAP", "15"))
+SEGMENT_CONCURRENCY = int(os.getenv("SEGMENT_CONCURRENCY", "4"))
+
+# Tiered analysis: a cheap TRIAGE_MODEL pass at low media resolution decides whether a video gets
+# the full analysis at all and, for segmented videos, which segments do (interest >= TRIAGE_MIN_INTEREST,
+# at most TRIAGE_MAX_SEGMENTS of them; 0 = no limit)
+TRIAGE_VIDEOS = os.getenv("TRIAGE_VIDEOS", "false").lower() == "true"
+TRIAGE_MODEL = os.getenv("TRIAGE_MODEL", "gemini-2.0-flash-lite")
+TRIAGE_MIN_INTEREST = float(os.getenv("TRIAGE_MIN_INTEREST", "0.5"))
+TRIAGE_MAX_SEGMENTS = int(os.getenv("TRIAGE_MAX_SEGMENTS", "0"))
+TRIAGE_MAX_OUTPUT_TOKENS = int(os.getenv("TRIAGE_MAX_OUTPUT_TOKENS", "500"))
+
+# Videos already uploaded to Gemini are reused by content ('memory', 'sqlite' or 'none')
+GEMINI_FILE_REGISTRY_BACKEND = os.getenv("GEMINI_FILE_REGISTRY_BACKEND", "memory")
+GEMINI_FILE_REGISTRY_PATH = os.getenv("GEMINI_FILE_REGISTRY_PATH", RESULT_CACHE_PATH)
+
+# Waiting for uploads to become ACTIVE: backoff between polls and a deadline of
+# GEMINI_POLL_BASE_TIMEOUT plus GEMINI_POLL_SECONDS_PER_MB per megabyte uploaded
+GEMINI_POLL_INITIAL_INTERVAL = float(os.getenv("GEMINI_POLL_INITIAL_INTERVAL", "0.25"))
+GEMINI_POLL_MAX_INTERVAL = float(os.getenv("GEMINI_POLL_MAX_INTERVAL", "5"))
+GEMINI_POLL_BASE_TIMEOUT = float(os.getenv("GEMINI_POLL_BASE_TIMEOUT", "60"))
+GEMINI_POLL_SECONDS_PER_MB = float(os.getenv("GEMINI_POLL_SECONDS_PER_MB", "1"))
+GEMINI_POLL_MAX_TIMEOUT = float(os.getenv("GEMINI_POLL_MAX_TIMEOUT", "1800"))
+
+# Gemini quotas per operation (0 = unlimited); 429/503 responses are retried with jittered backoff
+GEMINI_GENERATE_RPM = float(os.getenv("GEMINI_GENERATE_RPM", "1000"))
+GEMINI_GENERATE_TPM = float(os.getenv("GEMINI_GENERATE_TPM", "4000000"))
+GEMINI_GENERATE_CONCURRENCY = int(os.getenv("GEMINI_GENERATE_CONCURRENCY", "16"))
+GEMINI_UPLOAD_RPM = float(os.getenv("GEMINI_UPLOAD_RPM", "0"))
+GEMINI_UPLOAD_CONCURRENCY = int(os.getenv("GEMINI_UPLOAD_CONCURRENCY", "8"))
+GEMINI_TRIAGE_RPM = float(os.getenv("GEMINI_TRIAGE_RPM", "4000"))
+GEMINI_TRIAGE_TPM = float(os.getenv("GEMINI_TRIAGE_TPM", "4000000"))
+GEMINI_TRIAGE_CONCURRENCY = int(os.getenv("GEMINI_TRIAGE_CONCURRENCY", "16"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+# Gemini bills roughly 300 tokens per second of video (frames plus audio)
+VIDEO_TOKENS_PER_SECOND = 300
+# ... and roughly 100 at low media resolution, as used for triage
+TRIAGE_TOKENS_PER_SECOND = 100
+# An image up to 384x384 (keyframes are never larger) and a second of audio
+IMAGE_TOKENS = 258
+AUDIO_TOKENS_PER_SECOND = 32
+# Assumed length when neither Gemini nor ffmpeg could tell us
+DEFAULT_VIDEO_SECONDS = 120
+
+# Offline jobs are analyzed through Gemini batch mode ('gemini', or 'fake' to answer locally
+# with the regular client); a batch is sent at OFFLINE_BATCH_MAX_SIZE requests or OFFLINE_BATCH_MAX_WAIT seconds
+OFFLINE_BATCH_SERVICE = os.getenv("OFFLINE_BATCH_SERVICE", "gemini")
+OFFLINE_BATCH_MAX_SIZE = int(os.getenv("OFFLINE_BATCH_MAX_SIZE", "100"))
+OFFLINE_BATCH_MAX_WAIT = float(os.getenv("OFFLINE_BATCH_MAX_WAIT", "300"))
+OFFLINE_BATCH_POLL_INTERVAL = float(os.getenv("OFFLINE_BATCH_POLL_INTERVAL", "60"))
+OFFLINE_FAKE_DELAY = float(os.getenv("OFFLINE_FAKE_DELAY", "1"))
+
+# Gemini context caching ('gemini', 'fake' to keep them locally for the stub client, or 'none') of a video
+# together with the analysis instructions, once it is queried again (continuations). The instructions
+# alone are a few hundred tokens, far below CONTEXT_CACHE_MIN_TOKENS, so they are always sent inline
+CONTEXT_CACHE_SERVICE = os.getenv("CONTEXT_CACHE_SERVICE", "gemini")
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_REFRESH_MARGIN = float(os.getenv("CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+# Gemini rejects cached contents below a model-specific size
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "4096"))
+
+download_executor = ThreadPoolExecutor(max_workers=YTDLP_THREADS, thread_name_prefix="yt-dlp")
+youtube_downloader = YoutubeDownloader(DOWNLOAD_SETTINGS, info_ttl=YOUTUBE_INFO_CACHE_TTL)
+# ffmpeg runs as its own process; this pool only bounds how many run at once
+preprocess_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="ffmpeg")
+# Separate from preprocessing so both can run while the video is uploaded
+audio_executor = ThreadPoolExecutor(max_workers=AUDIO_WORKERS, thread_name_prefix="audio")
+workspace = Workspace(
+    WORKSPACE_DIR,
+    WORKSPACE_QUOTA_BYTES,
+    overhead=WORKSPACE_OVERHEAD,
+    min_free_bytes=WORKSPACE_MIN_FREE_BYTES,
+    tmpfs_root=WORKSPACE_TMPFS_DIR or None,
+    tmpfs_quota_bytes=WORKSPACE_TMPFS_QUOTA_BYTES,
+    tmpfs_max_bytes=WORKSPACE_TMPFS_MAX_BYTES,
+)
+
+if PREPROCESS_VIDEO and not ffmpeg_path():
+    logger.warning("PREPROCESS_VIDEO is enabled but ffmpeg was not found; videos are uploaded as-is")
+    PREPROCESS_VIDEO = False
+if AUDIO_SKELETON and not audio_available():
+    logger.warning("AUDIO_SKELETON is enabled but NumPy or ffmpeg was not found; analyzing without speaker turns")
+    AUDIO_SKELETON = False
+if ANALYSIS_INPUT == "keyframes" and not keyframes_available():
+    logger.warning("ANALYSIS_INPUT is 'keyframes' but NumPy or ffmpeg was not found; uploading whole videos")
+    ANALYSIS_INPUT = "video"
+# Identifies what Gemini actually receives for a given source video
+PREPROCESS_SIGNATURE = TRANSCODE_SETTINGS.signature() if PREPROCESS_VIDEO else "original"
+
+# Analysis states live in a bounded store; use 'sqlite' to share them between uvicorn workers
+analysis_store = create_state_store(
+    STATE_STORE_BACKEND, STATE_STORE_PATH, VideoAnalysis, STATE_STORE_MAX_ENTRIES, STATE_STORE_TTL
+)
+# Pushes state changes to clients of /analysis/{id}/events
+progress_broker = ProgressBroker()
+previews = PreviewBuffer()
+# Jobs for a video that is already being analyzed follow the running job instead of repeating it
+in_flight_jobs = InFlightJobs()
+
+# Batches of YouTube URLs submitted to /analyze/batch; each video is also a normal analysis
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "500"))
+batch_store = create_state_store(
+    STATE_STORE_BACKEND, STATE_STORE_PATH, BatchAnalysis, STATE_STORE_MAX_ENTRIES, STATE_STORE_TTL, table="batches"
+)
+# Tasks feeding batch jobs into the queue as it drains; kept so they are not garbage collected
+batch_feeders: set = set()
+
+# Gemini's structured output schema, derived from the same model the response is validated with
+ANALYSIS_SCHEMA = gemini_schema(AnalysisResult, exclude=ANALYSIS_SERVER_FIELDS)
+MAX_OUTPUT_TOKENS = 2000
+FOLLOW_UP_SCHEMA = gemini_schema(FollowUpAnswer, exclude=FOLLOW_UP_SERVER_FIELDS)
+TRIAGE_SCHEMA = gemini_schema(TriageResult)
+# Segmentation changes what is sent to Gemini, so it is part of the result cache key
+SEGMENT_SIGNATURE = (
+    f"segments-{SEGMENT_MIN_DURATION:g}-{SEGMENT_LENGTH:g}-{SEGMENT_OVERLAP:g}" if SEGMENT_VIDEOS else "whole"
+)
+# Keyframes are a different input than the video, with a prompt of their own
+KEYFRAME_SIGNATURE = f"keyframes-{KEYFRAME_SETTINGS.signature()}-{KEYFRAME_REQUEST.signature}"
+# Speaker turns end up in the prompt and decide which segments are analyzed
+AUDIO_SIGNATURE = (
+    f"audio-{AUDIO_SETTINGS.signature()}-{AUDIO_MIN_SPEECH_FRACTION:g}-{AUDIO_TURNS.signature}"
+    if AUDIO_SKELETON else "no-audio"
+)
+# Triage decides which parts are analyzed, so it is part of the result cache key too
+TRIAGE_SIGNATURE = (
+    f"triage-{TRIAGE_MODEL}-{TRIAGE_MIN_INTEREST:g}-{TRIAGE_MAX_SEGMENTS}-{TRIAGE_INSTRUCTIONS.signature}"
+    if TRIAGE_VIDEOS else "no-triage"
+)
+
+_result_cache_backend = create_cache_backend(
+    RESULT_CACHE_BACKEND, RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL
+)
+result_cache = ResultCache(_result_cache_backend) if _result_cache_backend is not None else None
+
+_answer_cache_backend = create_cache_backend(
+    RESULT_CACHE_BACKEND, RESULT_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, table="answers"
+)
+answer_cache = ResultCache(_answer_cache_backend, name="answer_cache") if _answer_cache_backend is not None else None
+
+_gemini_file_backend = create_cache_backend(
+    GEMINI_FILE_REGISTRY_BACKEND, GEMINI_FILE_REGISTRY_PATH, 10000, 48 * 3600, table="gemini_files"
+)
+gemini_file_registry = GeminiFileRegistry(_gemini_file_backend) if _gemini_file_backend is not None else None
+
+gemini_scheduler = GeminiScheduler(
+    {
+        "generate_content": OperationLimits(
+            requests_per_minute=GEMINI_GENERATE_RPM,
+            tokens_per_minute=GEMINI_GENERATE_TPM,
+            concurrency=GEMINI_GENERATE_CONCURRENCY,
+        ),
+        "upload": OperationLimits(
+            requests_per_minute=GEMINI_UPLOAD_RPM,
+            concurrency=GEMINI_UPLOAD_CONCURRENCY,
+        ),
+        "triage": OperationLimits(
+            requests_per_minute=GEMINI_TRIAGE_RPM,
+            tokens_per_minute=GEMINI_TRIAGE_TPM,
+            concurrency=GEMINI_TRIAGE_CONCURRENCY,
+        ),
+    },
+    max_retries=GEMINI_MAX_RETRIES,
+)
 
-class ProcessingStep(BaseModel):
-    step: str
-    status: str  # 'pending', 'in_progress', 'complete', 'error'
-    message: str
-    progress: float
-
-class AnalysisState(BaseModel):
-    status: str
-    progress: float
-    message: str
-    timestamp: datetime
-    steps: List[ProcessingStep] = []
-
-class AnalysisDetail(BaseModel):
-    emotion: str
-    confidence: float
-    description: Optional[str] = None
-    intensity: Optional[float] = None
-    context: Optional[str] = None
-    timeMarkers: Optional[List[str]] = None
-    truthfulnessScore: Optional[float] = None
-
-class DeceptionIndicator(BaseModel):
-    type: str
-    description: str
-    confidence: float
-    timestamp: float
-
-class ConfidenceMetric(BaseModel):
-    level: float
-    description: str
-    context: str
-    timestamp: float
-
-class KeyStrength(BaseModel):
-    title: str
-    description: str
-    confidence: float
-
-# Updated model to allow an optional timestamp field in areas of note
-class AreaOfNote(BaseModel):
-    title: str
-    description: str
-    significance: str
-    timestamp: Optional[float] = None
-
-class QuestionResponse(BaseModel):
-    responseStyle: str
-    topicHandling: str
-    behavioralPatterns: List[str]
-
-class TimelineEvent(BaseModel):
-    timestamp: float
-    description: str
-
-# New model: captures which question(s) impacted mood
-class QuestionImpact(BaseModel):
-    question: str         # The text or summary of the question
-    timestamp: float      # When the question occurred
-    moodChange: str       # e.g., "nervous", "confident", "neutral"
-    analysis: Optional[str] = None  # Explanation of why this question had an effect
-    confidence: Optional[float] = None  # Confidence score in the observation
-
-class AnalysisResult(BaseModel):
-    timestamp: float
-    facialExpression: AnalysisDetail
-    bodyPosture: AnalysisDetail
-    handGestures: AnalysisDetail
-    overallEmotion: str
-    confidenceScore: float
-    analysis: str
-    deceptionIndicators: Optional[List[DeceptionIndicator]] = None
-    confidenceMetrics: Optional[List[ConfidenceMetric]] = None
-    keyStrengths: List[KeyStrength] = []
-    areasOfNote: List[AreaOfNote] = []
-    questionResponse: QuestionResponse
-    timeline: List[TimelineEvent] = []
-    questionImpacts: Optional[List[QuestionImpact]] = []  # New field
-
-class VideoAnalysis(BaseModel):
-    id: str
-    state: AnalysisState
-    results: Optional[List[AnalysisResult]] = None
-
-# In-memory store for analysis states (use a database in production)
-analysis_states: Dict[str, VideoAnalysis] = {}
+async def answer_batch_request(request: dict) -> str:
+    """Answers a batch request synchronously; backs the 'fake' offline batch service."""
+    config = {**request["generation_config"], "system_instruction": request["system_instruction"]}
+    response = await client.aio.models.generate_content(model=MODEL_NAME, contents=request["contents"], config=config)
+    return response.text
+
+
+if OFFLINE_BATCH_SERVICE == "fake":
+    _batch_service = FakeBatchService(answer_batch_request, delay=OFFLINE_FAKE_DELAY)
+elif OFFLINE_BATCH_SERVICE == "gemini":
+    _batch_service = GeminiBatchService(GEMINI_API_KEY)
+else:
+    raise ValueError(f"Unknown offline batch service: {OFFLINE_BATCH_SERVICE}")
+
+# Analyses waiting for offline batches; with the sqlite store a restarted server polls their batches again
+offline_store = create_state_store(
+    STATE_STORE_BACKEND,
+    STATE_STORE_PATH,
+    OfflineAnalysis,
+    STATE_STORE_MAX_ENTRIES,
+    STATE_STORE_TTL,
+    table="offline_analyses",
+)
+
+
+def record_offline_batch(name: str, entries: List[BatchEntry]):
+    """Notes in the offline store which batch the requests of each analysis went into."""
+    keys_by_analysis: Dict[str, List[str]] = {}
+    for entry in entries:
+        keys_by_analysis.setdefault(entry.key.rsplit(":", 1)[0], []).append(entry.key)
+    for analysis_id, keys in keys_by_analysis.items():
+        record = offline_store.get(analysis_id)
+        if record is None:
+            continue
+        record.batches[name] = keys
+        for key in keys:
+            record.requests.pop(key, None)
+        record.followers = in_flight_jobs.followers(analysis_id)
+        status = "queued" if record.requests else "submitted"
+        record.state = record.state.model_copy(update={"status": status, "timestamp": datetime.now()})
+        offline_store.save(record)
+
+
+offline_batcher = OfflineBatcher(
+    _batch_service,
+    MODEL_NAME,
+    max_batch_size=OFFLINE_BATCH_MAX_SIZE,
+    max_wait=OFFLINE_BATCH_MAX_WAIT,
+    poll_interval=OFFLINE_BATCH_POLL_INTERVAL,
+    on_submitted=record_offline_batch,
+)
+# Tasks waiting on offline batch results for their analysis
+offline_completions: set = set()
+# Follow-up answers being generated, so identical questions asked at once share one call
+pending_answers: Dict[str, asyncio.Task] = {}
+
+if CONTEXT_CACHE_SERVICE == "gemini":
+    _context_cache_service = GeminiContextCacheService(lambda: client)
+elif CONTEXT_CACHE_SERVICE == "fake":
+    _context_cache_service = FakeContextCacheService()
+elif CONTEXT_CACHE_SERVICE == "none":
+    _context_cache_service = None
+else:
+    raise ValueError(f"Unknown context cache service: {CONTEXT_CACHE_SERVICE}")
+context_cache = ContextCache(
+    _context_cache_service,
+    ttl=CONTEXT_CACHE_TTL,
+    refresh_margin=CONTEXT_CACHE_REFRESH_MARGIN,
+    min_tokens=CONTEXT_CACHE_MIN_TOKENS,
+) if _context_cache_service is not None else None
+
+# Looks the client up on every call so it can be swapped out (see benchmarks/)
+file_poller = FileActivationPoller(
+    lambda name: client.aio.files.get(name=name),
+    initial_interval=GEMINI_POLL_INITIAL_INTERVAL,
+    max_interval=GEMINI_POLL_MAX_INTERVAL,
+    base_timeout=GEMINI_POLL_BASE_TIMEOUT,
+    seconds_per_mb=GEMINI_POLL_SECONDS_PER_MB,
+    max_timeout=GEMINI_POLL_MAX_TIMEOUT,
+)
 
 # ==============================
 # Helper Functions
 # ==============================
 
-def handle_progress(d, analysis_id: str):
-    if d.get('status') == 'downloading':
-        try:
-            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            if total_bytes:
-                downloaded = d.get('downloaded_bytes', 0)
-                percentage = (downloaded / total_bytes)
-                logger.info(f"Download progress: {int(percentage * 100)}%")
-                # Update the analysis state progress (scaling the progress between 10-30%)
-                analysis_states[analysis_id].state = AnalysisState(
-                    status="processing",
-                    progress=0.1 + (percentage * 0.2),
-                    message=f"Downloading video: {int(percentage * 100)}%",
-                    timestamp=datetime.now(),
-                    steps=analysis_states[analysis_id].state.steps
-                )
-        except Exception as e:
-            logger.error(f"Error updating progress: {str(e)}")
+class AnalysisError(Exception):
+    """Raised by pipeline stages; the message is surfaced as the analysis state message."""
+
+
+def create_analysis_record(analysis_id: str) -> List[ProcessingStep]:
+    """Stores the initial state of a new analysis and returns its processing steps."""
+    initial_steps = [
+        ProcessingStep(
+            step="upload",
+            status="pending",
+            message="Waiting to start",
+            progress=0.0
+        ),
+        ProcessingStep(
+            step="preprocessing",
+            status="pending",
+            message="Waiting to start",
+            progress=0.0
+        ),
+        ProcessingStep(
+            step="analysis",
+            status="pending",
+            message="Waiting to start",
+            progress=0.0
+        )
+    ]
 
-# ==============================
-# Endpoints
-# ==============================
+    # Mark the upload step as in progress
+    initial_steps[0].status = "in_progress"
 
-@app.post("/analyze/upload", response_model=VideoAnalysis)
-async def analyze_uploaded_video(
-    file: Optional[UploadFile] = None,
-    youtube_url: Optional[str] = Form(None)
+    analysis_store.save(VideoAnalysis(
+        id=analysis_id,
+        state=AnalysisState(
+            status="uploading",
+            progress=0.0,
+            message="Starting upload",
+            timestamp=datetime.now(),
+            steps=initial_steps
+        )
+    ))
+    return initial_steps
+
+
+def complete_from_cache(
+    analysis_id: str, steps: List[ProcessingStep], cached_results: List[AnalysisResult], content_id: str
+) -> VideoAnalysis:
+    logger.info(f"Serving {analysis_id} from the result cache")
+    for step in steps:
+        step.status = "complete"
+        step.progress = 1.0
+        step.message = "Served from cache"
+    analysis = VideoAnalysis(
+        id=analysis_id,
+        state=AnalysisState(
+            status="complete",
+            progress=1.0,
+            message="Analysis complete (cached)",
+            timestamp=datetime.now(),
+            steps=steps
+        ),
+        results=cached_results,
+        contentId=content_id
+    )
+    analysis_store.save(analysis)
+    return analysis
+
+
+def follow_in_flight(job: AnalysisJob) -> Optional[AnalysisJob]:
+    """Attaches the job's analysis to a running job with the same cache key, if there is one.
+
+    Returns that job, whose current state the analysis starts from, or None
+    when the job has to run itself.
+    """
+    leader = in_flight_jobs.attach(job)
+    if leader is None:
+        return None
+    metrics.incr("jobs_deduplicated")
+    logger.info(f"{job.analysis_id} follows {leader.analysis_id}, which is already analyzing {job.content_id}")
+    analysis = analysis_store.get(job.analysis_id)
+    current = analysis_store.get(leader.analysis_id)
+    if analysis is not None and current is not None:
+        analysis.state = current.state.model_copy(deep=True)
+        analysis_store.save(analysis)
+    previews.copy(leader.analysis_id, job.analysis_id)
+    return leader
+
+
+def update_analysis(
+    analysis_id: str,
+    status: str,
+    progress: float,
+    message: str,
+    results: Optional[List[AnalysisResult]] = None,
+    content_id: Optional[str] = None
+) -> Optional[VideoAnalysis]:
+    """Replaces the state of a stored analysis, keeping its steps, and persists it.
+
+    Analyses following it get the same update; a final state releases them.
+    """
+    if status in ("complete", "error"):
+        followers = in_flight_jobs.release(analysis_id)
+    else:
+        followers = in_flight_jobs.followers(analysis_id)
+    for follower_id in followers:
+        set_analysis_state(follower_id, status, progress, message, results, content_id)
+    return set_analysis_state(analysis_id, status, progress, message, results, content_id)
+
+
+def set_analysis_state(
+    analysis_id: str,
+    status: str,
+    progress: float,
+    message: str,
+    results: Optional[List[AnalysisResult]],
+    content_id: Optional[str]
+) -> Optional[VideoAnalysis]:
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
+        logger.warning(f"Analysis ID not found while updating state: {analysis_id}")
+        return None
+    analysis.state = AnalysisState(
+        status=status,
+        progress=progress,
+        message=message,
+        timestamp=datetime.now(),
+        steps=analysis.state.steps
+    )
+    if results is not None:
+        analysis.results = results
+        analysis.preview = None
+    if status in ("complete", "error"):
+        previews.discard(analysis_id)
+    if content_id is not None:
+        analysis.contentId = content_id
+    analysis_store.save(analysis)
+    if progress_broker.has_subscribers(analysis_id):
+        progress_broker.publish(analysis_id, "state", analysis.state.model_dump(mode="json"))
+    return analysis
+
+
+def update_progress(analysis_id: str, progress: float, message: str):
+    """In-place progress update for hot paths; keeps the current status and steps.
+
+    Like every state change it runs on the event loop, so read-modify-save
+    cycles never interleave; worker threads hand it over with
+    ``loop.call_soon_threadsafe``.
+    """
+    for target_id in [analysis_id, *in_flight_jobs.followers(analysis_id)]:
+        analysis = analysis_store.get(target_id)
+        if analysis is None:
+            continue
+        analysis.state.progress = progress
+        analysis.state.message = message
+        analysis.state.timestamp = datetime.now()
+        analysis_store.save(analysis)
+        if progress_broker.has_subscribers(target_id):
+            progress_broker.publish(target_id, "state", analysis.state.model_dump(mode="json"))
+
+
+# Whole-video analyses are localized as a segment covering everything
+WHOLE_VIDEO = Segment(0, 0.0, float("inf"), float("-inf"), float("inf"))
+
+
+def publish_section(
+    analysis_id: str, part: str, event: tuple, track_progress: bool = False, segment: Optional[Segment] = None
 ):
-    analysis_id = f"analysis_{datetime.now().timestamp()}"
+    """Adds a streamed section to the analysis preview and pushes it to event-stream subscribers.
+
+    ``event`` comes from IncrementalObjectParser, or is ``("reset",)`` when
+    the request starts over (a retry), which drops what the part received so
+    far. Sections are localized first (``localize_section``), to the time of
+    the whole video as the final results are. With ``track_progress`` the
+    analysis progress advances from 0.7 to 0.95 as sections arrive. Analyses
+    following this one get the section too.
+    """
+    targets = [analysis_id, *in_flight_jobs.followers(analysis_id)]
+    if event[0] == "reset":
+        for target_id in targets:
+            previews.reset(target_id, part)
+            if progress_broker.has_subscribers(target_id):
+                progress_broker.publish(target_id, "reset", {"part": part})
+        return
+
+    name = event[1]
+    value = localize_section(name, event[-1], segment or WHOLE_VIDEO, previews.offset(analysis_id))
+    if value is None:
+        # An overlap entry the neighbouring segment reports
+        return
+    event = (*event[:-1], value)
+    members = 0
+    for target_id in targets:
+        data, members = previews.add(target_id, part, event)
+        if progress_broker.has_subscribers(target_id):
+            progress_broker.publish(target_id, "section", data)
+    if track_progress and event[0] == "member":
+        update_progress(analysis_id, 0.7 + 0.25 * members / len(analysis_sections()), f"Received {name}")
+
+
+def handle_progress(fraction: float, analysis_id: str):
+    # Update the analysis state progress (scaling the progress between 10-30%)
+    update_progress(
+        analysis_id,
+        progress=0.1 + (fraction * 0.2),
+        message=f"Downloading video: {int(fraction * 100)}%"
+    )
+
+
+async def save_upload(file: UploadFile, file_path: str) -> str:
+    """Copies an uploaded file to ``file_path`` in UPLOAD_CHUNK_SIZE chunks.
+
+    By the time the endpoint runs the form parser has spooled the file
+    (to a temporary file past 1 MB, within MAX_UPLOAD_BYTES as enforced by
+    UploadSizeLimit); copying it in chunks keeps peak memory at one chunk
+    regardless of the video size. Returns the SHA-256 of the content,
+    computed while copying.
+    """
+    started = time.perf_counter()
+    written = 0
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as buffer:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            digest.update(chunk)
+            buffer.write(chunk)
+
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    throughput = written / elapsed / (1024 * 1024)
+    metrics.incr("upload_bytes_total", written)
+    metrics.observe("upload_seconds", elapsed)
+    metrics.observe("upload_throughput_mb_s", throughput, buckets=[1, 5, 10, 50, 100, 250, 500, 1000])
+    logger.info(f"Saved upload {file.filename}: {written} bytes in {elapsed:.2f}s ({throughput:.1f} MB/s)")
+    return digest.hexdigest()
+
+
+def youtube_content_id(youtube_url: str, section: Optional[Tuple[float, Optional[float]]] = None) -> str:
+    video_id = extract_youtube_id(youtube_url)
+    content_id = f"youtube:{video_id or youtube_url.strip()}"
+    if section is not None:
+        # A part of a video is other content than the whole of it
+        start, end = section
+        content_id += f"@{start:g}-{'' if end is None else f'{end:g}'}"
+    return content_id
+
+
+def is_playlist_url(url: str) -> bool:
+    return "list=" in url and extract_youtube_id(url) is None
+
+
+def expand_playlist(playlist_url: str) -> List[str]:
+    """Blocking yt-dlp lookup of the video URLs in a playlist, run on ``download_executor``."""
+    ydl_opts = {'extract_flat': 'in_playlist', 'quiet': True, 'skip_download': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(playlist_url, download=False)
+    urls = []
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        url = entry.get('url') or entry.get('webpage_url')
+        if entry.get('id') and not (url and url.startswith("http")):
+            url = f"https://www.youtube.com/watch?v={entry['id']}"
+        if url:
+            urls.append(url)
+    logger.info(f"Playlist {playlist_url} has {len(urls)} videos")
+    return urls
+
+
+def dedupe_youtube_urls(urls: List[str]):
+    """Drops URLs naming a video already in the list; returns (unique URLs, number dropped)."""
+    seen = set()
+    unique = []
+    for url in urls:
+        content_id = youtube_content_id(url)
+        if content_id not in seen:
+            seen.add(content_id)
+            unique.append(url)
+    return unique, len(urls) - len(unique)
+
+
+def gemini_input_id(content_id: str) -> str:
+    """Identifies the video as uploaded to Gemini (source content, download format and preprocessing)."""
+    if content_id.startswith("youtube:"):
+        return f"{content_id}|{DOWNLOAD_SETTINGS.signature()}|{PREPROCESS_SIGNATURE}"
+    return f"{content_id}|{PREPROCESS_SIGNATURE}"
+
+
+def analysis_cache_key(content_id: str, offline: bool = False, audio: bool = True) -> str:
+    # Anything that changes the Gemini output has to be part of the key; ``audio`` False for results
+    # analyzed without the speaker turns
+    return make_cache_key(
+        gemini_input_id(content_id),
+        KEYFRAME_SIGNATURE if uses_keyframes(offline) else "video",
+        MODEL_NAME,
+        ANALYSIS_INSTRUCTIONS.signature,
+        ANALYSIS_REQUEST.signature,
+        SEGMENT_REQUEST.signature,
+        ANALYSIS_SCHEMA.model_dump_json(exclude_none=True),
+        MAX_OUTPUT_TOKENS,
+        SEGMENT_SIGNATURE,
+        TRIAGE_SIGNATURE,
+        AUDIO_SIGNATURE if audio else "no-audio"
+    )
+
+
+def uses_keyframes(offline: bool) -> bool:
+    return ANALYSIS_INPUT == "keyframes" and not offline
+
+
+def get_cached_results(cache_key: str) -> Optional[List[AnalysisResult]]:
+    if result_cache is None:
+        return None
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        return None
+    return [AnalysisResult.model_validate(r) for r in json.loads(cached)]
+
+
+def find_cached_results(content_id: str, offline: bool = False) -> Optional[List[AnalysisResult]]:
+    """Cached results for the video: analyzed with speaker turns, or else without them.
+
+    A video without turns is analyzed without them again on a new request
+    (e.g. a YouTube video already on Gemini has no local copy to take them
+    from), so that result is as good as a new one.
+    """
+    results = get_cached_results(analysis_cache_key(content_id, offline))
+    if results is None and AUDIO_SKELETON:
+        results = get_cached_results(analysis_cache_key(content_id, offline, audio=False))
+    return results
+
+
+def store_cached_results(cache_key: str, results: List[AnalysisResult]):
+    if result_cache is not None:
+        result_cache.set(cache_key, json.dumps([r.model_dump(mode="json") for r in results]))
+
+
+def download_youtube_video(
+    youtube_url: str,
+    output_base: str,
+    analysis_id: str,
+    loop: asyncio.AbstractEventLoop,
+    section: Optional[Tuple[float, Optional[float]]] = None
+) -> str:
+    """Blocking yt-dlp download, run on ``download_executor``; returns the path of the video.
+
+    Progress is applied on ``loop``, where all other state updates happen.
+    """
+    # yt-dlp calls this many times per second; the reporter coalesces the updates
+    reporter = DownloadProgressReporter(
+        lambda fraction: loop.call_soon_threadsafe(handle_progress, fraction, analysis_id),
+        min_step=PROGRESS_MIN_STEP,
+        max_rate=PROGRESS_MAX_RATE
+    )
+    logger.info("Starting YouTube video download...")
+    file_path = youtube_downloader.download(youtube_url, output_base, on_progress=reporter, section=section)
+    metrics.incr("youtube_download_bytes", os.path.getsize(file_path))
+    logger.info("YouTube video download completed")
+    return file_path
+
+
+async def wait_for_active(uploaded_file, size_bytes: Optional[int] = None):
+    """Waits until a Gemini file is ACTIVE, sharing the wait with other jobs on the same file."""
+    logger.info(f"Waiting for Gemini to process {uploaded_file.name}")
     try:
-        # Initialize with processing steps
-        initial_steps = [
-            ProcessingStep(
-                step="upload",
-                status="pending",
-                message="Waiting to start",
-                progress=0.0
-            ),
-            ProcessingStep(
-                step="preprocessing",
-                status="pending",
-                message="Waiting to start",
-                progress=0.0
-            ),
-            ProcessingStep(
-                step="analysis",
-                status="pending",
-                message="Waiting to start",
-                progress=0.0
+        return await file_poller.wait(uploaded_file, size_bytes)
+    except FileProcessingError as e:
+        raise AnalysisError(str(e))
+
+
+async def upload_to_gemini(file_path: str, client_id: str = ""):
+    """Uploads a video to Gemini and waits until the file is ACTIVE."""
+    logger.info("Uploading file to Gemini...")
+    uploaded_file = await gemini_scheduler.call(
+        "upload", lambda: client.aio.files.upload(file=file_path), client_id=client_id
+    )
+    return await wait_for_active(uploaded_file, os.path.getsize(file_path))
+
+
+async def find_registered_file(content_id: Optional[str]):
+    """Returns the still-usable Gemini file registered for this content, if any."""
+    if gemini_file_registry is None or not content_id:
+        return None
+    content_id = gemini_input_id(content_id)
+    name = gemini_file_registry.lookup(content_id)
+    if not name:
+        return None
+    try:
+        file_info = await client.aio.files.get(name=name)
+        state = getattr(file_info, "state", None)
+        if state == "PROCESSING":
+            # Another job uploaded the same content and Gemini is still processing it
+            file_info = await wait_for_active(file_info)
+        elif state != "ACTIVE":
+            raise AnalysisError(f"Registered file is in state {state}")
+    except Exception as e:
+        logger.info(f"Registered Gemini file {name} is no longer usable: {str(e)}")
+        gemini_file_registry.discard(content_id)
+        return None
+    logger.info(f"Reusing Gemini file {name} for {content_id}")
+    return file_info
+
+
+def parse_analysis_response(response_text: str) -> AnalysisResult:
+    """Validates Gemini's JSON response against AnalysisResult in a single pass.
+
+    Truncated or otherwise invalid responses are salvaged section by section;
+    the result is then marked ``partial``.
+    """
+    try:
+        return AnalysisResult.model_validate_json(response_text)
+    except ValidationError as e:
+        logger.warning(f"Gemini response does not match the analysis schema: {e.error_count()} errors")
+        logger.debug(f"Problematic response text: {response_text}")
+    try:
+        result = salvage_analysis(response_text)
+    except ValueError:
+        logger.error("Nothing could be salvaged from the Gemini response")
+        raise AnalysisError("Failed to parse analysis results")
+    metrics.incr("analysis_partial_results")
+    logger.info(f"Salvaged partial analysis, missing: {', '.join(result.missingSections) or 'nothing'}")
+    return result
+
+
+def estimate_tokens(seconds: Optional[float]) -> float:
+    """Rough token cost of one analysis request, used to pace calls against the quota."""
+    return video_tokens(seconds) + len(ANALYSIS_INSTRUCTIONS.text) / 4 + MAX_OUTPUT_TOKENS
+
+
+def video_tokens(seconds: Optional[float]) -> float:
+    return (seconds or DEFAULT_VIDEO_SECONDS) * VIDEO_TOKENS_PER_SECOND
+
+
+def keyframe_tokens(sample: KeyframeSample) -> float:
+    audio = sample.duration * AUDIO_TOKENS_PER_SECOND if sample.soundtrack else 0
+    return len(sample.frames) * IMAGE_TOKENS + audio
+
+
+def used_tokens(response) -> Optional[float]:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+
+def video_part(uploaded_file, segment: Optional[Segment] = None) -> types.Part:
+    """References the uploaded video, or only the segment's window of it."""
+    return types.Part(
+        file_data=types.FileData(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type),
+        video_metadata=types.VideoMetadata(
+            start_offset=f"{segment.start:.0f}s",
+            end_offset=f"{segment.end:.0f}s"
+        ) if segment is not None else None
+    )
+
+
+def keyframe_parts(sample: KeyframeSample) -> List[types.Part]:
+    """Each frame as an inline JPEG after its time, then the soundtrack."""
+    parts = []
+    for frame in sample.frames:
+        parts.append(types.Part.from_text(text=f"{frame.time:.1f}s:"))
+        parts.append(types.Part.from_bytes(data=frame.image, mime_type="image/jpeg"))
+    if sample.soundtrack:
+        parts.append(types.Part.from_bytes(data=sample.soundtrack, mime_type="audio/ogg"))
+    return parts
+
+
+def analysis_prompt(
+    segment: Optional[Segment] = None,
+    skeleton: Optional[AudioSkeleton] = None,
+    keyframes: Optional[KeyframeSample] = None
+) -> str:
+    """The user turn that goes with ANALYSIS_INSTRUCTIONS, with the speaker turns when there are any."""
+    if keyframes is not None:
+        prompt = KEYFRAME_REQUEST.render(
+            duration=format_timestamp(keyframes.duration),
+            count=len(keyframes.frames),
+            soundtrack="the soundtrack of the whole video" if keyframes.soundtrack else "no soundtrack",
+        )
+        turns = skeleton.describe() if skeleton is not None else ""
+    elif segment is None:
+        prompt = ANALYSIS_REQUEST.render()
+        turns = skeleton.describe() if skeleton is not None else ""
+    else:
+        prompt = SEGMENT_REQUEST.render(start=format_timestamp(segment.start), end=format_timestamp(segment.end))
+        # Clip-relative, like the timestamps the segment prompt asks for
+        turns = skeleton.describe(segment.start, segment.end, offset=segment.start) if skeleton is not None else ""
+    if turns:
+        prompt += "\n\n" + AUDIO_TURNS.render(scope="video" if segment is None else "clip", turns=turns)
+    return prompt
+
+
+def instructions_content() -> types.Content:
+    return types.Content(parts=[types.Part(text=ANALYSIS_INSTRUCTIONS.text)])
+
+
+def video_context_key(uploaded_file) -> tuple:
+    return ("video", uploaded_file.name, MODEL_NAME, ANALYSIS_INSTRUCTIONS.signature)
+
+
+async def cached_video_context(uploaded_file, create: bool = False) -> Optional[str]:
+    """The cached content holding the whole video plus the analysis instructions.
+
+    Caching is only worth it when a video is queried more than once, so it is
+    created on request (``create``) and otherwise only reused.
+    """
+    if context_cache is None:
+        return None
+    key = video_context_key(uploaded_file)
+    if not create:
+        return context_cache.peek(key)
+    return await context_cache.get(
+        key,
+        MODEL_NAME,
+        ANALYSIS_INSTRUCTIONS.text,
+        [types.Content(role="user", parts=[video_part(uploaded_file)])],
+        tokens=video_tokens(video_duration(uploaded_file)) + len(ANALYSIS_INSTRUCTIONS.text) / 4,
+    )
+
+
+def batch_request(
+    uploaded_file, segment: Optional[Segment] = None, skeleton: Optional[AudioSkeleton] = None
+) -> dict:
+    """The generate_content request for ``generate_analysis`` as JSON, for batch mode."""
+    content = types.Content(
+        role="user",
+        parts=[video_part(uploaded_file, segment), types.Part(text=analysis_prompt(segment, skeleton))]
+    )
+    generation_config = types.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=ANALYSIS_SCHEMA,
+        max_output_tokens=MAX_OUTPUT_TOKENS
+    )
+    return {
+        "contents": [content.model_dump(mode="json", exclude_none=True)],
+        "system_instruction": instructions_content().model_dump(mode="json", exclude_none=True),
+        "generation_config": generation_config.model_dump(mode="json", exclude_none=True),
+    }
+
+
+async def stream_analysis(
+    contents: list, config: types.GenerateContentConfig, on_event: Callable[[tuple], None]
+):
+    """Streams one generate_content call, passing each completed section to ``on_event``.
+
+    Every attempt starts with a ``("reset",)`` event, so that the sections of
+    an attempt the scheduler retries are dropped. Returns an object with the full ``text`` and ``usage_metadata`` like a
+    non-streamed response.
+    """
+    started = time.monotonic()
+    parser = IncrementalObjectParser()
+    usage = None
+    first_section = True
+    on_event(("reset",))
+    stream = await client.aio.models.generate_content_stream(model=MODEL_NAME, contents=contents, config=config)
+    async for chunk in stream:
+        if getattr(chunk, "usage_metadata", None) is not None:
+            usage = chunk.usage_metadata
+        if not chunk.text:
+            continue
+        for event in parser.feed(chunk.text):
+            if first_section:
+                metrics.observe("analysis_time_to_first_section_seconds", time.monotonic() - started)
+                first_section = False
+            on_event(event)
+    metrics.observe("analysis_stream_seconds", time.monotonic() - started)
+    return SimpleNamespace(text=parser.text, usage_metadata=usage)
+
+
+async def request_analysis(
+    uploaded_file,
+    prompt: str,
+    schema: types.Schema,
+    segment: Optional[Segment],
+    client_id: str,
+    on_event: Optional[Callable[[tuple], None]] = None,
+    cache_video: bool = False,
+    keyframes: Optional[KeyframeSample] = None
+):
+    """Sends one analysis request through the scheduler and returns the raw response.
+
+    The video and instructions come from a cached content when there is one
+    for the whole video (created first with ``cache_video``); otherwise they are
+    sent inline. With ``keyframes`` those are sent instead of the video. With
+    ``on_event`` the response is streamed and sections are reported as they
+    arrive.
+    """
+    if keyframes is not None:
+        cached_content = None
+        contents = [*keyframe_parts(keyframes), prompt]
+        tokens = keyframe_tokens(keyframes) + len(ANALYSIS_INSTRUCTIONS.text) / 4 + MAX_OUTPUT_TOKENS
+    else:
+        cached_content = await cached_video_context(uploaded_file, create=cache_video) if segment is None else None
+        contents = [prompt] if cached_content else [video_part(uploaded_file, segment), prompt]
+        tokens = estimate_tokens(segment.length if segment is not None else video_duration(uploaded_file))
+    config = types.GenerateContentConfig(
+        # Cached contents carry the system instruction themselves
+        system_instruction=None if cached_content else ANALYSIS_INSTRUCTIONS.text,
+        cached_content=cached_content,
+        response_mime_type="application/json",
+        response_schema=schema,
+        max_output_tokens=MAX_OUTPUT_TOKENS
+    )
+    def call():
+        if on_event is not None:
+            return stream_analysis(contents, config, on_event)
+        return client.aio.models.generate_content(model=MODEL_NAME, contents=contents, config=config)
+
+    try:
+        response = await gemini_scheduler.call(
+            "generate_content",
+            call,
+            client_id=client_id,
+            tokens=tokens,
+            used_tokens=used_tokens,
+        )
+    except Exception as e:
+        if not cached_content or getattr(e, "code", None) not in (403, 404):
+            raise
+        # The cached content expired or was deleted behind our back
+        logger.warning(f"Cached content {cached_content} is gone, sending the context inline")
+        context_cache.discard(video_context_key(uploaded_file))
+        return await request_analysis(
+            uploaded_file, prompt, schema, segment, client_id, on_event, keyframes=keyframes
+        )
+
+    cached_tokens = getattr(getattr(response, "usage_metadata", None), "cached_content_token_count", None)
+    if cached_tokens:
+        metrics.incr("gemini_cached_tokens", cached_tokens)
+    return response
+
+
+async def generate_analysis(
+    uploaded_file,
+    segment: Optional[Segment] = None,
+    client_id: str = "",
+    analysis_id: Optional[str] = None,
+    skeleton: Optional[AudioSkeleton] = None,
+    keyframes: Optional[KeyframeSample] = None
+) -> AnalysisResult:
+    """Runs the behavioral analysis prompt against an ACTIVE Gemini file, or against ``keyframes``.
+
+    With a segment only that window of the video is analyzed, and the returned
+    timestamps are relative to the segment start. With an ``analysis_id`` (and
+    STREAM_ANALYSIS) sections are published to that analysis as they arrive.
+    The speaker turns of ``skeleton`` are included in the prompt.
+    """
+    on_event = None
+    if STREAM_ANALYSIS and analysis_id:
+        part = segment.label() if segment is not None else "video"
+        on_event = partial(publish_section, analysis_id, part, track_progress=segment is None, segment=segment)
+
+    logger.info("Generating content with Gemini...")
+    response = await request_analysis(
+        uploaded_file,
+        analysis_prompt(segment, skeleton, keyframes),
+        ANALYSIS_SCHEMA,
+        segment,
+        client_id,
+        on_event,
+        keyframes=keyframes
+    )
+
+    logger.info("Processing Gemini response...")
+    logger.debug(f"Raw Gemini response: {response.text}")
+    result = parse_analysis_response(response.text)
+    if result.partial and CONTINUE_PARTIAL_RESULTS:
+        result = await continue_partial_result(uploaded_file, result, segment, client_id, skeleton, keyframes)
+    return result
+
+
+async def continue_partial_result(
+    uploaded_file,
+    result: AnalysisResult,
+    segment: Optional[Segment] = None,
+    client_id: str = "",
+    skeleton: Optional[AudioSkeleton] = None,
+    keyframes: Optional[KeyframeSample] = None
+) -> AnalysisResult:
+    """Asks Gemini for only the sections missing from a salvaged result and fills them in.
+
+    Much cheaper than repeating the analysis: the output budget goes entirely
+    to the missing sections. On failure the partial result is returned as is.
+    """
+    missing = result.missingSections
+    schema = gemini_schema(AnalysisResult, exclude=set(AnalysisResult.model_fields) - set(missing))
+    prompt = analysis_prompt(segment, skeleton, keyframes) + "\n\n" + CONTINUATION_REQUEST.render(sections=", ".join(missing))
+    metrics.incr("analysis_continuations")
+    logger.info(f"Requesting missing sections: {', '.join(missing)}")
+    try:
+        # The video is being queried a second time, so it is worth caching
+        response = await request_analysis(
+            uploaded_file, prompt, schema, segment, client_id, cache_video=True, keyframes=keyframes
+        )
+        recovered = validate_sections(salvage_json_object(response.text or ""))
+    except Exception as e:
+        logger.warning(f"Continuation request failed, keeping partial result: {str(e)}")
+        return result
+
+    recovered = {name: value for name, value in recovered.items() if name in missing}
+    metrics.incr("analysis_sections_recovered", len(recovered))
+    if not recovered:
+        return result
+    sections = {name: getattr(result, name) for name in analysis_sections() if name not in missing}
+    sections.update(recovered)
+    completed = build_partial_result(sections)
+    completed.timestamp = result.timestamp
+    return completed
+
+
+def follow_up_context(analysis: VideoAnalysis) -> str:
+    """The stored analysis as compact JSON; for segmented videos, the merged summary."""
+    return analysis.results[0].model_dump_json(exclude=ANALYSIS_SERVER_FIELDS, exclude_none=True)
+
+
+def follow_up_cache_key(content_id: str, context: str, question: str) -> str:
+    # Questions that only differ in case or spacing get the same answer
+    normalized = " ".join(question.lower().split())
+    return make_cache_key(
+        "follow-up",
+        gemini_input_id(content_id),
+        MODEL_NAME,
+        FOLLOW_UP_REQUEST.signature,
+        context,
+        normalized
+    )
+
+
+async def answer_follow_up(
+    uploaded_file, context: str, question: str, cache_key: str, client_id: str = ""
+) -> FollowUpAnswer:
+    """Answers a question about an analyzed video in one call and caches the answer."""
+    started = time.monotonic()
+    prompt = FOLLOW_UP_REQUEST.render(analysis=context, question=question)
+    # A video that gets questions is queried repeatedly, so it is worth caching on Gemini
+    response = await request_analysis(uploaded_file, prompt, FOLLOW_UP_SCHEMA, None, client_id, cache_video=True)
+    try:
+        answer = FollowUpAnswer.model_validate_json(response.text)
+    except ValidationError:
+        logger.error(f"Could not parse follow-up answer: {response.text}")
+        raise AnalysisError("Failed to parse the answer")
+    metrics.observe("follow_up_seconds", time.monotonic() - started)
+    if answer_cache is not None:
+        answer_cache.set(cache_key, answer.model_dump_json())
+    return answer
+
+
+async def triage_video(uploaded_file, duration: Optional[float], client_id: str = "") -> Optional[TriageResult]:
+    """Screens the video with TRIAGE_MODEL at low media resolution.
+
+    Returns None when triage fails, in which case the video gets the full analysis.
+    """
+    config = types.GenerateContentConfig(
+        system_instruction=TRIAGE_INSTRUCTIONS.text,
+        response_mime_type="application/json",
+        response_schema=TRIAGE_SCHEMA,
+        max_output_tokens=TRIAGE_MAX_OUTPUT_TOKENS,
+        media_resolution=types.MediaResolution.MEDIA_RESOLUTION_LOW
+    )
+    contents = [video_part(uploaded_file), TRIAGE_REQUEST.render()]
+    started = time.monotonic()
+    try:
+        response = await gemini_scheduler.call(
+            "triage",
+            lambda: client.aio.models.generate_content(model=TRIAGE_MODEL, contents=contents, config=config),
+            client_id=client_id,
+            tokens=(duration or DEFAULT_VIDEO_SECONDS) * TRIAGE_TOKENS_PER_SECOND + TRIAGE_MAX_OUTPUT_TOKENS,
+            used_tokens=used_tokens,
+        )
+        triage = TriageResult.model_validate_json(response.text)
+    except Exception as e:
+        metrics.incr("triage_failures")
+        logger.warning(f"Triage failed, running the full analysis: {str(e)}")
+        return None
+    metrics.observe("triage_seconds", time.monotonic() - started)
+    metrics.incr("triage_tokens", used_tokens(response) or 0)
+    logger.info(
+        f"Triage: {'analyze' if triage.analyze else 'skip'} ({triage.reason}), {len(triage.windows)} windows flagged"
+    )
+    return triage
+
+
+def record_avoided_work(seconds: float, segments: int = 0):
+    """Counts video the full model did not have to look at thanks to triage."""
+    metrics.incr("triage_full_seconds_avoided", seconds)
+    metrics.incr("triage_full_tokens_avoided", seconds * VIDEO_TOKENS_PER_SECOND)
+    if segments:
+        metrics.incr("triage_segments_skipped", segments)
+
+
+async def get_video_duration(uploaded_file, file_path: Optional[str]) -> Optional[float]:
+    """Reads the duration from Gemini's file metadata, falling back to probing the local file."""
+    duration = video_duration(uploaded_file)
+    if duration:
+        return duration
+    if file_path and os.path.exists(file_path):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(preprocess_executor, probe_duration, file_path)
+    return None
+
+
+def combine_segment_results(segments: List[Segment], outcomes: list) -> List[AnalysisResult]:
+    """Merges localized segment results (or the exceptions they failed with).
+
+    Returns a merged summary for the whole video followed by one result per
+    segment, all with absolute timestamps.
+    """
+    succeeded = [(s, r) for s, r in zip(segments, outcomes) if not isinstance(r, BaseException)]
+    for segment, outcome in zip(segments, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"Segment {segment.label()} failed: {str(outcome)}")
+    if not succeeded:
+        raise AnalysisError(f"All {len(segments)} segments failed to analyze")
+
+    done_segments = [s for s, _ in succeeded]
+    segment_results = [r for _, r in succeeded]
+    return [merge_results(segment_results, done_segments)] + segment_results
+
+
+async def analyze_segments(
+    analysis_id: str,
+    uploaded_file,
+    segments: List[Segment],
+    client_id: str = "",
+    skeleton: Optional[AudioSkeleton] = None
+) -> List[AnalysisResult]:
+    """Analyzes overlapping windows of a long video concurrently."""
+    logger.info(f"Analyzing {segments[-1].end:.0f}s video in {len(segments)} segments")
+    semaphore = asyncio.Semaphore(SEGMENT_CONCURRENCY)
+    finished = 0
+
+    async def analyze(segment: Segment) -> AnalysisResult:
+        nonlocal finished
+        async with semaphore:
+            result = await generate_analysis(uploaded_file, segment, client_id, analysis_id, skeleton)
+        finished += 1
+        update_progress(
+            analysis_id,
+            progress=0.7 + 0.25 * finished / len(segments),
+            message=f"Analyzed {finished}/{len(segments)} segments"
+        )
+        return localize_result(result, segment)
+
+    outcomes = await asyncio.gather(*(analyze(s) for s in segments), return_exceptions=True)
+    return combine_segment_results(segments, outcomes)
+
+
+def queue_offline_analysis(
+    job: AnalysisJob, uploaded_file, segments: Optional[List[Segment]], skeleton: Optional[AudioSkeleton] = None
+):
+    """Hands the analysis requests to the offline batcher; a task completes the job later."""
+    entries = [
+        BatchEntry(key=f"{job.analysis_id}:{index}", request=batch_request(uploaded_file, segment, skeleton))
+        for index, segment in enumerate(segments or [None])
+    ]
+    offline_store.save(OfflineAnalysis(
+        id=job.analysis_id,
+        state=AnalysisState(status="queued", progress=0.75, message="", timestamp=datetime.now()),
+        keys=[entry.key for entry in entries],
+        requests={entry.key: entry.request for entry in entries},
+        segments=[
+            OfflineSegment(
+                index=s.index,
+                start=s.start,
+                end=s.end,
+                owned_start=s.owned_start if s.owned_start > float("-inf") else None,
+                owned_end=s.owned_end if s.owned_end < float("inf") else None,
             )
-        ]
-
-        analysis_states[analysis_id] = VideoAnalysis(
-            id=analysis_id,
-            state=AnalysisState(
-                status="uploading",
-                progress=0.0,
-                message="Starting upload",
-                timestamp=datetime.now(),
-                steps=initial_steps
+            for s in segments
+        ] if segments is not None else None,
+        followers=in_flight_jobs.followers(job.analysis_id),
+        content_id=job.content_id,
+        cache_key=job.cache_key,
+        section=job.section,
+        audio_analyzed=job.audio_analyzed,
+        worker=os.getpid(),
+    ))
+    futures = offline_batcher.add(entries)
+    update_analysis(job.analysis_id, status="processing", progress=0.75, message="Waiting for offline batch")
+    start_offline_completion(job, segments, futures)
+
+
+def start_offline_completion(job: AnalysisJob, segments: Optional[List[Segment]], futures: list):
+    task = asyncio.create_task(complete_offline_analysis(job, segments, futures))
+    offline_completions.add(task)
+    task.add_done_callback(offline_completions.discard)
+
+
+def resume_offline_analyses() -> int:
+    """Picks up the offline analyses that a stopped process was waiting for; returns their count.
+
+    Batches already submitted are polled again, once each however many
+    analyses they hold; requests that were still waiting for a batch are
+    queued again. Records of processes still running are left to them.
+    """
+    records = []
+    for status in ("queued", "submitted"):
+        for record in offline_store.find(status):
+            if record.worker != os.getpid() and process_alive(record.worker):
+                continue
+            record.worker = os.getpid()
+            offline_store.save(record)
+            records.append(record)
+    if not records:
+        return 0
+
+    batches: Dict[str, List[str]] = {}
+    for record in records:
+        for name, keys in record.batches.items():
+            batches.setdefault(name, []).extend(keys)
+    futures = {}
+    for name, keys in batches.items():
+        futures.update(zip(keys, offline_batcher.resume(name, keys)))
+    entries = [BatchEntry(key, request) for record in records for key, request in record.requests.items()]
+    if entries:
+        futures.update(zip((entry.key for entry in entries), offline_batcher.add(entries)))
+
+    for record in records:
+        job = AnalysisJob(
+            analysis_id=record.id,
+            content_id=record.content_id,
+            cache_key=record.cache_key,
+            offline=True,
+            section=record.section,
+            audio_analyzed=record.audio_analyzed,
+        )
+        segments = [
+            Segment(
+                s.index,
+                s.start,
+                s.end,
+                s.owned_start if s.owned_start is not None else float("-inf"),
+                s.owned_end if s.owned_end is not None else float("inf"),
             )
+            for s in record.segments
+        ] if record.segments is not None else None
+        # Analyses that followed this one before the restart get its result again
+        if job.cache_key and in_flight_jobs.attach(job) is None:
+            for follower_id in record.followers:
+                in_flight_jobs.attach(AnalysisJob(analysis_id=follower_id, cache_key=job.cache_key))
+        start_offline_completion(job, segments, [futures[key] for key in record.keys])
+    metrics.incr("offline_analyses_resumed", len(records))
+    logger.info(f"Resumed {len(records)} offline analyses in {len(batches)} batches")
+    return len(records)
+
+
+async def complete_offline_analysis(job: AnalysisJob, segments: Optional[List[Segment]], futures: list):
+    try:
+        outcomes = await asyncio.gather(*futures)
+        parsed = []
+        for outcome in outcomes:
+            try:
+                if outcome.error:
+                    raise AnalysisError(outcome.error)
+                parsed.append(parse_analysis_response(outcome.text))
+            except AnalysisError as e:
+                parsed.append(e)
+        if segments is None:
+            if isinstance(parsed[0], BaseException):
+                raise parsed[0]
+            results = parsed
+        else:
+            localized = [
+                r if isinstance(r, BaseException) else localize_result(r, s) for r, s in zip(parsed, segments)
+            ]
+            results = combine_segment_results(segments, localized)
+        finish_analysis(job, results)
+    except Exception as e:
+        logger.error(f"Offline analysis {job.analysis_id} failed: {str(e)}")
+        update_analysis(job.analysis_id, status="error", progress=0, message=str(e))
+    # Kept when the task is cancelled at shutdown, for the next run to resume
+    offline_store.delete(job.analysis_id)
+
+
+def finish_analysis(job: AnalysisJob, results: List[AnalysisResult], cache: bool = True):
+    """Completes the job's analysis with ``results``, storing them in the result cache unless ``cache`` is False."""
+    if job.section is not None:
+        # The model saw only the clip; report its timestamps in the time of the whole video
+        clip = Segment(0, job.section[0], job.section[1] or float("inf"), float("-inf"), float("inf"))
+        results = [localize_result(result, clip) for result in results]
+    # Update the analysis state to complete and store the result
+    if job.cache_key and cache:
+        cache_key = job.cache_key
+        if AUDIO_SKELETON and not job.audio_analyzed:
+            # Stored under what actually ran, not what the request asked for
+            cache_key = analysis_cache_key(job.content_id, job.offline, audio=False)
+        store_cached_results(cache_key, results)
+    update_analysis(
+        job.analysis_id,
+        status="complete",
+        progress=1.0,
+        message="Analysis complete",
+        results=results,
+        content_id=job.content_id
+    )
+    logger.info("Analysis completed successfully")
+
+
+def start_audio_analysis(job: AnalysisJob):
+    """Starts extracting speaker turns from the local copy of the video, alongside the upload."""
+    if not AUDIO_SKELETON or job.audio is not None or not job.file_path or not os.path.exists(job.file_path):
+        return
+    loop = asyncio.get_running_loop()
+    job.audio = loop.run_in_executor(audio_executor, analyze_audio, job.file_path, AUDIO_SETTINGS)
+
+
+async def audio_skeleton(job: AnalysisJob) -> Optional[AudioSkeleton]:
+    """Waits for the job's speaker turns; None when there are none or extraction failed."""
+    if job.audio is None:
+        return None
+    started = time.monotonic()
+    try:
+        skeleton = await job.audio
+    except Exception as e:
+        metrics.incr("audio_failures")
+        logger.warning(f"Audio analysis failed, analyzing without speaker turns: {str(e)}")
+        return None
+    job.audio_analyzed = True
+    metrics.observe("audio_wait_seconds", time.monotonic() - started)
+    if skeleton is None or not skeleton.turns:
+        return None
+    metrics.incr("audio_turns", len(skeleton.turns))
+    metrics.incr("audio_exchanges", len(skeleton.exchanges))
+    return skeleton
+
+
+def drop_silent_segments(segments: List[Segment], skeleton: AudioSkeleton) -> List[Segment]:
+    """Keeps the segments with at least AUDIO_MIN_SPEECH_FRACTION of speech (all of them if none has)."""
+    voiced = [
+        s for s in segments if skeleton.speech_between(s.start, s.end) >= AUDIO_MIN_SPEECH_FRACTION * s.length
+    ]
+    if not voiced or len(voiced) == len(segments):
+        return segments
+    skipped = [s for s in segments if s not in voiced]
+    metrics.incr("audio_segments_skipped", len(skipped))
+    metrics.incr("audio_seconds_skipped", sum(s.length for s in skipped))
+    logger.info(f"Skipping {len(skipped)} of {len(segments)} segments without speech")
+    return voiced
+
+
+async def preprocess_video(job: AnalysisJob, file_path: str) -> str:
+    """Transcodes the video with TRANSCODE_SETTINGS and returns the path to upload.
+
+    Falls back to the original file when ffmpeg fails or does not make it smaller.
+    """
+    output_path = f"{os.path.splitext(file_path)[0]}_preprocessed.mp4"
+    loop = asyncio.get_running_loop()
+    try:
+        stats = await loop.run_in_executor(
+            preprocess_executor, transcode_video, file_path, output_path, TRANSCODE_SETTINGS
         )
+    except Exception as e:
+        logger.warning(f"Preprocessing failed, uploading the original video: {str(e)}")
+        metrics.incr("preprocess_failures")
+        return file_path
 
-        # Mark the upload step as in progress
-        analysis_states[analysis_id].state.steps[0].status = "in_progress"
+    metrics.observe("preprocess_seconds", stats.seconds)
+    if stats.output_bytes >= stats.input_bytes:
+        logger.info("Preprocessed video is not smaller, uploading the original")
+        return file_path
+    metrics.incr("preprocess_bytes_saved", stats.input_bytes - stats.output_bytes)
+    return output_path
 
-        # Validate input: either a file or YouTube URL must be provided
-        if not file and not youtube_url:
-            raise HTTPException(
-                status_code=400,
-                detail="Either file or youtube_url must be provided"
-            )
 
-        # Handle YouTube URL input
-        if youtube_url:
+async def allocate_workspace(
+    job: AnalysisJob, expected_bytes: Optional[int], timeout: float = WORKSPACE_WAIT_TIMEOUT
+):
+    """Gives the job its scratch directory, waiting up to ``timeout`` seconds while the workspace is full."""
+    try:
+        job.workspace = await workspace.allocate(
+            job.analysis_id, expected_bytes, WORKSPACE_DEFAULT_VIDEO_BYTES, timeout=timeout
+        )
+    except WorkspaceFullError as e:
+        logger.error(f"No workspace for {job.analysis_id}: {str(e)}")
+        raise AnalysisError(str(e))
+
+
+def release_workspace(job: AnalysisJob):
+    """Deletes the job's scratch directory with the video and everything derived from it."""
+    if job.workspace is not None:
+        logger.info(f"Cleaning up {job.workspace.path}")
+        workspace.release(job.workspace)
+        job.workspace = None
+
+
+async def fetch_video(job: AnalysisJob) -> str:
+    """Downloads the job's YouTube video, if it is one, and returns the path of the local copy."""
+    analysis_id = job.analysis_id
+    file_path = job.file_path
+    # Handle YouTube URL input
+    if job.youtube_url:
+        loop = asyncio.get_running_loop()
+        if job.workspace is None:
             try:
-                logger.info(f"Processing YouTube URL: {youtube_url}")
-                analysis_states[analysis_id].state = AnalysisState(
-                    status="processing",
-                    progress=0.1,
-                    message="Downloading YouTube video...",
-                    timestamp=datetime.now(),
-                    steps=initial_steps
+                expected_bytes = await loop.run_in_executor(
+                    download_executor, youtube_downloader.expected_size, job.youtube_url, job.section
                 )
-                file_path = f"temp/youtube_{analysis_id}.mp4"
-                ydl_opts = {
-                    'format': 'best[ext=mp4]',
-                    'outtmpl': file_path,
-                    'progress_hooks': [lambda d: handle_progress(d, analysis_id)],
-                }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    logger.info("Starting YouTube video download...")
-                    ydl.download([youtube_url])
-                    logger.info("YouTube video download completed")
             except Exception as e:
-                logger.error(f"YouTube download error: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Error processing YouTube video: {str(e)}")
-        else:
-            # Handle direct file upload
-            file_path = f"temp/{file.filename}"
-            logger.info(f"Saving uploaded file: {file.filename}")
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-                logger.info("File upload completed")
-
-        # Update state to processing
-        analysis_states[analysis_id].state = AnalysisState(
-            status="processing",
-            progress=0.4,
-            message="Processing video...",
-            timestamp=datetime.now(),
-            steps=initial_steps
-        )
-
-        # Process the video file with Gemini
+                # The download reports the actual problem
+                logger.warning(f"Could not estimate the download size: {str(e)}")
+                expected_bytes = None
+            await allocate_workspace(job, expected_bytes)
         try:
-            logger.info("Starting Gemini analysis process...")
-            with open(file_path, 'rb') as video_file:
-                logger.info("Uploading file to Gemini...")
-                uploaded_file = client.files.upload(file=file_path)
-                # Wait for Gemini to process the file (up to 30 attempts)
-                for attempt in range(30):
-                    logger.info(f"Checking file status - attempt {attempt + 1}/30")
-                    file_info = client.files.get(name=uploaded_file.name)
-                    if getattr(file_info, "state", None) == "ACTIVE":
-                        logger.info("File successfully processed by Gemini")
-                        uploaded_file = file_info
-                        break
-                    elif getattr(file_info, "state", None) == "FAILED":
-                        logger.error("File processing failed in Gemini")
-                        raise HTTPException(status_code=500, detail="File processing failed")
-                    
-                    logger.info(f"File still processing, waiting... (State: {getattr(file_info, 'state', 'UNKNOWN')})")
-                    time.sleep(2)
-                else:
-                    logger.error("File processing timeout in Gemini")
-                    raise HTTPException(status_code=500, detail="File processing timeout")
+            logger.info(f"Processing YouTube URL: {job.youtube_url}")
+            update_analysis(analysis_id, status="processing", progress=0.1, message="Downloading YouTube video...")
+            output_base = job.workspace.file("youtube")
+            job.file_path = file_path = await loop.run_in_executor(
+                download_executor, download_youtube_video, job.youtube_url, output_base, analysis_id, loop, job.section
+            )
+            workspace.resize(job.workspace, os.path.getsize(file_path))
         except Exception as e:
-            logger.error(f"Error during Gemini file processing: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+            logger.error(f"YouTube download error: {str(e)}")
+            raise AnalysisError(f"Error processing YouTube video: {str(e)}")
+    return file_path
 
-        # Update state to indicate analysis is in progress
-        analysis_states[analysis_id].state = AnalysisState(
-            status="processing",
-            progress=0.7,
-            message="Analyzing video content",
-            timestamp=datetime.now(),
-            steps=initial_steps
-        )
 
-        # Upgraded Gemini prompt requesting a full analysis structure including question impacts
-        prompt = (
-            "Perform a comprehensive behavioral analysis of the provided video segment of a political speaker. "
-            "Provide your analysis in JSON format with the following structure:\n\n"
-            "{\n"
-            "  'facialExpression': { 'emotion': <string>, 'confidence': <number 0-1>, 'description': <detailed description>, 'intensity': <number, optional>, 'context': <string, optional>, 'timeMarkers': [<timestamp strings>, ...], 'truthfulnessScore': <number, optional> },\n"
-            "  'bodyPosture': { 'emotion': <string>, 'confidence': <number 0-1>, 'description': <detailed description>, 'intensity': <number, optional>, 'context': <string, optional>, 'timeMarkers': [<timestamp strings>, ...], 'truthfulnessScore': <number, optional> },\n"
-            "  'handGestures': { 'emotion': <string>, 'confidence': <number 0-1>, 'description': <detailed description>, 'intensity': <number, optional>, 'context': <string, optional>, 'timeMarkers': [<timestamp strings>, ...], 'truthfulnessScore': <number, optional> },\n"
-            "  'overallEmotion': <string>,\n"
-            "  'confidenceScore': <number 0-1>,\n"
-            "  'analysis': <comprehensive analysis summary>,\n"
-            "  'deceptionIndicators': [ { 'type': <string>, 'description': <string>, 'confidence': <number>, 'timestamp': <number> }, ... ],\n"
-            "  'confidenceMetrics': [ { 'level': <number>, 'description': <string>, 'context': <string>, 'timestamp': <number> }, ... ],\n"
-            "  'keyStrengths': [ { 'title': <string>, 'description': <string>, 'confidence': <number> }, ... ],\n"
-            "  'areasOfNote': [ { 'title': <string>, 'description': <string>, 'significance': <string> }, ... ],\n"
-            "  'questionResponse': { 'responseStyle': <string>, 'topicHandling': <string>, 'behavioralPatterns': [<string>, ...] },\n"
-            "  'timeline': [ { 'timestamp': <number>, 'description': <string> }, ... ],\n"
-            "  'questionImpacts': [ { 'question': <string>, 'timestamp': <number>, 'moodChange': <string>, 'analysis': <string>, 'confidence': <number> }, ... ]\n"
-            "}\n\n"
-            "In addition, identify any specific question during the interview that triggered a significant change in the speaker's mood. "
-            "For each such question, indicate the question (or a description of it), the timestamp, whether it made the speaker nervous or confident, and provide a brief analysis with a confidence score."
-        )
+async def prepare_gemini_file(job: AnalysisJob):
+    """Downloads the video if needed, uploads it to Gemini and registers the file."""
+    analysis_id = job.analysis_id
+    file_path = await fetch_video(job)
+    start_audio_analysis(job)
+    if PREPROCESS_VIDEO:
+        update_analysis(analysis_id, status="processing", progress=0.32, message="Optimizing video for analysis...")
+        file_path = await preprocess_video(job, file_path)
 
-        logger.info("Generating content with Gemini...")
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[uploaded_file, prompt],
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                max_output_tokens=2000
-            )
-        )
+    # Update state to processing
+    update_analysis(analysis_id, status="processing", progress=0.4, message="Processing video...")
 
-        logger.info("Processing Gemini response...")
-        logger.debug(f"Raw Gemini response: {response.text}")
+    # Process the video file with Gemini
+    try:
+        logger.info("Starting Gemini analysis process...")
+        metrics.incr("gemini_upload_bytes", os.path.getsize(file_path))
+        uploaded_file = await upload_to_gemini(file_path, job.client_id)
+    except Exception as e:
+        logger.error(f"Error during Gemini file processing: {str(e)}")
+        raise AnalysisError(str(e))
 
-        # Parse the Gemini response and construct the AnalysisResult
-        try:
-            data = json.loads(response.text)
-            # If Gemini returns a list, take the first element.
-            if isinstance(data, list):
-                data = data[0]
-
-            facial = data.get('facialExpression', {})
-            body = data.get('bodyPosture', {})
-            hand = data.get('handGestures', {})
-            overall = {
-                "emotion": data.get('overallEmotion', 'Unknown'),
-                "confidence": data.get('confidenceScore', 0.0),
-                "description": data.get('analysis', '')
-            }
-            deception_indicators = data.get('deceptionIndicators', [])
-            confidence_metrics = data.get('confidenceMetrics', [])
-            key_strengths = data.get('keyStrengths', [])
-            areas_of_note = data.get('areasOfNote', [])
-            question_response = data.get('questionResponse', {})
-            timeline = data.get('timeline', [])
-            question_impacts = data.get('questionImpacts', [])
-
-            result = AnalysisResult(
-                timestamp=0.0,
-                facialExpression=AnalysisDetail(
-                    emotion=facial.get('emotion', 'Unknown'),
-                    confidence=float(facial.get('confidence', 0.0)),
-                    description=facial.get('description', ''),
-                    intensity=facial.get('intensity'),
-                    context=facial.get('context'),
-                    timeMarkers=facial.get('timeMarkers'),
-                    truthfulnessScore=facial.get('truthfulnessScore')
-                ),
-                bodyPosture=AnalysisDetail(
-                    emotion=body.get('emotion', 'Unknown'),
-                    confidence=float(body.get('confidence', 0.0)),
-                    description=body.get('description', ''),
-                    intensity=body.get('intensity'),
-                    context=body.get('context'),
-                    timeMarkers=body.get('timeMarkers'),
-                    truthfulnessScore=body.get('truthfulnessScore')
-                ),
-                handGestures=AnalysisDetail(
-                    emotion=hand.get('emotion', 'Unknown'),
-                    confidence=float(hand.get('confidence', 0.0)),
-                    description=hand.get('description', ''),
-                    intensity=hand.get('intensity'),
-                    context=hand.get('context'),
-                    timeMarkers=hand.get('timeMarkers'),
-                    truthfulnessScore=hand.get('truthfulnessScore')
-                ),
-                overallEmotion=overall.get('emotion', 'Unknown'),
-                confidenceScore=float(overall.get('confidence', 0.0)),
-                analysis=overall.get('description', ''),
-                deceptionIndicators=[DeceptionIndicator(**d) for d in deception_indicators],
-                confidenceMetrics=[ConfidenceMetric(**c) for c in confidence_metrics],
-                keyStrengths=[KeyStrength(**k) for k in key_strengths],
-                areasOfNote=[AreaOfNote(**a) for a in areas_of_note],
-                questionResponse=QuestionResponse(**question_response),
-                timeline=[TimelineEvent(**t) for t in timeline],
-                questionImpacts=[QuestionImpact(**q) for q in question_impacts]
-            )
+    if gemini_file_registry is not None and job.content_id:
+        gemini_file_registry.register(gemini_input_id(job.content_id), uploaded_file)
+    return uploaded_file
 
-            # Update the analysis state to complete and store the result
-            analysis_states[analysis_id].results = [result]
-            analysis_states[analysis_id].state = AnalysisState(
-                status="complete",
-                progress=1.0,
-                message="Analysis complete",
-                timestamp=datetime.now(),
-                steps=initial_steps
-            )
-            logger.info("Analysis completed successfully")
-            return analysis_states[analysis_id]
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing Gemini response: {e}")
-            logger.debug(f"Problematic response text: {response.text}")
-            raise HTTPException(status_code=500, detail="Failed to parse analysis results")
-        except Exception as e:
-            logger.error(f"Error processing analysis: {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to process analysis results")
+async def analyze_keyframes(job: AnalysisJob) -> AnalysisResult:
+    """Analyzes the whole video from keyframes selected locally, without uploading it."""
+    file_path = await fetch_video(job)
+    start_audio_analysis(job)
+    update_analysis(job.analysis_id, status="processing", progress=0.4, message="Selecting keyframes...")
+    loop = asyncio.get_running_loop()
+    try:
+        sample = await loop.run_in_executor(preprocess_executor, sample_keyframes, file_path, KEYFRAME_SETTINGS)
+    except Exception as e:
+        logger.error(f"Keyframe extraction failed: {str(e)}")
+        raise AnalysisError(f"Could not extract keyframes: {str(e)}")
+    metrics.observe("keyframe_seconds", sample.seconds)
+    metrics.incr("keyframes_sent", len(sample.frames))
+    metrics.incr("keyframe_bytes_sent", sample.size)
+    metrics.incr("keyframe_bytes_saved", max(os.path.getsize(file_path) - sample.size, 0))
+
+    skeleton = await audio_skeleton(job)
+    update_analysis(job.analysis_id, status="processing", progress=0.7, message="Analyzing video content")
+    return await generate_analysis(
+        None, client_id=job.client_id, analysis_id=job.analysis_id, skeleton=skeleton, keyframes=sample
+    )
+
+
+async def run_analysis_pipeline(job: AnalysisJob):
+    """Runs the download, Gemini upload and analysis stages for a queued job."""
+    analysis_id = job.analysis_id
+    if job.section is not None:
+        # Streamed sections are shown in the time of the whole video, like the results
+        previews.set_offset(analysis_id, job.section[0])
+    try:
+        if uses_keyframes(job.offline):
+            finish_analysis(job, [await analyze_keyframes(job)])
+            return
+
+        uploaded_file = await find_registered_file(job.content_id)
+        if uploaded_file is None:
+            uploaded_file = await prepare_gemini_file(job)
+        elif job.youtube_url:
+            logger.info("Skipping YouTube download, video is already on Gemini")
+        else:
+            # The upload is still on disk even though Gemini already has it
+            start_audio_analysis(job)
+
+        # Update state to indicate analysis is in progress
+        update_analysis(analysis_id, status="processing", progress=0.7, message="Analyzing video content")
+
+        duration = None
+        if SEGMENT_VIDEOS or TRIAGE_VIDEOS:
+            duration = await get_video_duration(uploaded_file, job.file_path)
+        segments = None
+        if SEGMENT_VIDEOS and duration and duration > SEGMENT_MIN_DURATION:
+            segments = plan_segments(duration, SEGMENT_LENGTH, SEGMENT_OVERLAP)
+
+        triage = await triage_video(uploaded_file, duration, job.client_id) if TRIAGE_VIDEOS else None
+        if triage is not None and not triage.analyze:
+            metrics.incr("triage_videos_skipped")
+            record_avoided_work(duration or DEFAULT_VIDEO_SECONDS)
+            # Not cached: the placeholder is not an analysis, a later request gets triaged again
+            finish_analysis(
+                job, [build_partial_result({"analysis": f"Not analyzed in full: {triage.reason}"})], cache=False
+            )
+            return
+        if triage is not None and segments:
+            selected = select_segments(segments, triage, TRIAGE_MIN_INTEREST, TRIAGE_MAX_SEGMENTS)
+            skipped = [s for s in segments if s not in selected]
+            record_avoided_work(sum(s.length for s in skipped), len(skipped))
+            logger.info(f"Triage kept {len(selected)} of {len(segments)} segments")
+            segments = selected
+
+        skeleton = await audio_skeleton(job)
+        if skeleton is not None and segments:
+            segments = drop_silent_segments(segments, skeleton)
+
+        if job.offline:
+            # The worker is free again as soon as the requests are handed over
+            queue_offline_analysis(job, uploaded_file, segments, skeleton)
+        elif segments:
+            finish_analysis(
+                job, await analyze_segments(analysis_id, uploaded_file, segments, job.client_id, skeleton)
+            )
+        else:
+            result = await generate_analysis(
+                uploaded_file, client_id=job.client_id, analysis_id=analysis_id, skeleton=skeleton
+            )
+            finish_analysis(job, [result])
 
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
-        if analysis_id in analysis_states:
-            analysis_states[analysis_id].state = AnalysisState(
-                status="error",
-                progress=0,
-                message=str(e),
-                timestamp=datetime.now(),
-                steps=analysis_states[analysis_id].state.steps
-            )
-        raise HTTPException(status_code=500, detail=str(e))
+        update_analysis(analysis_id, status="error", progress=0, message=str(e))
     finally:
-        # Cleanup the temporary file if it exists
-        if 'file_path' in locals() and os.path.exists(file_path):
-            logger.info(f"Cleaning up temporary file: {file_path}")
-            os.remove(file_path)
+        if job.audio is not None and not job.audio.done():
+            # The pipeline failed before it needed the speaker turns
+            job.audio.cancel()
+        release_workspace(job)
+
+
+job_queue = JobQueue(
+    run_analysis_pipeline,
+    workers=ANALYSIS_WORKERS,
+    max_pending=ANALYSIS_QUEUE_SIZE,
+    max_batch_pending=BATCH_QUEUE_SIZE
+)
+
+
+async def feed_batch(jobs: List[AnalysisJob]):
+    """Hands a batch's jobs to the queue's batch lane, waiting whenever it is full.
+
+    The workers run download, upload and analysis per job, so while some of
+    them wait on yt-dlp others are busy with Gemini and the stages overlap.
+    """
+    for job in jobs:
+        await job_queue.put(job)
+
+
+def refresh_batch(record: BatchAnalysis) -> BatchAnalysis:
+    """Updates a batch's items and aggregate progress from their analyses."""
+    for item in record.items:
+        analysis = analysis_store.get(item.analysis_id)
+        if analysis is None:
+            item.status, item.progress, item.message = "error", 1.0, "Analysis expired"
+            continue
+        item.status = analysis.state.status
+        item.progress = 1.0 if item.status in ("complete", "error") else analysis.state.progress
+        item.message = analysis.state.message
+
+    total = len(record.items)
+    record.completed = sum(1 for item in record.items if item.status == "complete")
+    record.failed = sum(1 for item in record.items if item.status == "error")
+    if record.completed + record.failed < total:
+        status = "processing"
+    else:
+        status = "complete" if record.completed else "error"
+    changed = status != record.state.status
+    record.state = AnalysisState(
+        status=status,
+        progress=sum(item.progress for item in record.items) / total if total else 1.0,
+        message=f"{record.completed} of {total} complete, {record.failed} failed",
+        timestamp=datetime.now() if changed else record.state.timestamp
+    )
+    if changed:
+        batch_store.save(record)
+    return record
+
+# ==============================
+# Endpoints
+# ==============================
+
+@app.post("/analyze/upload", response_model=VideoAnalysis, status_code=202)
+async def analyze_uploaded_video(
+    request: Request,
+    response: Response,
+    file: Optional[UploadFile] = None,
+    youtube_url: Optional[str] = Form(None),
+    offline: bool = Form(False),
+    clip_start: Optional[float] = Form(None),
+    clip_end: Optional[float] = Form(None)
+):
+    # Validate input: either a file or YouTube URL must be provided
+    if not file and not youtube_url:
+        raise HTTPException(
+            status_code=400,
+            detail="Either file or youtube_url must be provided"
+        )
+    # Only that part of a YouTube video is downloaded and analyzed
+    section = None
+    if clip_start is not None or clip_end is not None:
+        if not youtube_url:
+            raise HTTPException(status_code=400, detail="clip_start and clip_end apply to youtube_url only")
+        start = clip_start or 0.0
+        if start < 0 or (clip_end is not None and clip_end <= start):
+            raise HTTPException(status_code=400, detail="clip_end must be after clip_start, and both positive")
+        section = (start, clip_end)
+
+    # Random IDs stay unique across concurrent requests and uvicorn workers
+    analysis_id = f"analysis_{uuid.uuid4().hex}"
+    initial_steps = create_analysis_record(analysis_id)
+
+    job = AnalysisJob(
+        analysis_id=analysis_id,
+        youtube_url=youtube_url,
+        client_id=request.client.host if request.client else "",
+        offline=offline,
+        section=section
+    )
+    try:
+        if youtube_url:
+            job.content_id = youtube_content_id(youtube_url, section)
+        else:
+            # Handle direct file upload; the job picks the file up from its directory
+            content_length = request.headers.get("content-length")
+            expected_bytes = int(content_length) if content_length and content_length.isdigit() else None
+            # The client waits for the response, so there is no waiting for room
+            await allocate_workspace(job, expected_bytes, timeout=0)
+            job.file_path = job.workspace.file(file.filename)
+            logger.info(f"Saving uploaded file: {file.filename}")
+            content_hash = await save_upload(file, job.file_path)
+            workspace.resize(job.workspace, os.path.getsize(job.file_path))
+            job.content_id = f"sha256:{content_hash}"
+            logger.info("File upload completed")
+        job.cache_key = analysis_cache_key(job.content_id, offline)
+
+        cached_results = find_cached_results(job.content_id, offline)
+        if cached_results is not None:
+            analysis = complete_from_cache(analysis_id, initial_steps, cached_results, job.content_id)
+            release_workspace(job)
+            response.status_code = 200
+            return analysis
+
+        if follow_in_flight(job) is not None:
+            # The running job downloads, uploads and analyzes the video once for every request
+            release_workspace(job)
+            return analysis_store.get(analysis_id)
+
+        analysis = update_analysis(analysis_id, status="processing", progress=0.05, message="Queued for analysis")
+        job_queue.submit(job)
+    except Exception as e:
+        logger.error(f"Error queueing video: {str(e)}")
+        update_analysis(
+            analysis_id,
+            status="error",
+            progress=0,
+            message=e.detail if isinstance(e, HTTPException) else str(e)
+        )
+        release_workspace(job)
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, (QueueFullError, AnalysisError)):
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(UPLOAD_RETRY_AFTER)})
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return analysis
+
+@app.post("/analyze/batch", response_model=BatchAnalysis, status_code=202)
+async def analyze_batch(request: Request, batch: BatchRequest):
+    """Queues every video in a list of YouTube URLs and/or a playlist.
+
+    Each video becomes a normal analysis (see ``/analysis/{id}``); the batch
+    reports their aggregate progress at ``/analyze/batch/{batch_id}``.
+    """
+    urls = [url.strip() for url in batch.youtube_urls if url and url.strip()]
+    playlists = [url for url in urls if is_playlist_url(url)]
+    if batch.playlist_url:
+        playlists.append(batch.playlist_url.strip())
+    urls = [url for url in urls if not is_playlist_url(url)]
+
+    loop = asyncio.get_running_loop()
+    for playlist_url in playlists:
+        try:
+            urls += await loop.run_in_executor(download_executor, expand_playlist, playlist_url)
+        except Exception as e:
+            logger.error(f"Playlist lookup error: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Error reading playlist: {str(e)}")
+
+    urls, duplicates = dedupe_youtube_urls(urls)
+    if not urls:
+        raise HTTPException(status_code=400, detail="youtube_urls or playlist_url must name at least one video")
+    if len(urls) > BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {BATCH_MAX_URLS} videos")
+
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    client_id = request.client.host if request.client else ""
+    items = []
+    jobs = []
+    followers = 0
+    for url in urls:
+        analysis_id = f"analysis_{uuid.uuid4().hex}"
+        steps = create_analysis_record(analysis_id)
+        content_id = youtube_content_id(url)
+        job = AnalysisJob(
+            analysis_id=analysis_id,
+            youtube_url=url,
+            content_id=content_id,
+            cache_key=analysis_cache_key(content_id, batch.offline),
+            client_id=client_id,
+            offline=batch.offline
+        )
+        cached_results = find_cached_results(content_id, batch.offline)
+        if cached_results is not None:
+            complete_from_cache(analysis_id, steps, cached_results, content_id)
+        elif follow_in_flight(job) is not None:
+            followers += 1
+        else:
+            update_analysis(analysis_id, status="processing", progress=0.05, message="Queued for analysis")
+            jobs.append(job)
+        items.append(BatchItem(url=url, analysis_id=analysis_id, status="processing"))
+
+    record = BatchAnalysis(
+        id=batch_id,
+        state=AnalysisState(
+            status="processing",
+            progress=0.0,
+            message=f"Queued {len(jobs)} of {len(urls)} videos",
+            timestamp=datetime.now()
+        ),
+        items=items,
+        duplicates=duplicates
+    )
+    batch_store.save(record)
+    logger.info(
+        f"Batch {batch_id}: {len(urls)} videos, {len(urls) - len(jobs) - followers} cached, "
+        f"{followers} already being analyzed, {duplicates} duplicates dropped"
+    )
+    metrics.incr("batch_videos", len(urls))
+    metrics.incr("batch_duplicates", duplicates)
+
+    # The queue is bounded, so jobs are handed over as workers free up
+    feeder = asyncio.create_task(feed_batch(jobs))
+    batch_feeders.add(feeder)
+    feeder.add_done_callback(batch_feeders.discard)
+    return refresh_batch(record)
+
+@app.get("/analyze/batch/{batch_id}", response_model=BatchAnalysis)
+async def get_batch_status(batch_id: str):
+    record = batch_store.get(batch_id)
+    if record is None:
+        logger.warning(f"Batch ID not found: {batch_id}")
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return refresh_batch(record)
 
 @app.get("/analysis/{analysis_id}", response_model=VideoAnalysis)
 async def get_analysis_status(analysis_id: str):
     logger.info(f"Fetching analysis status for ID: {analysis_id}")
-    if analysis_id not in analysis_states:
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
         logger.warning(f"Analysis ID not found: {analysis_id}")
         raise HTTPException(status_code=404, detail="Analysis not found")
-    return analysis_states[analysis_id]
+    preview = previews.get(analysis_id)
+    if preview is not None:
+        # Held in memory while the analysis runs rather than rewritten into the stored record
+        analysis = analysis.model_copy(update={"preview": preview})
+    return analysis
+
+@app.post("/analysis/{analysis_id}/ask", response_model=FollowUpAnswer)
+async def ask_about_analysis(analysis_id: str, request: Request, body: FollowUpQuestion):
+    """Answers a question about an analyzed video from its Gemini file and stored results."""
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
+        logger.warning(f"Analysis ID not found: {analysis_id}")
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if analysis.state.status != "complete" or not analysis.results or not analysis.contentId:
+        raise HTTPException(status_code=409, detail="Questions can be asked once the analysis is complete")
+    metrics.incr("follow_up_questions")
+
+    context = follow_up_context(analysis)
+    cache_key = follow_up_cache_key(analysis.contentId, context, body.question)
+    cached = answer_cache.get(cache_key) if answer_cache is not None else None
+    if cached is not None:
+        return FollowUpAnswer.model_validate_json(cached).model_copy(update={"question": body.question, "cached": True})
+
+    task = pending_answers.get(cache_key)
+    if task is None:
+        uploaded_file = await find_registered_file(analysis.contentId)
+        if uploaded_file is None:
+            raise HTTPException(
+                status_code=409,
+                detail="The video is no longer available to Gemini; analyze it again to ask questions"
+            )
+        # Checked again: the same question may have been asked while the file was looked up
+        task = pending_answers.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(answer_follow_up(
+            uploaded_file, context, body.question, cache_key, request.client.host if request.client else ""
+        ))
+        pending_answers[cache_key] = task
+        task.add_done_callback(lambda _: pending_answers.pop(cache_key, None))
+    else:
+        metrics.incr("follow_up_shared")
+    try:
+        # A client hanging up must not cancel the answer others are waiting for
+        answer = await asyncio.shield(task)
+    except Exception as e:
+        logger.error(f"Follow-up question on {analysis_id} failed: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+    return answer.model_copy(update={"question": body.question})
+
+@app.get("/analysis/{analysis_id}/events")
+async def stream_analysis_events(analysis_id: str):
+    """Server-Sent Events: ``state`` on every change, ``section`` for each streamed part of
+    the analysis (``reset`` when a part starts over), then ``result`` once and ``end``."""
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
+        logger.warning(f"Analysis ID not found: {analysis_id}")
+        raise HTTPException(status_code=404, detail="Analysis not found")
+
+    async def event_stream():
+        queue = progress_broker.subscribe(analysis_id)
+        try:
+            state = analysis.state.model_dump(mode="json")
+            yield format_sse("state", state)
+            idle = 0.0
+            while state["status"] not in ("complete", "error"):
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=EVENT_STREAM_POLL_INTERVAL)
+                    if event == "state":
+                        state = data
+                    idle = 0.0
+                    yield format_sse(event, data)
+                    continue
+                except asyncio.TimeoutError:
+                    idle += EVENT_STREAM_POLL_INTERVAL
+                # Nothing published here; the job may be running in another worker process
+                stored = analysis_store.get(analysis_id)
+                if stored is None:
+                    break
+                stored_state = stored.state.model_dump(mode="json")
+                if stored_state["timestamp"] != state["timestamp"]:
+                    state = stored_state
+                    idle = 0.0
+                    yield format_sse("state", state)
+                elif idle >= EVENT_STREAM_KEEPALIVE:
+                    idle = 0.0
+                    yield ": keepalive\n\n"
+
+            if state["status"] == "complete":
+                final = analysis_store.get(analysis_id)
+                results = final.results if final and final.results else []
+                yield format_sse("result", [r.model_dump(mode="json") for r in results])
+            yield format_sse("end", {"id": analysis_id})
+        finally:
+            progress_broker.unsubscribe(analysis_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot["gauges"].update({
+        "jobs_pending": job_queue.pending,
+        "batch_jobs_pending": job_queue.batch_pending,
+        "jobs_active": job_queue.active,
+        "analysis_states": len(analysis_store),
+        "jobs_in_flight": len(in_flight_jobs),
+        "jobs_following": in_flight_jobs.following,
+        "workspace_jobs": workspace.jobs,
+        "workspace_reserved_bytes": workspace.reserved,
+        "workspace_tmpfs_reserved_bytes": workspace.tmpfs_reserved,
+        "workspace_waiting": workspace.waiting,
+        "gemini_files_processing": file_poller.in_progress,
+        "offline_requests_pending": offline_batcher.pending,
+        "offline_batches_in_flight": offline_batcher.in_flight,
+        "context_caches": len(context_cache) if context_cache is not None else 0,
+        **{f"gemini_{name}_queue_depth": depth for name, depth in gemini_scheduler.queue_depths().items()},
+    })
+    return snapshot
 
 
 
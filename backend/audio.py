@@ -0,0 +1,310 @@
+"""Local analysis of a video's soundtrack: voice activity, speaker turns and
+the question/answer structure of an interview.
+
+Everything is computed from short-time band energies with NumPy, so it runs
+on the CPU in a fraction of the video's duration and gives exact timestamps
+that the model can anchor its timeline to.
+"""
+import os
+import subprocess
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from preprocess import ffmpeg_path
+
+try:
+    import numpy as np
+except ImportError:  # Optional; the audio skeleton is disabled without it
+    np = None
+
+# Speech carries little above 4 kHz, so the track is analyzed at 8 kHz mono
+SAMPLE_RATE = 8000
+FRAME_SECONDS = 0.032
+HOP_SECONDS = 0.01
+# Frames transformed at once, bounding the memory used by long videos
+FFT_CHUNK_FRAMES = 16384
+
+
+@dataclass(frozen=True)
+class AudioSettings:
+    """Tuning of the voice activity and speaker change detection."""
+    vad_margin_db: float = 12.0  # Speech is this much louder than the noise floor
+    min_speech: float = 0.25  # Shorter bursts are noise
+    max_pause: float = 0.4  # Shorter pauses do not end a speech region
+    change_window: float = 1.5  # Seconds compared on either side of a possible speaker change
+    change_sigma: float = 1.5  # Spectral distance, in standard deviations, that counts as a change
+    speaker_separation: float = 1.0  # Cluster distance over spread below which there is one speaker
+    min_speaker_share: float = 0.05  # A second speaker must account for this much of the speech
+    turn_gap: float = 2.0  # Same-speaker segments closer than this form one turn
+    min_turn: float = 0.8  # Shorter turns (interjections) are dropped
+    bands: int = 16
+
+    def signature(self) -> str:
+        # Part of cache keys: different turns mean a different prompt
+        return (
+            f"vad{self.vad_margin_db:g}-{self.min_speech:g}-{self.max_pause:g}"
+            f"-chg{self.change_window:g}-{self.change_sigma:g}-{self.speaker_separation:g}-{self.min_speaker_share:g}"
+            f"-turn{self.turn_gap:g}-{self.min_turn:g}-b{self.bands}"
+        )
+
+
+@dataclass(frozen=True)
+class Turn:
+    start: float
+    end: float
+    speaker: int
+
+    @property
+    def length(self) -> float:
+        return self.end - self.start
+
+
+@dataclass(frozen=True)
+class Exchange:
+    question: Turn
+    answer: Turn
+
+
+@dataclass
+class AudioSkeleton:
+    """Speaker turns of a video; the speaker who talks the most is taken to be the one analyzed."""
+    duration: float
+    turns: List[Turn] = field(default_factory=list)
+    subject: int = 0
+    speakers: int = 0
+
+    @property
+    def speech_seconds(self) -> float:
+        return sum(turn.length for turn in self.turns)
+
+    @property
+    def exchanges(self) -> List[Exchange]:
+        """Another speaker's turn directly followed by the subject's, i.e. a question and its answer."""
+        return [
+            Exchange(question, answer)
+            for question, answer in zip(self.turns, self.turns[1:])
+            if question.speaker != self.subject and answer.speaker == self.subject
+        ]
+
+    def speech_between(self, start: float, end: float) -> float:
+        return sum(max(min(turn.end, end) - max(turn.start, start), 0.0) for turn in self.turns)
+
+    def describe(self, start: float = 0.0, end: float = float("inf"), offset: float = 0.0) -> str:
+        """One line per turn overlapping ``start``-``end``, with times shifted back by ``offset``."""
+        questions = {id(exchange.question) for exchange in self.exchanges}
+        lines = []
+        for turn in self.turns:
+            if turn.end <= start or turn.start >= end:
+                continue
+            if turn.speaker == self.subject:
+                role = "speaker"
+            else:
+                role = "interviewer (question)" if id(turn) in questions else "interviewer"
+            turn_start = max(turn.start, start) - offset
+            turn_end = min(turn.end, end) - offset
+            lines.append(f"- {turn_start:.1f}-{turn_end:.1f}: {role}")
+        return "\n".join(lines)
+
+
+def audio_available() -> bool:
+    return np is not None and ffmpeg_path() is not None
+
+
+def extract_audio(path: str, sample_rate: int = SAMPLE_RATE) -> "np.ndarray":
+    """Decodes the soundtrack to mono float32 samples; empty when the file has no audio."""
+    binary = ffmpeg_path()
+    if not binary:
+        raise RuntimeError("ffmpeg is not installed")
+    completed = subprocess.run(
+        [
+            binary, "-hide_banner", "-loglevel", "error",
+            "-i", path,
+            "-vn", "-ac", "1", "-ar", str(sample_rate),
+            "-f", "s16le", "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if completed.returncode != 0:
+        stderr = completed.stderr.decode(errors="replace").strip()
+        if "does not contain any stream" in stderr or "matches no streams" in stderr:
+            return np.zeros(0, dtype=np.float32)
+        raise RuntimeError(f"ffmpeg failed: {stderr[-500:]}")
+    return np.frombuffer(completed.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _band_matrix(frame_length: int, sample_rate: int, bands: int) -> "np.ndarray":
+    """Maps rfft bins to ``bands`` log-spaced bands between 100 Hz and 3.8 kHz."""
+    frequencies = np.fft.rfftfreq(frame_length, 1.0 / sample_rate)
+    edges = np.geomspace(100.0, min(3800.0, sample_rate / 2), bands + 1)
+    band_of_bin = np.searchsorted(edges, frequencies, side="right") - 1
+    matrix = (band_of_bin[:, None] == np.arange(bands)[None, :]).astype(np.float32)
+    # Average rather than sum, so wide high bands do not dominate
+    return matrix / np.maximum(matrix.sum(axis=0), 1.0)
+
+
+def frame_features(samples: "np.ndarray", sample_rate: int, bands: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Per-frame log energy (dB) and log band energies, one frame every HOP_SECONDS."""
+    frame_length = int(FRAME_SECONDS * sample_rate)
+    hop = int(HOP_SECONDS * sample_rate)
+    if len(samples) < frame_length:
+        return np.zeros(0, dtype=np.float32), np.zeros((0, bands), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame_length)[::hop]
+    window = np.hanning(frame_length).astype(np.float32)
+    band_matrix = _band_matrix(frame_length, sample_rate, bands)
+
+    energy = np.empty(len(frames), dtype=np.float32)
+    band_energy = np.empty((len(frames), bands), dtype=np.float32)
+    for first in range(0, len(frames), FFT_CHUNK_FRAMES):
+        chunk = frames[first:first + FFT_CHUNK_FRAMES] * window
+        power = np.abs(np.fft.rfft(chunk, axis=1)) ** 2
+        energy[first:first + len(chunk)] = 10 * np.log10(power.sum(axis=1) + 1e-10)
+        band_energy[first:first + len(chunk)] = np.log(power @ band_matrix + 1e-10)
+    return energy, band_energy
+
+
+def _runs(mask: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """Start and end (exclusive) indices of the runs of True in ``mask``."""
+    padded = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return changes[::2], changes[1::2]
+
+
+def detect_speech(energy: "np.ndarray", settings: AudioSettings) -> "np.ndarray":
+    """Frame mask of voice activity: energy above an adaptive noise floor, smoothed."""
+    if len(energy) == 0:
+        return np.zeros(0, dtype=bool)
+    floor = np.percentile(energy, 10)
+    loud = np.percentile(energy, 90)
+    if loud - floor < settings.vad_margin_db / 2:
+        # Steady noise (or steady music); speech rises and falls with every syllable
+        return np.zeros(len(energy), dtype=bool)
+    # When nearly everything is speech the 10th percentile is speech too; stay below the loud part
+    threshold = min(floor + settings.vad_margin_db, loud - 6.0)
+    mask = energy > threshold
+
+    # Bridge short pauses, then drop short bursts
+    starts, ends = _runs(~mask)
+    short = (ends - starts) * HOP_SECONDS < settings.max_pause
+    interior = (starts > 0) & (ends < len(mask))
+    for start, end in zip(starts[short & interior], ends[short & interior]):
+        mask[start:end] = True
+    starts, ends = _runs(mask)
+    for start, end in zip(starts, ends):
+        if (end - start) * HOP_SECONDS < settings.min_speech:
+            mask[start:end] = False
+    return mask
+
+
+def speaker_changes(features: "np.ndarray", settings: AudioSettings) -> "np.ndarray":
+    """Indices into ``features`` (speech frames only) where the speaker probably changes.
+
+    Compares the mean spectrum of ``change_window`` seconds on either side of
+    every frame at once, using cumulative sums, and keeps the distance peaks
+    that stand out from the rest.
+    """
+    window = int(settings.change_window / HOP_SECONDS)
+    if len(features) < 2 * window + 1:
+        return np.zeros(0, dtype=int)
+    cumulative = np.concatenate((np.zeros((1, features.shape[1])), np.cumsum(features, axis=0)))
+    centers = np.arange(window, len(features) - window)
+    left = (cumulative[centers] - cumulative[centers - window]) / window
+    right = (cumulative[centers + window] - cumulative[centers]) / window
+    distance = np.sqrt(((left - right) ** 2).mean(axis=1))
+
+    threshold = np.median(distance) + settings.change_sigma * distance.std()
+    # A peak is the largest distance within min_turn on either side
+    radius = max(int(settings.min_turn / HOP_SECONDS), 1)
+    padded = np.pad(distance, radius, constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1).max(axis=1)
+    peaks = np.flatnonzero((distance >= local_max) & (distance > threshold))
+    return centers[peaks]
+
+
+def cluster_speakers(vectors: "np.ndarray", weights: "np.ndarray", settings: AudioSettings) -> "np.ndarray":
+    """Labels segment spectra as speaker 0 or 1 with weighted 2-means; all 0 if they are alike."""
+    labels = np.zeros(len(vectors), dtype=int)
+    if len(vectors) < 2:
+        return labels
+    # Start from the longest segment and the one least like it
+    first = vectors[np.argmax(weights)]
+    second = vectors[np.argmax(((vectors - first) ** 2).sum(axis=1))]
+    centroids = np.stack([first, second])
+    for iteration in range(20):
+        distances = ((vectors[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if iteration and (new_labels == labels).all():
+            break
+        labels = new_labels
+        for k in range(2):
+            members = labels == k
+            if members.any():
+                centroids[k] = np.average(vectors[members], axis=0, weights=weights[members])
+
+    share = weights[labels == 1].sum() / weights.sum()
+    if min(share, 1 - share) < settings.min_speaker_share:
+        # A few odd segments (onsets, coughs) rather than another person
+        return np.zeros(len(vectors), dtype=int)
+    spread = np.sqrt(np.average(((vectors - centroids[labels]) ** 2).sum(axis=1), weights=weights))
+    separation = np.sqrt(((centroids[0] - centroids[1]) ** 2).sum())
+    if separation < settings.speaker_separation * max(spread, 1e-6):
+        return np.zeros(len(vectors), dtype=int)
+    return labels
+
+
+def build_skeleton(energy: "np.ndarray", band_energy: "np.ndarray", settings: AudioSettings) -> AudioSkeleton:
+    duration = len(energy) * HOP_SECONDS
+    speech = detect_speech(energy, settings)
+    speech_frames = np.flatnonzero(speech)
+    if len(speech_frames) == 0:
+        return AudioSkeleton(duration=duration)
+
+    # Normalized spectra of speech frames only, so pauses do not look like changes
+    features = band_energy[speech_frames]
+    features = (features - features.mean(axis=0)) / (features.std(axis=0) + 1e-6)
+
+    # Segments end at pauses and at detected changes
+    breaks = np.flatnonzero(np.diff(speech_frames) > 1) + 1
+    boundaries = np.unique(np.concatenate(([0], breaks, speaker_changes(features, settings), [len(features)])))
+    starts, ends = boundaries[:-1], boundaries[1:]
+    vectors = np.stack([features[s:e].mean(axis=0) for s, e in zip(starts, ends)])
+    labels = cluster_speakers(vectors, (ends - starts).astype(float), settings)
+
+    turns: List[Turn] = []
+    for start, end, label in zip(starts, ends, labels):
+        turn = Turn(float(speech_frames[start] * HOP_SECONDS), float((speech_frames[end - 1] + 1) * HOP_SECONDS), int(label))
+        if turns and turns[-1].speaker == turn.speaker and turn.start - turns[-1].end < settings.turn_gap:
+            turns[-1] = Turn(turns[-1].start, turn.end, turn.speaker)
+        else:
+            turns.append(turn)
+    turns = [turn for turn in turns if turn.length >= settings.min_turn]
+
+    talk_time = np.bincount([t.speaker for t in turns], weights=[t.length for t in turns], minlength=2)
+    return AudioSkeleton(
+        duration=duration,
+        turns=turns,
+        subject=int(np.argmax(talk_time)),
+        speakers=int((talk_time > 0).sum()),
+    )
+
+
+def analyze_audio(path: str, settings: AudioSettings) -> Optional[AudioSkeleton]:
+    """Blocking; extracts the soundtrack of ``path`` and returns its speaker turns.
+
+    Returns None when the file has no audio track.
+    """
+    started = time.perf_counter()
+    samples = extract_audio(path)
+    if len(samples) == 0:
+        logger.info(f"{os.path.basename(path)} has no audio track")
+        return None
+    energy, band_energy = frame_features(samples, SAMPLE_RATE, settings.bands)
+    skeleton = build_skeleton(energy, band_energy, settings)
+    logger.info(
+        f"Audio of {os.path.basename(path)}: {skeleton.speech_seconds:.0f}s of speech in {len(skeleton.turns)} turns, "
+        f"{skeleton.speakers} speakers, {len(skeleton.exchanges)} exchanges ({time.perf_counter() - started:.1f}s)"
+    )
+    return skeleton
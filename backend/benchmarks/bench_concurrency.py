@@ -0,0 +1,54 @@
+"""Measures analysis throughput of a single server process with a stubbed Gemini client.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_concurrency --jobs 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import app  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiClient  # noqa: E402
+from jobs import AnalysisJob, JobQueue  # noqa: E402
+
+
+async def run(jobs: int, workers: int, latency: float):
+    app.client = StubGeminiClient(latency)
+    queue = JobQueue(app.run_analysis_pipeline, workers=workers, max_pending=jobs)
+    await queue.start()
+
+    ids = []
+    for index in range(jobs):
+        fd, path = tempfile.mkstemp(suffix=".mp4")
+        os.write(fd, b"\0" * 1024)
+        os.close(fd)
+        analysis_id = f"bench_{index}"
+        app.analysis_store.save(app.VideoAnalysis(
+            id=analysis_id,
+            state=app.AnalysisState(status="processing", progress=0.0, message="Queued", timestamp=app.datetime.now()),
+        ))
+        queue.submit(AnalysisJob(analysis_id=analysis_id, file_path=path))
+        ids.append(analysis_id)
+
+    started = time.perf_counter()
+    await queue.join()
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+
+    completed = sum(1 for i in ids if app.analysis_store.get(i).state.status == "complete")
+    print(f"workers={workers} jobs={jobs} completed={completed} "
+          f"elapsed={elapsed:.2f}s throughput={jobs / elapsed:.2f} jobs/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per Gemini call")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+    for workers in args.workers:
+        asyncio.run(run(args.jobs, workers, args.latency))
@@ -0,0 +1,167 @@
+"""Compares the full-video and keyframe inputs: bytes sent, time to an answer and prompt tokens.
+
+By default nothing is sent to Gemini: the local preparation (transcoding, or
+selecting and encoding keyframes) is timed, the upload is estimated from the
+given uplink bandwidth and tokens from Gemini's per-second and per-image rates.
+With --live (and a real GEMINI_API_KEY) both inputs are analyzed by Gemini and
+the measured latency and billed prompt tokens are reported instead. Without
+--input a synthetic clip with several shots is generated.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_keyframes --duration 120 --uplink-mbps 20
+    python -m benchmarks.bench_keyframes --input debate.mp4 --budget 16
+    GEMINI_API_KEY=... python -m benchmarks.bench_keyframes --input debate.mp4 --live
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+# Both inputs are sent inline or uploaded fresh, never from a context cache
+os.environ.setdefault("CONTEXT_CACHE_SERVICE", "none")
+
+import app  # noqa: E402
+from keyframes import KeyframeSettings, sample_keyframes  # noqa: E402
+from preprocess import ffmpeg_path, probe_duration, transcode_video  # noqa: E402
+
+# Sources (and their options) of the shots of the generated sample, which share its duration equally
+SAMPLE_SHOTS = [
+    ("testsrc2", ""), ("smptebars", ""), ("mandelbrot", ""), ("life", ":mold=10:ratio=0.5"), ("rgbtestsrc", ""),
+]
+
+
+def generate_sample(binary: str, path: str, duration: int):
+    shot = duration / len(SAMPLE_SHOTS)
+    command = [binary, "-y", "-hide_banner", "-loglevel", "error"]
+    for source, options in SAMPLE_SHOTS:
+        command += ["-f", "lavfi", "-i", f"{source}=size=1280x720:rate=30{options},trim=duration={shot:g}"]
+    command += ["-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}"]
+    inputs = "".join(f"[{index}:v]setsar=1[v{index}];" for index in range(len(SAMPLE_SHOTS)))
+    chain = "".join(f"[v{index}]" for index in range(len(SAMPLE_SHOTS)))
+    command += [
+        "-filter_complex", f"{inputs}{chain}concat=n={len(SAMPLE_SHOTS)}:v=1:a=0[v]",
+        "-map", "[v]", "-map", f"{len(SAMPLE_SHOTS)}:a",
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", "4M",
+        "-c:a", "aac", "-b:a", "128k", path,
+    ]
+    subprocess.run(command, check=True)
+
+
+def prompt_tokens(response) -> int:
+    return getattr(getattr(response, "usage_metadata", None), "prompt_token_count", None) or 0
+
+
+async def analyze_video(path: str) -> dict:
+    started = time.perf_counter()
+    uploaded_file = await app.upload_to_gemini(path, "benchmark")
+    uploaded = time.perf_counter()
+    try:
+        response = await app.request_analysis(
+            uploaded_file, app.analysis_prompt(), app.ANALYSIS_SCHEMA, None, "benchmark"
+        )
+    finally:
+        await app.client.aio.files.delete(name=uploaded_file.name)
+    return {
+        "upload": uploaded - started,
+        "generate": time.perf_counter() - uploaded,
+        "tokens": prompt_tokens(response),
+    }
+
+
+async def analyze_keyframes(sample) -> dict:
+    started = time.perf_counter()
+    response = await app.request_analysis(
+        None, app.analysis_prompt(keyframes=sample), app.ANALYSIS_SCHEMA, None, "benchmark", keyframes=sample
+    )
+    return {"upload": 0.0, "generate": time.perf_counter() - started, "tokens": prompt_tokens(response)}
+
+
+async def analyze_both(path: str, sample) -> tuple:
+    # One after the other, so neither waits on the other's quota
+    return await analyze_video(path), await analyze_keyframes(sample)
+
+
+def report(name: str, sent: int, prepare: float, upload: float, generate: float, tokens: float):
+    total = prepare + upload + generate
+    print(
+        f"{name:<12} {sent / 1e6:9.2f} MB {prepare:9.2f}s {upload:9.2f}s {generate:9.2f}s {total:9.2f}s"
+        f" {tokens:10.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--input", help="Video to measure (default: generated sample)")
+    parser.add_argument("--duration", type=int, default=120, help="Length of the generated sample in seconds")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="Assumed upload bandwidth to Gemini")
+    parser.add_argument("--generate-seconds", type=float, default=0.0,
+                        help="Assumed model latency, added to both paths when not --live")
+    parser.add_argument("--budget", type=int, default=KeyframeSettings.max_frames, help="Keyframes sent")
+    parser.add_argument("--no-audio", action="store_true", help="Send the keyframes without the soundtrack")
+    parser.add_argument("--no-preprocess", action="store_true", help="Upload the original video")
+    parser.add_argument("--live", action="store_true", help="Analyze both inputs with Gemini")
+    args = parser.parse_args()
+
+    binary = ffmpeg_path()
+    if not binary:
+        raise SystemExit("ffmpeg not found (set FFMPEG_BINARY to its path)")
+    if args.live and os.environ["GEMINI_API_KEY"] == "benchmark":
+        raise SystemExit("--live needs GEMINI_API_KEY")
+
+    settings = KeyframeSettings(max_frames=args.budget, keep_audio=not args.no_audio)
+    with tempfile.TemporaryDirectory() as workdir:
+        source = args.input
+        if not source:
+            source = os.path.join(workdir, "sample.mp4")
+            generate_sample(binary, source, args.duration)
+        duration = probe_duration(source) or args.duration
+        source_bytes = os.path.getsize(source)
+
+        upload_path, transcode_seconds = source, 0.0
+        if not args.no_preprocess:
+            stats = transcode_video(source, os.path.join(workdir, "preprocessed.mp4"), app.TRANSCODE_SETTINGS)
+            if stats.output_bytes < stats.input_bytes:
+                upload_path = os.path.join(workdir, "preprocessed.mp4")
+            transcode_seconds = stats.seconds
+        video_bytes = os.path.getsize(upload_path)
+
+        sample = sample_keyframes(source, settings)
+        # Inline data travels base64 encoded in the JSON request
+        keyframe_bytes = (sample.size + 2) // 3 * 4
+
+        bytes_per_second = args.uplink_mbps * 1_000_000 / 8
+        if args.live:
+            video, keyframes = asyncio.run(analyze_both(upload_path, sample))
+        else:
+            video = {
+                "upload": video_bytes / bytes_per_second,
+                "generate": args.generate_seconds,
+                "tokens": app.video_tokens(duration),
+            }
+            keyframes = {
+                "upload": keyframe_bytes / bytes_per_second,
+                "generate": args.generate_seconds,
+                "tokens": app.keyframe_tokens(sample),
+            }
+
+    reasons = {}
+    for frame in sample.frames:
+        reasons[frame.reason] = reasons.get(frame.reason, 0) + 1
+    print(f"video:       {duration:.0f}s, {source_bytes / 1e6:.2f} MB")
+    print(f"keyframes:   {settings.signature()}")
+    print(f"             {len(sample.frames)} frames ({', '.join(f'{n} {r}' for r, n in reasons.items())})")
+    print(f"mode:        {'measured with ' + app.MODEL_NAME if args.live else 'estimated'}")
+    print(f"{'input':<12} {'sent':>12} {'prepare':>10} {'upload':>10} {'generate':>10} {'total':>10} {'tokens':>10}")
+    report("video", video_bytes, transcode_seconds, video["upload"], video["generate"], video["tokens"])
+    report(
+        "keyframes", keyframe_bytes, sample.seconds, keyframes["upload"], keyframes["generate"], keyframes["tokens"]
+    )
+    print(f"bytes reduction:  {video_bytes / max(keyframe_bytes, 1):8.1f}x")
+    print(f"token reduction:  {video['tokens'] / max(keyframes['tokens'], 1):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
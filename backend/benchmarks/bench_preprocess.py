@@ -0,0 +1,71 @@
+"""Compares upload bytes and end-to-end time with and without the ffmpeg preprocessing stage.
+
+Upload time is estimated from the given uplink bandwidth so the numbers do not
+depend on Gemini. Without --input a synthetic 1080p/30fps clip is generated.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_preprocess --duration 60 --uplink-mbps 20
+    python -m benchmarks.bench_preprocess --input debate.mp4
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+
+from preprocess import TranscodeSettings, ffmpeg_path, transcode_video
+
+
+def generate_sample(binary: str, path: str, duration: int):
+    subprocess.run(
+        [
+            binary, "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate=30:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-b:v", "6M",
+            "-c:a", "aac", "-b:a", "128k", path,
+        ],
+        check=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--input", help="Video to measure (default: generated sample)")
+    parser.add_argument("--duration", type=int, default=60, help="Length of the generated sample in seconds")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="Assumed upload bandwidth to Gemini")
+    parser.add_argument("--max-height", type=int, default=TranscodeSettings.max_height)
+    parser.add_argument("--fps", type=float, default=TranscodeSettings.fps)
+    parser.add_argument("--video-bitrate", default=TranscodeSettings.video_bitrate)
+    parser.add_argument("--no-audio", action="store_true")
+    args = parser.parse_args()
+
+    binary = ffmpeg_path()
+    if not binary:
+        raise SystemExit("ffmpeg not found (set FFMPEG_BINARY to its path)")
+
+    settings = TranscodeSettings(
+        max_height=args.max_height,
+        fps=args.fps,
+        video_bitrate=args.video_bitrate,
+        keep_audio=not args.no_audio,
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        source = args.input
+        if not source:
+            source = os.path.join(workdir, "sample.mp4")
+            generate_sample(binary, source, args.duration)
+        stats = transcode_video(source, os.path.join(workdir, "preprocessed.mp4"), settings)
+
+    bytes_per_second = args.uplink_mbps * 1_000_000 / 8
+    original_upload = stats.input_bytes / bytes_per_second
+    preprocessed_upload = stats.output_bytes / bytes_per_second
+    print(f"settings:          {settings.signature()}")
+    print(f"original:          {stats.input_bytes / 1e6:8.2f} MB  upload {original_upload:7.2f}s")
+    print(f"preprocessed:      {stats.output_bytes / 1e6:8.2f} MB  upload {preprocessed_upload:7.2f}s"
+          f"  (+{stats.seconds:.2f}s transcode)")
+    print(f"bytes reduction:   {stats.input_bytes / max(stats.output_bytes, 1):8.1f}x")
+    print(f"end-to-end:        {original_upload:.2f}s -> {stats.seconds + preprocessed_upload:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Stand-in for the google-genai client used by the benchmarks.
+
+Every call sleeps for a configurable latency so that the benchmarks measure
+how well the server overlaps Gemini work, not Gemini itself.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+SAMPLE_ANALYSIS = {
+    "facialExpression": {"emotion": "calm", "confidence": 0.8, "description": "Relaxed expression"},
+    "bodyPosture": {"emotion": "open", "confidence": 0.7, "description": "Upright posture"},
+    "handGestures": {"emotion": "measured", "confidence": 0.6, "description": "Deliberate gestures"},
+    "overallEmotion": "calm",
+    "confidenceScore": 0.75,
+    "analysis": "The speaker appears composed throughout.",
+    "deceptionIndicators": [],
+    "confidenceMetrics": [],
+    "keyStrengths": [{"title": "Composure", "description": "Steady delivery", "confidence": 0.8}],
+    "areasOfNote": [],
+    "questionResponse": {"responseStyle": "direct", "topicHandling": "focused", "behavioralPatterns": []},
+    "timeline": [{"timestamp": 1.0, "description": "Opening statement"}],
+    "questionImpacts": [],
+}
+
+
+def _file(name: str, state: str, duration: float) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=name,
+        uri=f"https://generativelanguage.googleapis.com/v1beta/{name}",
+        mime_type="video/mp4",
+        state=state,
+        video_metadata={"videoDuration": f"{duration:g}s"},
+    )
+
+
+class _AsyncFiles:
+    def __init__(self, latency: float, duration: float):
+        self.latency = latency
+        self.duration = duration
+
+    async def upload(self, file, config=None):
+        await asyncio.sleep(self.latency)
+        return _file(f"files/{abs(hash(str(file)))}", "PROCESSING", self.duration)
+
+    async def get(self, name):
+        await asyncio.sleep(self.latency / 10)
+        return _file(name, "ACTIVE", self.duration)
+
+
+class _AsyncModels:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text=json.dumps(SAMPLE_ANALYSIS))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        # Spreads the same latency over a few chunks, like a streamed response
+        text = json.dumps(SAMPLE_ANALYSIS)
+        chunks = [text[i:i + 64] for i in range(0, len(text), 64)]
+
+        async def stream():
+            for chunk in chunks:
+                await asyncio.sleep(self.latency / len(chunks))
+                yield SimpleNamespace(text=chunk, usage_metadata=None)
+
+        return stream()
+
+
+class StubGeminiClient:
+    def __init__(self, latency: float = 0.5, duration: float = 60.0):
+        self.aio = SimpleNamespace(files=_AsyncFiles(latency, duration), models=_AsyncModels(latency))
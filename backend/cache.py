@@ -0,0 +1,165 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from loguru import logger
+
+from metrics import metrics
+
+
+def make_cache_key(*parts) -> str:
+    """Hashes the parts that determine an analysis (content, model, prompt...) into one key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class CacheBackend:
+    """Key/value storage for serialized values with size and TTL eviction."""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache; entries older than ``ttl`` seconds are treated as missing."""
+
+    def __init__(self, max_entries: int = 1000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """On-disk cache that survives restarts and can be shared between workers."""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: Optional[float] = None, table: str = "cache"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed_at ON {table}(accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl is not None and now - stored_at > self.ttl:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.ttl is not None:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE stored_at < ?", (now - self.ttl,))
+            # Drop the least recently used entries beyond the size limit
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class ResultCache:
+    """Counts hits and misses on top of a backend; ``name`` prefixes the metric names."""
+
+    def __init__(self, backend: CacheBackend, name: str = "result_cache"):
+        self.backend = backend
+        self.name = name
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.error(f"{self.name} lookup failed: {str(e)}")
+            value = None
+        metrics.incr(f"{self.name}_hits" if value is not None else f"{self.name}_misses")
+        return value
+
+    def set(self, key: str, value: str):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.error(f"{self.name} store failed: {str(e)}")
+        metrics.set_gauge(f"{self.name}_entries", len(self.backend))
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+
+
+def create_cache_backend(kind: str, path: str, max_entries: int, ttl: Optional[float], table: str = "cache") -> Optional[CacheBackend]:
+    """Builds the backend named by ``kind`` ('memory', 'sqlite' or 'none')."""
+    if kind == "none":
+        return None
+    if kind == "sqlite":
+        return SQLiteCacheBackend(path, max_entries=max_entries, ttl=ttl, table=table)
+    if kind == "memory":
+        return MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {kind}")
@@ -0,0 +1,205 @@
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from google.genai import types
+from loguru import logger
+
+from metrics import metrics
+
+
+@dataclass
+class CachedContext:
+    name: str
+    expires_at: float  # time.monotonic()
+
+
+class ContextCacheService:
+    """Stores a system instruction and contents server side for ``ttl`` seconds."""
+
+    async def create(self, model: str, system_instruction: str, contents: Optional[list], ttl: float) -> str:
+        raise NotImplementedError
+
+    async def extend(self, name: str, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, name: str):
+        raise NotImplementedError
+
+
+class GeminiContextCacheService(ContextCacheService):
+    """Gemini cached contents (``caches.create``), referenced later through ``cached_content``."""
+
+    def __init__(self, get_client: Callable[[], Any]):
+        # Looked up on every call so the client can be swapped out (see benchmarks/)
+        self.get_client = get_client
+
+    async def create(self, model: str, system_instruction: str, contents: Optional[list], ttl: float) -> str:
+        cached = await self.get_client().aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                contents=contents,
+                ttl=f"{ttl:.0f}s",
+                display_name=f"truthscope-{int(time.time())}",
+            ),
+        )
+        return cached.name
+
+    async def extend(self, name: str, ttl: float):
+        await self.get_client().aio.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl:.0f}s"))
+
+    async def delete(self, name: str):
+        await self.get_client().aio.caches.delete(name=name)
+
+
+class FakeContextCacheService(ContextCacheService):
+    """In-memory stand-in that keeps what would have been cached and expires it by TTL.
+
+    For tests and the stub client from ``benchmarks/``, which ignores
+    ``cached_content``; the names it hands out mean nothing to the real API.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.entries: Dict[str, dict] = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        for name in [n for n, entry in self.entries.items() if entry["expires_at"] <= now]:
+            del self.entries[name]
+
+    async def create(self, model: str, system_instruction: str, contents: Optional[list], ttl: float) -> str:
+        self._expire()
+        name = f"cachedContents/fake-{next(self._ids)}"
+        self.entries[name] = {
+            "model": model,
+            "system_instruction": system_instruction,
+            "contents": contents,
+            "expires_at": time.monotonic() + ttl,
+        }
+        return name
+
+    async def extend(self, name: str, ttl: float):
+        self._expire()
+        if name not in self.entries:
+            raise KeyError(f"Unknown cached content {name}")
+        self.entries[name]["expires_at"] = time.monotonic() + ttl
+
+    async def delete(self, name: str):
+        self.entries.pop(name, None)
+
+
+class ContextCache:
+    """Creates cached contents on demand and reuses them until they expire.
+
+    Entries are kept alive by extending their TTL when they are used within
+    ``refresh_margin`` seconds of expiring. Gemini refuses to cache fewer than
+    ``min_tokens`` tokens, so smaller contexts are not attempted, and a context
+    that failed to be created is not retried for ``failure_ttl`` seconds.
+    Concurrent callers asking for the same key share one creation.
+    """
+
+    def __init__(
+        self,
+        service: ContextCacheService,
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        min_tokens: int = 4096,
+        failure_ttl: float = 600.0,
+    ):
+        self.service = service
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.failure_ttl = failure_ttl
+        self._entries: Dict[Hashable, CachedContext] = {}
+        self._failures: Dict[Hashable, float] = {}
+        self._creating: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, key: Hashable) -> Optional[str]:
+        """Returns the cached content for ``key`` if there is a live one, without creating it."""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at - self.refresh_margin <= time.monotonic():
+            return None
+        metrics.incr("context_cache_hits")
+        return entry.name
+
+    async def get(
+        self,
+        key: Hashable,
+        model: str,
+        system_instruction: str,
+        contents: Optional[list] = None,
+        tokens: float = 0,
+    ) -> Optional[str]:
+        """Returns the name of a cached content for ``key``, creating it if needed.
+
+        Returns None when the context is too small to cache or could not be
+        cached; callers then send it inline.
+        """
+        if tokens < self.min_tokens:
+            metrics.incr("context_cache_too_small")
+            return None
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            if entry.expires_at - now > self.refresh_margin:
+                metrics.incr("context_cache_hits")
+                return entry.name
+            try:
+                await self.service.extend(entry.name, self.ttl)
+                entry.expires_at = time.monotonic() + self.ttl
+                metrics.incr("context_cache_refreshes")
+                metrics.incr("context_cache_hits")
+                return entry.name
+            except Exception as e:
+                logger.info(f"Could not extend cached content {entry.name}, creating a new one: {str(e)}")
+        self._entries.pop(key, None)
+
+        failed_at = self._failures.get(key)
+        if failed_at is not None and now - failed_at < self.failure_ttl:
+            return None
+
+        task = self._creating.get(key)
+        if task is None:
+            task = asyncio.create_task(self._create(key, model, system_instruction, contents))
+            self._creating[key] = task
+            task.add_done_callback(lambda _: self._creating.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _create(
+        self, key: Hashable, model: str, system_instruction: str, contents: Optional[list]
+    ) -> Optional[str]:
+        metrics.incr("context_cache_misses")
+        try:
+            name = await self.service.create(model, system_instruction, contents, self.ttl)
+        except Exception as e:
+            metrics.incr("context_cache_failures")
+            logger.warning(f"Could not create cached content, sending the context inline: {str(e)}")
+            self._failures[key] = time.monotonic()
+            return None
+        metrics.incr("context_cache_creates")
+        logger.info(f"Created cached content {name} for {self.ttl:.0f}s")
+        self._failures.pop(key, None)
+        self._entries[key] = CachedContext(name, time.monotonic() + self.ttl)
+        return name
+
+    def discard(self, key: Hashable):
+        """Forgets an entry the API no longer knows about."""
+        self._entries.pop(key, None)
+
+    async def close(self):
+        """Deletes every cached content still alive; they are billed for storage until they expire."""
+        names: List[str] = [entry.name for entry in self._entries.values()]
+        self._entries.clear()
+        for name in names:
+            try:
+                await self.service.delete(name)
+            except Exception as e:
+                logger.warning(f"Could not delete cached content {name}: {str(e)}")
@@ -0,0 +1,238 @@
+"""YouTube downloads sized for analysis.
+
+Gemini and the preprocessing stage work at a few hundred lines of
+resolution, so instead of the best muxed file the smallest format that still
+has the analysis resolution is fetched (a video-only stream merged with a
+small audio stream when that is smaller), fragmented formats are fetched with
+several connections, and only the requested time range is fetched when there
+is one.
+"""
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+
+import yt_dlp
+from loguru import logger
+from yt_dlp.utils import download_range_func
+
+from metrics import metrics
+from preprocess import ffmpeg_path
+
+
+@dataclass(frozen=True)
+class DownloadSettings:
+    min_height: int = 480  # Analysis resolution; taller formats are only used when nothing smaller has it
+    min_audio_bitrate: float = 48  # kbit/s; the soundtrack is analyzed too
+    # AV1 decodes slowly on a CPU (preprocessing, keyframes) and not every ffmpeg build can decode it
+    avoid_codecs: Tuple[str, ...] = ("av01",)
+    concurrent_fragments: int = 4  # Parallel connections for DASH/HLS formats
+    # Ranged requests of this size keep YouTube from throttling long plain-HTTP downloads
+    http_chunk_size: int = 10 * 1024 * 1024
+
+    def signature(self) -> str:
+        # Part of cache keys: another format is another input for Gemini
+        return f"h{self.min_height}-a{self.min_audio_bitrate:g}-x{','.join(self.avoid_codecs)}"
+
+
+def extract_youtube_id(url: str) -> Optional[str]:
+    """Returns the canonical video ID for the common YouTube URL shapes."""
+    match = re.search(r"(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})", url)
+    return match.group(1) if match else None
+
+
+def _has(fmt: dict, kind: str) -> bool:
+    return fmt.get(kind) not in (None, "none")
+
+
+def _size(fmt: dict, duration: Optional[float]) -> float:
+    """Expected bytes; unknown sizes sort last."""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if not size and fmt.get("tbr") and duration:
+        size = fmt["tbr"] * 125 * duration  # kbit/s to bytes
+    return size or float("inf")
+
+
+def choose_formats(
+    formats: List[dict], settings: DownloadSettings, duration: Optional[float] = None, can_merge: bool = True
+) -> List[dict]:
+    """The format(s) to download: one muxed format, or a video and an audio format to merge.
+
+    Among the options at least ``min_height`` tall the one with the smallest
+    expected size wins; when there are none, the tallest one does. Only MP4
+    muxed formats are considered, and separate streams only if ffmpeg can
+    merge them (``can_merge``).
+    """
+    audio = None
+    if can_merge:
+        streams = [f for f in formats if _has(f, "acodec") and not _has(f, "vcodec")]
+        good = [f for f in streams if (f.get("abr") or 0) >= settings.min_audio_bitrate]
+        if good:
+            audio = min(good, key=lambda f: _size(f, duration))
+        elif streams:
+            audio = max(streams, key=lambda f: f.get("abr") or 0)
+
+    options = [
+        ([f], _size(f, duration))
+        for f in formats
+        if _has(f, "vcodec") and _has(f, "acodec") and f.get("ext") == "mp4"
+    ]
+    if audio is not None:
+        options += [
+            ([f, audio], _size(f, duration) + _size(audio, duration))
+            for f in formats
+            if _has(f, "vcodec") and not _has(f, "acodec")
+        ]
+    preferred = [o for o in options if not (o[0][0].get("vcodec") or "").startswith(settings.avoid_codecs)]
+    options = preferred or options
+    if not options:
+        return []
+
+    def height(option) -> int:
+        return option[0][0].get("height") or 0
+
+    tall_enough = [o for o in options if height(o) >= settings.min_height]
+    if tall_enough:
+        chosen = min(tall_enough, key=lambda o: (o[1], height(o)))
+    else:
+        chosen = max(options, key=lambda o: (height(o), -o[1]))
+    return chosen[0]
+
+
+class YoutubeDownloader:
+    """Blocking YouTube downloads, run on a thread pool.
+
+    Extraction (the watch page, player and format manifests) is the slow part
+    of starting a download, so its results are cached by video ID for
+    ``info_ttl`` seconds and shared by every download: retries, repeated
+    videos and the same video at other time ranges go straight to fetching
+    media. The TTL stays well below the lifetime of YouTube's signed format URLs.
+    """
+
+    def __init__(self, settings: DownloadSettings, info_ttl: float = 1800.0, max_info_entries: int = 256):
+        self.settings = settings
+        self.info_ttl = info_ttl
+        self.max_info_entries = max_info_entries
+        self._info: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # A YoutubeDL per download thread, kept for the extractor sessions and cookies it holds
+        self._local = threading.local()
+
+    def _extractor(self) -> yt_dlp.YoutubeDL:
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            ydl = self._local.ydl = yt_dlp.YoutubeDL({"quiet": True, "no_warnings": True, "skip_download": True})
+        return ydl
+
+    def extract_info(self, url: str) -> dict:
+        """The unprocessed extraction result of ``url``, from the cache when it is fresh."""
+        key = extract_youtube_id(url) or url.strip()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._info.get(key)
+            if entry is not None and entry[0] > now:
+                self._info.move_to_end(key)
+                metrics.incr("youtube_info_cache_hits")
+                return entry[1]
+        metrics.incr("youtube_info_cache_misses")
+        started = time.perf_counter()
+        info = self._extractor().extract_info(url, download=False, process=False)
+        metrics.observe("youtube_extract_seconds", time.perf_counter() - started)
+        with self._lock:
+            self._info[key] = (time.monotonic() + self.info_ttl, info)
+            self._info.move_to_end(key)
+            while len(self._info) > self.max_info_entries:
+                self._info.popitem(last=False)
+        return info
+
+    def forget(self, url: str):
+        """Drops the cached extraction, e.g. after its format URLs stopped working."""
+        with self._lock:
+            self._info.pop(extract_youtube_id(url) or url.strip(), None)
+
+    def expected_size(self, url: str, section: Optional[Tuple[float, Optional[float]]] = None) -> Optional[int]:
+        """Bytes the download of ``url`` (or of its ``section``) should take; None when unknown."""
+        info = self.extract_info(url)
+        duration = info.get("duration")
+        requested = choose_formats(
+            info.get("formats") or [], self.settings, duration, can_merge=ffmpeg_path() is not None
+        )
+        size = sum(_size(f, duration) for f in requested)
+        if not requested or size == float("inf"):
+            return None
+        if section is not None and duration:
+            start, end = section
+            size *= max(min(end if end is not None else duration, duration) - start, 0) / duration
+        return int(size)
+
+    def _select(self, ctx: dict, duration: Optional[float] = None):
+        # yt-dlp format selector: yields the one (possibly merged) format to download. Its ctx only has the
+        # formats, so the duration (which sizes formats known by bitrate alone) is bound from the extraction
+        requested = choose_formats(
+            ctx.get("formats") or [], self.settings, duration, can_merge=ffmpeg_path() is not None
+        )
+        if not requested:
+            return
+        if len(requested) == 1:
+            yield requested[0]
+            return
+        video, audio = requested
+        logger.info(
+            f"Downloading format {video['format_id']}+{audio['format_id']} "
+            f"({video.get('height')}p, {audio.get('abr') or 0:.0f} kbit/s audio)"
+        )
+        yield {
+            "format_id": f"{video['format_id']}+{audio['format_id']}",
+            "ext": "mp4",
+            "requested_formats": requested,
+            "protocol": f"{video.get('protocol')}+{audio.get('protocol')}",
+        }
+
+    def download(
+        self,
+        url: str,
+        output_base: str,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        section: Optional[Tuple[float, Optional[float]]] = None,
+        params: Optional[dict] = None,
+    ) -> str:
+        """Downloads ``url`` to ``output_base`` plus the format's extension and returns that path.
+
+        With a ``section`` (start and end in seconds, no end meaning the end
+        of the video) only that time range is fetched; yt-dlp does that with
+        the ffmpeg on the PATH. ``params`` are passed on to yt-dlp.
+        """
+        info = self.extract_info(url)
+        options = {
+            "format": partial(self._select, duration=info.get("duration")),
+            "outtmpl": f"{output_base}.%(ext)s",
+            "merge_output_format": "mp4",
+            "concurrent_fragment_downloads": self.settings.concurrent_fragments,
+            "http_chunk_size": self.settings.http_chunk_size,
+            "progress_hooks": [on_progress] if on_progress is not None else [],
+            "quiet": True,
+            "no_warnings": True,
+            "noprogress": True,
+            # Merging and section downloads need ffmpeg; use the same binary as preprocessing
+            "ffmpeg_location": ffmpeg_path(),
+            **(params or {}),
+        }
+        if section is not None:
+            start, end = section
+            end = end if end is not None else info.get("duration") or float("inf")
+            options["download_ranges"] = download_range_func(None, [(start, end)])
+
+        started = time.perf_counter()
+        with yt_dlp.YoutubeDL(options) as ydl:
+            # Processed from a copy: yt-dlp annotates the info it downloads
+            result = ydl.process_ie_result(copy.deepcopy(info), download=True)
+        downloads = result.get("requested_downloads") or []
+        if not downloads or not downloads[0].get("filepath"):
+            raise RuntimeError("yt-dlp did not download any format")
+        path = downloads[0]["filepath"]
+        metrics.observe("youtube_download_seconds", time.perf_counter() - started)
+        return path
@@ -0,0 +1,114 @@
+import asyncio
+import copy
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# Per-subscriber buffer; a slow client only ever needs the newest progress events
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _offer(queue: asyncio.Queue, item):
+    # Drop the oldest event rather than blocking the publisher
+    if queue.full():
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(item)
+
+
+class PreviewBuffer:
+    """Sections of the analyses still being generated, kept in memory until their results are stored.
+
+    Streamed items would otherwise rewrite the whole analysis record each;
+    like the broker, the buffer is per process. Sections are grouped by
+    ``part`` ('video' or a segment label); ``reset`` drops a part's sections
+    when its request starts over, so a retry does not add them twice.
+    """
+
+    def __init__(self):
+        self._previews: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Seconds added to the timestamps of an analysis of a clip, whose model sees clip-relative time
+        self._offsets: Dict[str, float] = {}
+
+    def set_offset(self, analysis_id: str, seconds: float):
+        self._offsets[analysis_id] = seconds
+
+    def offset(self, analysis_id: str) -> float:
+        return self._offsets.get(analysis_id, 0.0)
+
+    def reset(self, analysis_id: str, part: str):
+        self._previews.get(analysis_id, {}).pop(part, None)
+
+    def add(self, analysis_id: str, part: str, event: tuple) -> Tuple[dict, int]:
+        """Records an IncrementalObjectParser event; returns its event-stream data and the part's member count."""
+        sections = self._previews.setdefault(analysis_id, {}).setdefault(part, {})
+        if event[0] == "item":
+            _, name, _, value = event
+            items = sections.setdefault(name, [])
+            items.append(value)
+            return {"part": part, "section": name, "index": len(items) - 1, "value": value}, len(sections)
+        _, name, value = event
+        sections[name] = value
+        return {"part": part, "section": name, "value": value}, len(sections)
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        return self._previews.get(analysis_id)
+
+    def copy(self, source_id: str, target_id: str):
+        preview = self._previews.get(source_id)
+        if preview is not None:
+            self._previews[target_id] = copy.deepcopy(preview)
+
+    def discard(self, analysis_id: str):
+        self._previews.pop(analysis_id, None)
+        self._offsets.pop(analysis_id, None)
+
+    def __len__(self) -> int:
+        return len(self._previews)
+
+
+class ProgressBroker:
+    """Fans progress events for an analysis out to its event-stream subscribers.
+
+    ``publish`` may be called from any thread (yt-dlp progress hooks run on the
+    download pool); events are handed to each subscriber's event loop.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, analysis_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[analysis_id].append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, analysis_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(analysis_id, [])
+            self._subscribers[analysis_id] = [s for s in subscribers if s[1] is not queue]
+            if not self._subscribers[analysis_id]:
+                del self._subscribers[analysis_id]
+
+    def has_subscribers(self, analysis_id: str) -> bool:
+        return analysis_id in self._subscribers
+
+    def publish(self, analysis_id: str, event: str, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(analysis_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, (event, data))
+            except RuntimeError as e:
+                # The subscriber's loop has already been closed
+                logger.debug(f"Dropping event for closed subscriber: {str(e)}")
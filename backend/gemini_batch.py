@@ -0,0 +1,289 @@
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from metrics import metrics
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta"
+# Batch jobs take minutes to hours; buckets are in seconds
+TURNAROUND_BUCKETS = [10, 30, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600, 24 * 3600]
+
+
+@dataclass
+class BatchEntry:
+    """One GenerateContentRequest in a batch; ``key`` matches it with its response."""
+    key: str
+    request: dict
+
+
+@dataclass
+class BatchOutcome:
+    text: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchStatus:
+    state: str  # 'pending', 'running', 'succeeded', 'failed'
+    outcomes: Dict[str, BatchOutcome] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("succeeded", "failed")
+
+
+class BatchService:
+    """Submits lists of requests for asynchronous, discounted processing."""
+
+    async def submit(self, model: str, entries: List[BatchEntry]) -> str:
+        raise NotImplementedError
+
+    async def status(self, name: str) -> BatchStatus:
+        raise NotImplementedError
+
+
+class GeminiBatchService(BatchService):
+    """Gemini Developer API batch mode (``models/*:batchGenerateContent``) with inline requests.
+
+    The installed google-genai SDK only exposes Vertex AI batch jobs (GCS or
+    BigQuery sources), so this talks to the REST endpoints directly.
+    """
+
+    def __init__(self, api_key: str, base_url: str = GEMINI_API_URL, timeout: float = 120.0):
+        self.base_url = base_url
+        self._http = httpx.AsyncClient(headers={"x-goog-api-key": api_key}, timeout=timeout)
+
+    async def submit(self, model: str, entries: List[BatchEntry]) -> str:
+        model = model if model.startswith("models/") else f"models/{model}"
+        body = {
+            "batch": {
+                "display_name": f"truthscope-{int(time.time())}",
+                "input_config": {
+                    "requests": {
+                        "requests": [
+                            {"request": entry.request, "metadata": {"key": entry.key}} for entry in entries
+                        ]
+                    }
+                },
+            }
+        }
+        response = await self._http.post(f"{self.base_url}/{model}:batchGenerateContent", json=body)
+        response.raise_for_status()
+        operation = response.json()
+        return operation.get("metadata", {}).get("name") or operation["name"]
+
+    async def status(self, name: str) -> BatchStatus:
+        response = await self._http.get(f"{self.base_url}/{name}")
+        response.raise_for_status()
+        operation = response.json()
+        # Either the long-running operation wrapping the batch or the batch itself
+        batch = operation.get("metadata", operation)
+        state = batch.get("state", "")
+        if state in ("BATCH_STATE_PENDING", "JOB_STATE_PENDING", "JOB_STATE_QUEUED"):
+            return BatchStatus("pending")
+        if state in ("BATCH_STATE_RUNNING", "JOB_STATE_RUNNING"):
+            return BatchStatus("running")
+        if state not in ("BATCH_STATE_SUCCEEDED", "JOB_STATE_SUCCEEDED"):
+            error = (operation.get("error") or batch.get("error") or {}).get("message", state)
+            return BatchStatus("failed", error=error)
+
+        output = operation.get("response") or batch.get("output") or {}
+        inlined = output.get("inlinedResponses", {})
+        if isinstance(inlined, dict):
+            inlined = inlined.get("inlinedResponses", [])
+        outcomes = {}
+        for item in inlined:
+            key = (item.get("metadata") or {}).get("key")
+            if key is None:
+                continue
+            if "error" in item:
+                outcomes[key] = BatchOutcome(error=item["error"].get("message", "Request failed"))
+                continue
+            candidates = (item.get("response") or {}).get("candidates") or []
+            parts = (candidates[0].get("content") or {}).get("parts", []) if candidates else []
+            text = "".join(part.get("text", "") for part in parts)
+            outcomes[key] = BatchOutcome(text=text) if text else BatchOutcome(error="Empty response")
+        return BatchStatus("succeeded", outcomes)
+
+
+class FakeBatchService(BatchService):
+    """Local stand-in that answers each request through ``respond`` after ``delay`` seconds.
+
+    Lets the offline mode be exercised without a Gemini batch quota, e.g. with
+    the stub client from ``benchmarks/``.
+    """
+
+    def __init__(self, respond: Callable[[dict], Awaitable[str]], delay: float = 1.0):
+        self.respond = respond
+        self.delay = delay
+        self._ids = itertools.count(1)
+        self._batches: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, model: str, entries: List[BatchEntry]) -> str:
+        name = f"batches/fake-{next(self._ids)}"
+        self._batches[name] = asyncio.create_task(self._run(entries))
+        return name
+
+    async def _run(self, entries: List[BatchEntry]) -> Dict[str, BatchOutcome]:
+        await asyncio.sleep(self.delay)
+        outcomes = {}
+        for entry in entries:
+            try:
+                outcomes[entry.key] = BatchOutcome(text=await self.respond(entry.request))
+            except Exception as e:
+                outcomes[entry.key] = BatchOutcome(error=str(e))
+        return outcomes
+
+    async def status(self, name: str) -> BatchStatus:
+        task = self._batches.get(name)
+        if task is None:
+            return BatchStatus("failed", error=f"Unknown batch {name}")
+        if not task.done():
+            return BatchStatus("running")
+        del self._batches[name]
+        return BatchStatus("succeeded", task.result())
+
+
+class OfflineBatcher:
+    """Collects analysis requests and sends them to a ``BatchService`` in bulk.
+
+    A batch is submitted once ``max_batch_size`` requests are pending or the
+    oldest has waited ``max_wait`` seconds. Submitted batches are polled every
+    ``poll_interval`` seconds and each caller's future is resolved with its
+    ``BatchOutcome``. ``on_submitted`` is told the name of each batch and its
+    entries, so that a batch can be ``resume``d after a restart.
+    """
+
+    def __init__(
+        self,
+        service: BatchService,
+        model: str,
+        max_batch_size: int = 100,
+        max_wait: float = 300.0,
+        poll_interval: float = 30.0,
+        on_submitted: Optional[Callable[[str, List[BatchEntry]], None]] = None,
+    ):
+        self.service = service
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.on_submitted = on_submitted
+        self._pending: List[tuple] = []
+        self._first_pending_at: Optional[float] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: set = set()
+        self._collector: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def start(self):
+        if self._collector is None:
+            self._wakeup = asyncio.Event()
+            self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        tasks = [t for t in [self._collector, *self._tasks] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._collector = None
+        self._tasks.clear()
+
+    def add(self, entries: List[BatchEntry]) -> List[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for entry in entries:
+            future = loop.create_future()
+            self._pending.append((entry, future))
+            futures.append(future)
+        if self._first_pending_at is None:
+            self._first_pending_at = time.monotonic()
+        metrics.incr("offline_batch_requests", len(entries))
+        self._wakeup.set()
+        return futures
+
+    def resume(self, name: str, keys: List[str]) -> List[asyncio.Future]:
+        """Polls a batch submitted by an earlier run again; returns a future per request key, like ``add``."""
+        loop = asyncio.get_running_loop()
+        batch = [(BatchEntry(key, {}), loop.create_future()) for key in keys]
+        task = asyncio.create_task(self._run_batch(batch, name))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        metrics.incr("offline_batches_resumed")
+        return [future for _, future in batch]
+
+    async def _collect(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            waited = time.monotonic() - self._first_pending_at
+            if len(self._pending) < self.max_batch_size and waited < self.max_wait:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_wait - waited)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            self._first_pending_at = time.monotonic() if self._pending else None
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[tuple], name: Optional[str] = None):
+        """Submits the batch (unless it is a resumed one, ``name``), polls it and resolves its futures."""
+        entries = [entry for entry, _ in batch]
+        resumed = name is not None
+        submitted = time.monotonic()
+        try:
+            if not resumed:
+                name = await self.service.submit(self.model, entries)
+                metrics.incr("offline_batches_submitted")
+                metrics.observe("offline_batch_size", len(entries), [1, 5, 10, 25, 50, 100, 250, 500, 1000])
+                logger.info(f"Submitted batch {name} with {len(entries)} requests")
+                if self.on_submitted is not None:
+                    try:
+                        self.on_submitted(name, entries)
+                    except Exception as e:
+                        # The batch runs all the same; only resuming it after a restart is lost
+                        logger.error(f"Could not record batch {name}: {str(e)}")
+            else:
+                logger.info(f"Resuming batch {name} with {len(entries)} requests")
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                status = await self.service.status(name)
+                if status.done:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Offline batch failed: {str(e)}")
+            status = BatchStatus("failed", error=str(e))
+
+        if not resumed:
+            # A resumed batch was submitted before the restart, at an unknown time
+            metrics.observe("offline_batch_turnaround_seconds", time.monotonic() - submitted, TURNAROUND_BUCKETS)
+        if status.state == "failed":
+            metrics.incr("offline_batches_failed")
+        for entry, future in batch:
+            if future.done():
+                continue
+            outcome = status.outcomes.get(entry.key) or BatchOutcome(error=status.error or "Missing from batch output")
+            future.set_result(outcome)
@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from loguru import logger
+
+from cache import CacheBackend
+from metrics import metrics
+
+# Gemini deletes uploaded files after 48 hours; used when the API omits the expiry
+DEFAULT_FILE_LIFETIME = timedelta(hours=48)
+# Files this close to expiring are re-uploaded rather than reused mid-analysis
+EXPIRY_MARGIN = timedelta(minutes=30)
+
+
+class GeminiFileRegistry:
+    """Maps a content ID (upload hash or YouTube ID) to the Gemini file already holding it.
+
+    Only the mapping lives here; callers re-validate the file with one
+    ``files.get`` and call ``discard`` when it turns out to be gone or FAILED.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def lookup(self, content_id: str) -> Optional[str]:
+        raw = self.backend.get(content_id)
+        if raw is None:
+            metrics.incr("gemini_file_registry_misses")
+            return None
+        entry = json.loads(raw)
+        expires_at = datetime.fromisoformat(entry["expires_at"])
+        if expires_at - EXPIRY_MARGIN <= datetime.now(timezone.utc):
+            logger.info(f"Registered Gemini file {entry['name']} is about to expire, dropping it")
+            self.backend.delete(content_id)
+            metrics.incr("gemini_file_registry_misses")
+            return None
+        metrics.incr("gemini_file_registry_hits")
+        return entry["name"]
+
+    def register(self, content_id: str, gemini_file):
+        expires_at = getattr(gemini_file, "expiration_time", None)
+        if expires_at is None:
+            expires_at = datetime.now(timezone.utc) + DEFAULT_FILE_LIFETIME
+        elif expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        self.backend.set(content_id, json.dumps({
+            "name": gemini_file.name,
+            "expires_at": expires_at.isoformat(),
+        }))
+
+    def discard(self, content_id: str):
+        self.backend.delete(content_id)
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+from metrics import metrics
+
+# Seconds from upload to ACTIVE; short clips land in the sub-second buckets
+TIME_TO_ACTIVE_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300, 600, 1200]
+
+
+class FileProcessingError(Exception):
+    """Gemini failed to process a file, or did not finish before the deadline."""
+
+
+class FileActivationPoller:
+    """Waits for uploaded Gemini files to leave the PROCESSING state.
+
+    Polling starts at ``initial_interval`` and backs off by ``multiplier`` up to
+    ``max_interval``, so small files are picked up almost as soon as they are
+    ready while long ones do not hammer the API. The deadline grows with the
+    file size (and the video duration when Gemini reports it). Concurrent
+    waiters on the same file share one polling loop.
+    """
+
+    def __init__(
+        self,
+        get_file: Callable[[str], Awaitable],
+        initial_interval: float = 0.25,
+        max_interval: float = 5.0,
+        multiplier: float = 1.6,
+        base_timeout: float = 60.0,
+        seconds_per_mb: float = 1.0,
+        max_timeout: float = 1800.0,
+    ):
+        self.get_file = get_file
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.base_timeout = base_timeout
+        self.seconds_per_mb = seconds_per_mb
+        self.max_timeout = max_timeout
+        self._waits: Dict[str, asyncio.Task] = {}
+
+    def deadline_for(self, file_info, size_bytes: Optional[int] = None) -> float:
+        """Seconds to wait for a file before giving up."""
+        size_bytes = size_bytes or getattr(file_info, "size_bytes", None) or 0
+        timeout = self.base_timeout + self.seconds_per_mb * size_bytes / (1024 * 1024)
+        duration = video_duration(file_info)
+        if duration:
+            # Processing time also tracks the running time of the video
+            timeout = max(timeout, self.base_timeout + duration / 2)
+        return min(timeout, self.max_timeout)
+
+    async def wait(self, file_info, size_bytes: Optional[int] = None):
+        """Returns the file once it is ACTIVE; raises FileProcessingError otherwise."""
+        if getattr(file_info, "state", None) == "ACTIVE":
+            return file_info
+        name = file_info.name
+        task = self._waits.get(name)
+        if task is None:
+            task = asyncio.create_task(self._poll(file_info, self.deadline_for(file_info, size_bytes)))
+            self._waits[name] = task
+            task.add_done_callback(lambda _: self._waits.pop(name, None))
+        else:
+            metrics.incr("gemini_poll_shared_waits")
+            logger.info(f"Joining in-progress wait for Gemini file {name}")
+        # A cancelled waiter must not cancel the loop other jobs are waiting on
+        return await asyncio.shield(task)
+
+    @property
+    def in_progress(self) -> int:
+        return len(self._waits)
+
+    async def _poll(self, file_info, timeout: float):
+        name = file_info.name
+        started = time.monotonic()
+        interval = self.initial_interval
+        polls = 0
+        while True:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                metrics.incr("gemini_poll_timeouts")
+                logger.error(f"Gemini file {name} was not ACTIVE after {timeout:.0f}s")
+                raise FileProcessingError("File processing timeout")
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * self.multiplier, self.max_interval)
+
+            file_info = await self.get_file(name)
+            polls += 1
+            metrics.incr("gemini_poll_requests")
+            state = getattr(file_info, "state", None)
+            if state == "ACTIVE":
+                elapsed = time.monotonic() - started
+                metrics.observe("gemini_time_to_active_seconds", elapsed, TIME_TO_ACTIVE_BUCKETS)
+                metrics.observe("gemini_polls_per_file", polls, [1, 2, 4, 8, 16, 32, 64])
+                logger.info(f"Gemini file {name} ACTIVE after {elapsed:.1f}s ({polls} polls)")
+                return file_info
+            if state == "FAILED":
+                metrics.incr("gemini_processing_failures")
+                logger.error(f"Gemini failed to process file {name}")
+                raise FileProcessingError("File processing failed")
+            logger.debug(f"Gemini file {name} still {state}, next check in {interval:.1f}s")
+
+
+def video_duration(file_info) -> Optional[float]:
+    """Parses the duration Gemini reports for a processed video file, e.g. "123.4s"."""
+    video_metadata = getattr(file_info, "video_metadata", None) or {}
+    duration = video_metadata.get("videoDuration") or video_metadata.get("video_duration")
+    if isinstance(duration, str) and duration.endswith("s"):
+        try:
+            return float(duration[:-1])
+        except ValueError:
+            return None
+    return None
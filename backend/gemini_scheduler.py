@@ -0,0 +1,215 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from loguru import logger
+
+from metrics import metrics
+
+T = TypeVar("T")
+
+# HTTP codes Gemini returns when a quota is exhausted or the service is overloaded
+RETRYABLE_CODES = {429, 503}
+WAIT_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+
+@dataclass(frozen=True)
+class OperationLimits:
+    """Quota for one kind of Gemini call; 0 disables a limit."""
+    requests_per_minute: float = 0
+    tokens_per_minute: float = 0
+    concurrency: int = 0
+
+
+class TokenBucket:
+    """Refills continuously at ``per_minute / 60`` per second up to one minute's worth.
+
+    The balance may go negative when a caller reports that a request used more
+    than it reserved; later callers then wait for the debt to be paid back.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        # Requests larger than the bucket go through once it is full
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+    def adjust(self, amount: float):
+        """Charges (or refunds, when negative) tokens outside of ``acquire``."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - amount)
+
+    def drain(self):
+        """Empties the bucket after the server reported the quota is exhausted."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+
+class FairSlots:
+    """Concurrency limit that hands out free slots round-robin across clients.
+
+    One client submitting a burst of jobs only gets every other slot while
+    anybody else is waiting, instead of starving them in FIFO order.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_use = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._waiters.values())
+
+    async def acquire(self, client_id: str):
+        if self.limit <= 0 or (self._in_use < self.limit and not self._waiters):
+            self._in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            else:
+                self._remove(client_id, future)
+            raise
+
+    def release(self):
+        self._in_use -= 1
+        while self._waiters:
+            client_id, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            # Rotate: the client goes to the back of the line
+            del self._waiters[client_id]
+            if queue:
+                self._waiters[client_id] = queue
+            if not future.done():
+                self._in_use += 1
+                future.set_result(None)
+                return
+
+    def _remove(self, client_id: str, future: asyncio.Future):
+        queue = self._waiters.get(client_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiters[client_id]
+
+
+class _Operation:
+    def __init__(self, limits: OperationLimits):
+        self.slots = FairSlots(limits.concurrency)
+        self.requests = TokenBucket(limits.requests_per_minute) if limits.requests_per_minute else None
+        self.tokens = TokenBucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+
+
+class GeminiScheduler:
+    """Admits Gemini calls within per-operation quotas and retries rate-limit errors.
+
+    Each operation (e.g. ``generate_content``, ``upload``) has its own
+    request and token buckets and concurrency limit. Calls that fail with a
+    429 or 503 are retried with full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, OperationLimits],
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 60.0,
+    ):
+        self.limits = limits
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._operations: Dict[str, _Operation] = {}
+
+    def _operation(self, name: str) -> _Operation:
+        # Built lazily so the asyncio primitives belong to the serving event loop
+        if name not in self._operations:
+            self._operations[name] = _Operation(self.limits.get(name, OperationLimits()))
+        return self._operations[name]
+
+    def queue_depth(self, name: str) -> int:
+        operation = self._operations.get(name)
+        return operation.slots.waiting if operation else 0
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {name: op.slots.waiting for name, op in self._operations.items()}
+
+    async def call(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[T]],
+        client_id: str = "",
+        tokens: float = 0,
+        used_tokens: Optional[Callable[[T], Optional[float]]] = None,
+    ) -> T:
+        """Runs ``fn`` once admitted; ``tokens`` is the estimated token cost.
+
+        ``used_tokens`` may read the actual cost from the result so that the
+        token bucket is corrected for the estimate's error.
+        """
+        operation = self._operation(name)
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            await operation.slots.acquire(client_id)
+            try:
+                if operation.requests is not None:
+                    await operation.requests.acquire()
+                if operation.tokens is not None and tokens:
+                    await operation.tokens.acquire(tokens)
+                metrics.observe(f"gemini_{name}_wait_seconds", time.monotonic() - queued, WAIT_BUCKETS)
+                metrics.incr(f"gemini_{name}_calls")
+                try:
+                    result = await fn()
+                except Exception as e:
+                    if getattr(e, "code", None) not in RETRYABLE_CODES or attempt >= self.max_retries:
+                        raise
+                    metrics.incr(f"gemini_{name}_rate_limited")
+                    # Everybody else is about to hit the same wall
+                    if operation.requests is not None:
+                        operation.requests.drain()
+                    delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                    logger.warning(
+                        f"Gemini {name} returned {e.code}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                    )
+                else:
+                    if used_tokens is not None and operation.tokens is not None:
+                        actual = used_tokens(result)
+                        if actual is not None:
+                            operation.tokens.adjust(actual - tokens)
+                    return result
+            finally:
+                operation.slots.release()
+            attempt += 1
+            metrics.incr(f"gemini_{name}_retries")
+            await asyncio.sleep(delay)
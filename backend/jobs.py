@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from workspace import JobDirectory
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the pending queue is at capacity."""
+
+
+@dataclass
+class AnalysisJob:
+    analysis_id: str
+    file_path: Optional[str] = None
+    youtube_url: Optional[str] = None
+    # Upload hash or YouTube video ID identifying the video itself
+    content_id: Optional[str] = None
+    cache_key: Optional[str] = None
+    # Who submitted the job; Gemini capacity is shared fairly between clients
+    client_id: str = ""
+    # Analyze through Gemini batch mode instead of interactive calls
+    offline: bool = False
+    # Start and end (None: the end of the video) in seconds of the only part of a YouTube video to analyze
+    section: Optional[Tuple[float, Optional[float]]] = None
+    # Scratch directory holding file_path and everything derived from it; removed with them
+    workspace: Optional[JobDirectory] = None
+    # Speaker turns being extracted from the local file while it is uploaded
+    audio: Optional[asyncio.Future] = None
+    # Whether that extraction ran to completion, i.e. the result is the one AUDIO_SIGNATURE describes
+    audio_analyzed: bool = False
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+JobHandler = Callable[[AnalysisJob], Awaitable[None]]
+
+
+class InFlightJobs:
+    """Single-flight registry: at most one running job per analysis cache key.
+
+    The cache key is derived from the canonical video (YouTube video ID or
+    upload hash) and everything else that decides the result, so a job for a
+    video that is already being analyzed would only repeat the download,
+    upload and Gemini calls. Instead its analysis follows the running job:
+    every state update of the running job is applied to its followers too.
+
+    ``followers`` is called from download threads (progress hooks), hence the
+    lock. Per process: with several uvicorn workers each runs its own leader.
+    """
+
+    def __init__(self):
+        self._leaders: Dict[str, AnalysisJob] = {}
+        # Leader analysis ID -> (cache key, follower analysis IDs)
+        self._followers: Dict[str, Tuple[str, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, job: AnalysisJob) -> Optional[AnalysisJob]:
+        """Returns the running job ``job`` now follows, or None when ``job`` is the first and should run."""
+        if not job.cache_key:
+            return None
+        with self._lock:
+            leader = self._leaders.get(job.cache_key)
+            if leader is None:
+                self._leaders[job.cache_key] = job
+                self._followers[job.analysis_id] = (job.cache_key, [])
+                return None
+            self._followers[leader.analysis_id][1].append(job.analysis_id)
+            return leader
+
+    def followers(self, analysis_id: str) -> List[str]:
+        with self._lock:
+            entry = self._followers.get(analysis_id)
+            return list(entry[1]) if entry is not None else []
+
+    def release(self, analysis_id: str) -> List[str]:
+        """Ends the run of the leader ``analysis_id`` and returns its followers; later jobs run again."""
+        with self._lock:
+            entry = self._followers.pop(analysis_id, None)
+            if entry is None:
+                return []
+            cache_key, followers = entry
+            leader = self._leaders.get(cache_key)
+            if leader is not None and leader.analysis_id == analysis_id:
+                del self._leaders[cache_key]
+            return followers
+
+    @property
+    def following(self) -> int:
+        with self._lock:
+            return sum(len(followers) for _, followers in self._followers.values())
+
+    def __len__(self) -> int:
+        return len(self._leaders)
+
+
+class JobQueue:
+    """Bounded queue of analysis jobs drained by a fixed pool of asyncio workers.
+
+    Throughput is controlled by ``workers``; ``max_pending`` bounds how many jobs
+    may wait so that a burst of submissions is rejected instead of piling up.
+    Batch jobs (``put``) wait in a lane of their own, bounded by
+    ``max_batch_pending``, and are only picked up when no submitted job is
+    waiting, so a large batch never fills the queue interactive requests use.
+    """
+
+    def __init__(self, handler: JobHandler, workers: int = 2, max_pending: int = 100, max_batch_pending: int = 10):
+        self._handler = handler
+        self._workers = max(1, workers)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._batch: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_batch_pending))
+        # Counts the jobs waiting in either queue
+        self._ready = asyncio.Semaphore(0)
+        self._tasks: List[asyncio.Task] = []
+        self._active = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def batch_pending(self) -> int:
+        return self._batch.qsize()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    async def start(self):
+        if self._tasks:
+            return
+        for index in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Started {self._workers} analysis workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        logger.info("Analysis workers stopped")
+
+    async def join(self):
+        """Waits until every submitted job has been processed."""
+        while self._queue.qsize() or self._batch.qsize() or self._active:
+            await self._queue.join()
+            await self._batch.join()
+
+    def submit(self, job: AnalysisJob):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Analysis queue is full, try again later")
+        self._ready.release()
+        logger.info(f"Queued job {job.analysis_id} (pending: {self.pending})")
+
+    async def put(self, job: AnalysisJob):
+        """Queues a batch job in the batch lane, waiting for room instead of failing."""
+        await self._batch.put(job)
+        job.enqueued_at = time.monotonic()
+        self._ready.release()
+        logger.info(f"Queued batch job {job.analysis_id} (batch pending: {self.batch_pending})")
+
+    async def _worker(self, index: int):
+        while True:
+            await self._ready.acquire()
+            queue = self._queue if not self._queue.empty() else self._batch
+            job = queue.get_nowait()
+            self._active += 1
+            waited = time.monotonic() - job.enqueued_at
+            logger.info(f"Worker {index} picked up {job.analysis_id} after {waited:.2f}s in queue")
+            try:
+                await self._handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The handler is responsible for recording failures on the job state;
+                # this only keeps a misbehaving handler from killing the worker.
+                logger.error(f"Unhandled error in job {job.analysis_id}: {str(e)}")
+            finally:
+                self._active -= 1
+                queue.task_done()
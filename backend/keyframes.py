@@ -0,0 +1,290 @@
+"""Local keyframe selection, for analyzing a video without uploading it.
+
+The video is decoded once, at a low frame rate: every sample is written out as
+a small JPEG and compared, at a tiny resolution, with the one before it. The
+mean absolute differences (computed with NumPy, a chunk of frames at a time)
+mark shot changes as isolated spikes and action as sustained motion. A budget
+of frames is spent on those moments first and on filling the longest stretches
+without a frame second; only those JPEGs are kept.
+"""
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from preprocess import ffmpeg_path
+
+try:
+    import numpy as np
+except ImportError:  # Optional; keyframe input is disabled without it
+    np = None
+
+# Samples are compared at this size; enough to tell shots and motion apart
+DIFF_WIDTH = 64
+DIFF_HEIGHT = 36
+# Samples decoded and compared at once, bounding the memory used by long videos
+DIFF_CHUNK_FRAMES = 1024
+
+
+@dataclass(frozen=True)
+class KeyframeSettings:
+    """How many frames are sent and how they are chosen and encoded."""
+    max_frames: int = 32
+    sample_fps: float = 2.0  # Rate at which the video is scanned for changes
+    scene_threshold: float = 0.12  # Mean absolute difference (0-1) between samples that can be a cut
+    scene_contrast: float = 3.0  # ... and how many times the surrounding differences a cut must be
+    min_gap: float = 2.0  # Seconds between two selected frames
+    coverage_share: float = 0.25  # Part of the budget kept for the longest stretches without a frame
+    # Gemini bills 258 tokens for an image that fits in 384x384 and tiles larger ones
+    max_size: int = 384
+    jpeg_quality: int = 4  # ffmpeg -q:v, 2 (best) to 31
+    keep_audio: bool = True
+    audio_bitrate: str = "16k"
+
+    def signature(self) -> str:
+        # Part of cache keys: other frames are a different Gemini input
+        audio = f"a{self.audio_bitrate}" if self.keep_audio else "noaudio"
+        return (
+            f"kf{self.max_frames}-f{self.sample_fps:g}-cut{self.scene_threshold:g}-{self.scene_contrast:g}"
+            f"-gap{self.min_gap:g}-cov{self.coverage_share:g}-s{self.max_size}-q{self.jpeg_quality}-{audio}"
+        )
+
+
+@dataclass(frozen=True)
+class Keyframe:
+    time: float
+    reason: str  # 'start', 'scene', 'motion' or 'coverage'
+    image: bytes  # JPEG
+
+
+@dataclass
+class KeyframeSample:
+    """What is sent to Gemini instead of the video."""
+    duration: float
+    frames: List[Keyframe] = field(default_factory=list)
+    soundtrack: Optional[bytes] = None  # Ogg/Opus
+    seconds: float = 0.0  # Time spent decoding, selecting and encoding
+
+    @property
+    def size(self) -> int:
+        return sum(len(frame.image) for frame in self.frames) + len(self.soundtrack or b"")
+
+
+def keyframes_available() -> bool:
+    return np is not None and ffmpeg_path() is not None
+
+
+def _scale_filter(max_size: int) -> str:
+    # Fit inside max_size x max_size, never upscaling
+    return f"scale='min({max_size},iw)':'min({max_size},ih)':force_original_aspect_ratio=decrease"
+
+
+def frame_path(frames_dir: str, index: int) -> str:
+    # ffmpeg numbers the images it writes from 1
+    return os.path.join(frames_dir, f"{index + 1:06d}.jpg")
+
+
+def scan_video(path: str, settings: KeyframeSettings, frames_dir: str) -> "np.ndarray":
+    """Decodes the video once at ``sample_fps``.
+
+    Returns the mean absolute difference (0-1) of every sample to the one
+    before it (0 for the first) and writes every sample to ``frames_dir`` as a
+    JPEG ready to be sent (see ``frame_path``).
+    """
+    binary = ffmpeg_path()
+    if not binary:
+        raise RuntimeError("ffmpeg is not installed")
+    process = subprocess.Popen(
+        [
+            binary, "-hide_banner", "-loglevel", "error",
+            "-i", path,
+            "-an", "-sn",
+            "-filter_complex",
+            f"[0:v]fps={settings.sample_fps:g},split=2[small][large];"
+            f"[small]scale={DIFF_WIDTH}:{DIFF_HEIGHT},format=gray[diff];"
+            f"[large]{_scale_filter(settings.max_size)}[jpeg]",
+            "-map", "[diff]", "-f", "rawvideo", "-",
+            "-map", "[jpeg]", "-q:v", str(settings.jpeg_quality), os.path.join(frames_dir, "%06d.jpg"),
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    frame_bytes = DIFF_WIDTH * DIFF_HEIGHT
+    chunks = []
+    previous = None
+    while True:
+        data = process.stdout.read(DIFF_CHUNK_FRAMES * frame_bytes)
+        count = len(data) // frame_bytes
+        if count == 0:
+            break
+        frames = np.frombuffer(data, dtype=np.uint8, count=count * frame_bytes).reshape(count, -1).astype(np.int16)
+        if previous is None:
+            chunks.append(np.zeros(1, dtype=np.float32))
+            differences = np.abs(np.diff(frames, axis=0))
+        else:
+            differences = np.abs(np.diff(np.concatenate([previous[None], frames]), axis=0))
+        chunks.append(differences.mean(axis=1, dtype=np.float32) / 255.0)
+        previous = frames[-1]
+    stderr = process.stderr.read().decode(errors="replace").strip()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr[-500:]}")
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+
+def _window(values: "np.ndarray", radius: int, pad: float) -> "np.ndarray":
+    """Every value's neighborhood of ``radius`` samples on either side, as rows."""
+    padded = np.pad(values, radius, constant_values=pad)
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1)
+
+
+def scene_cuts(differences: "np.ndarray", settings: KeyframeSettings) -> "np.ndarray":
+    """Samples that start a new shot: a large difference well above the ones around it.
+
+    Camera motion changes every sample a bit, a cut changes one sample a lot.
+    """
+    if len(differences) < 3:
+        return np.zeros(0, dtype=int)
+    radius = max(1, round(settings.sample_fps * settings.min_gap / 2))
+    neighborhood = _window(differences, radius, np.nan)
+    # The median around a sample, leaving the sample itself out
+    surroundings = np.nanmedian(np.delete(neighborhood, radius, axis=1), axis=1)
+    is_cut = (
+        (differences >= settings.scene_threshold)
+        & (differences >= settings.scene_contrast * surroundings)
+        & (differences >= np.nanmax(neighborhood, axis=1))
+    )
+    is_cut[0] = False
+    return np.flatnonzero(is_cut)
+
+
+def motion_peaks(
+    differences: "np.ndarray", cuts: "np.ndarray", settings: KeyframeSettings
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Samples at the height of a stretch of above-typical motion, and its strength."""
+    if len(differences) < 3:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+    # Cuts are single huge differences, not motion
+    steady = differences.copy()
+    steady[cuts] = 0.0
+    width = max(1, round(settings.sample_fps))
+    motion = np.convolve(steady, np.ones(width, dtype=np.float32) / width, mode="same")
+    radius = max(1, round(settings.sample_fps * settings.min_gap / 2))
+    is_peak = (motion >= np.max(_window(motion, radius, -np.inf), axis=1)) & (motion > np.median(motion))
+    peaks = np.flatnonzero(is_peak)
+    return peaks, motion[peaks]
+
+
+def select_keyframes(differences: "np.ndarray", settings: KeyframeSettings) -> List[Tuple[int, str]]:
+    """Picks at most ``max_frames`` samples, at least ``min_gap`` apart, in video order.
+
+    The opening shot, cuts (by strength) and motion peaks come first, until
+    ``coverage_share`` of the budget is left; that goes to the middle of the
+    longest stretches without a frame; what is left after that to the
+    remaining cuts and peaks.
+    """
+    count = len(differences)
+    if count == 0:
+        return []
+    budget = min(settings.max_frames, count)
+    gap = max(1, round(settings.min_gap * settings.sample_fps))
+    # Show a new shot a moment after the cut, past any dissolve
+    settle = round(settings.sample_fps / 2)
+
+    cuts = scene_cuts(differences, settings)
+    peaks, strengths = motion_peaks(differences, cuts, settings)
+    events = [(float("inf"), 0, "start")]
+    events += [(1.0 + float(differences[cut]), min(int(cut) + settle, count - 1), "scene") for cut in cuts]
+    events += [(float(strength), int(peak), "motion") for peak, strength in zip(peaks, strengths)]
+    events.sort(key=lambda event: -event[0])
+
+    chosen = {}
+
+    def add_events(limit: int):
+        for _, index, reason in events:
+            if len(chosen) >= limit:
+                return
+            if index not in chosen and all(abs(index - other) >= gap for other in chosen):
+                chosen[index] = reason
+
+    add_events(budget - round(budget * settings.coverage_share))
+    while len(chosen) < budget:
+        bounds = sorted(chosen) + [count]
+        start, end = max(zip(bounds, bounds[1:]), key=lambda pair: pair[1] - pair[0])
+        if end - start < 2 * gap:
+            break
+        chosen[(start + end) // 2] = "coverage"
+    add_events(budget)
+    return sorted(chosen.items())
+
+
+def extract_soundtrack(path: str, bitrate: str) -> Optional[bytes]:
+    """The soundtrack as mono Ogg/Opus at ``bitrate``; None when the file has no audio."""
+    completed = subprocess.run(
+        [
+            ffmpeg_path(), "-hide_banner", "-loglevel", "error",
+            "-i", path,
+            "-vn", "-sn", "-ac", "1",
+            # The fastest setting costs a few percent in size and is several times quicker
+            "-c:a", "libopus", "-b:a", bitrate, "-application", "voip", "-compression_level", "0",
+            "-f", "ogg", "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if completed.returncode != 0:
+        stderr = completed.stderr.decode(errors="replace").strip()
+        if "does not contain any stream" in stderr or "matches no streams" in stderr:
+            return None
+        raise RuntimeError(f"ffmpeg failed: {stderr[-500:]}")
+    return completed.stdout or None
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def sample_keyframes(path: str, settings: KeyframeSettings) -> KeyframeSample:
+    """Blocking; selects and encodes the keyframes of ``path`` (and its soundtrack).
+
+    The candidate JPEGs go to a temporary directory next to the video.
+    """
+    started = time.perf_counter()
+    workdir = os.path.dirname(path) or None
+    with ThreadPoolExecutor(max_workers=1) as pool, tempfile.TemporaryDirectory(dir=workdir) as frames_dir:
+        # Encoded while the frames are scanned
+        encoding = pool.submit(extract_soundtrack, path, settings.audio_bitrate) if settings.keep_audio else None
+        differences = scan_video(path, settings, frames_dir)
+        if len(differences) == 0:
+            raise RuntimeError(f"{os.path.basename(path)} has no video frames")
+        selected = select_keyframes(differences, settings)
+        times = [index / settings.sample_fps for index, _ in selected]
+        images = [_read(frame_path(frames_dir, index)) for index, _ in selected]
+
+        soundtrack = None
+        try:
+            soundtrack = encoding.result() if encoding is not None else None
+        except RuntimeError as e:
+            logger.warning(f"Could not encode the soundtrack, sending the frames alone: {str(e)}")
+
+    sample = KeyframeSample(
+        duration=len(differences) / settings.sample_fps,
+        frames=[
+            Keyframe(seconds, reason, image)
+            for seconds, (_, reason), image in zip(times, selected, images)
+        ],
+        soundtrack=soundtrack,
+    )
+    sample.seconds = time.perf_counter() - started
+    reasons = {reason: sum(1 for _, r in selected if r == reason) for _, reason in selected}
+    logger.info(
+        f"Keyframes of {os.path.basename(path)}: {len(sample.frames)} "
+        f"({', '.join(f'{n} {reason}' for reason, n in reasons.items())}), {sample.size} bytes "
+        f"in {sample.seconds:.1f}s"
+    )
+    return sample
@@ -0,0 +1,169 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+
+class ProcessingStep(BaseModel):
+    step: str
+    status: str  # 'pending', 'in_progress', 'complete', 'error'
+    message: str
+    progress: float
+
+class AnalysisState(BaseModel):
+    status: str
+    progress: float
+    message: str
+    timestamp: datetime
+    steps: List[ProcessingStep] = []
+
+# Field descriptions are sent to Gemini as part of the response schema
+class AnalysisDetail(BaseModel):
+    emotion: str
+    confidence: float = Field(description="0-1")
+    description: Optional[str] = Field(None, description="Detailed description")
+    intensity: Optional[float] = None
+    context: Optional[str] = None
+    timeMarkers: Optional[List[str]] = Field(None, description="Timestamps, e.g. '01:23'")
+    truthfulnessScore: Optional[float] = None
+
+class DeceptionIndicator(BaseModel):
+    type: str
+    description: str
+    confidence: float = Field(description="0-1")
+    timestamp: float = Field(description="Seconds from the start of the video")
+
+class ConfidenceMetric(BaseModel):
+    level: float = Field(description="0-1")
+    description: str
+    context: str
+    timestamp: float = Field(description="Seconds from the start of the video")
+
+class KeyStrength(BaseModel):
+    title: str
+    description: str
+    confidence: float
+
+# Updated model to allow an optional timestamp field in areas of note
+class AreaOfNote(BaseModel):
+    title: str
+    description: str
+    significance: str
+    timestamp: Optional[float] = None
+
+class QuestionResponse(BaseModel):
+    responseStyle: str
+    topicHandling: str
+    behavioralPatterns: List[str]
+
+class TimelineEvent(BaseModel):
+    timestamp: float = Field(description="Seconds from the start of the video")
+    description: str
+
+# New model: captures which question(s) impacted mood
+class QuestionImpact(BaseModel):
+    question: str = Field(description="The text or a summary of the question")
+    timestamp: float = Field(description="Seconds from the start of the video when the question was asked")
+    moodChange: str = Field(description="e.g. 'nervous', 'confident', 'neutral'")
+    analysis: Optional[str] = Field(None, description="Why this question had an effect")
+    confidence: Optional[float] = Field(None, description="Confidence in the observation, 0-1")
+
+class AnalysisResult(BaseModel):
+    # Start of the analyzed clip; set by the server and left out of the response schema
+    timestamp: float = 0.0
+    facialExpression: AnalysisDetail
+    bodyPosture: AnalysisDetail
+    handGestures: AnalysisDetail
+    overallEmotion: str
+    confidenceScore: float = Field(description="0-1")
+    analysis: str = Field(description="Comprehensive analysis summary")
+    deceptionIndicators: Optional[List[DeceptionIndicator]] = None
+    confidenceMetrics: Optional[List[ConfidenceMetric]] = None
+    keyStrengths: List[KeyStrength] = []
+    areasOfNote: List[AreaOfNote] = []
+    questionResponse: QuestionResponse
+    timeline: List[TimelineEvent] = []
+    questionImpacts: Optional[List[QuestionImpact]] = []  # New field
+    # Set when the response had to be salvaged; lists the sections filled with defaults
+    partial: bool = False
+    missingSections: List[str] = []
+
+# AnalysisResult fields filled in by the server rather than by Gemini
+ANALYSIS_SERVER_FIELDS = {"timestamp", "partial", "missingSections"}
+
+class VideoAnalysis(BaseModel):
+    id: str
+    state: AnalysisState
+    results: Optional[List[AnalysisResult]] = None
+    # Sections received so far while Gemini is still generating, keyed by
+    # 'video' or the segment's time range; held in memory by the process
+    # running the analysis and gone once results are stored
+    preview: Optional[Dict[str, Dict[str, Any]]] = None
+    # Source video (upload hash or YouTube ID); lets follow-up questions find its Gemini file
+    contentId: Optional[str] = None
+
+class FollowUpQuestion(BaseModel):
+    question: str = Field(min_length=1, max_length=2000)
+
+class FollowUpAnswer(BaseModel):
+    question: str = ""
+    answer: str = Field(description="Answer to the question, based on the video")
+    timestamps: List[float] = Field([], description="Seconds from the start of the video of the moments referred to")
+    cached: bool = False
+
+# FollowUpAnswer fields filled in by the server rather than by Gemini
+FOLLOW_UP_SERVER_FIELDS = {"question", "cached"}
+
+class TriageWindow(BaseModel):
+    start: float = Field(description="Seconds from the start of the video")
+    end: float = Field(description="Seconds from the start of the video")
+    interest: float = Field(description="How much a detailed behavioral analysis of this part would reveal, 0-1")
+
+class TriageResult(BaseModel):
+    analyze: bool = Field(description="Whether the video shows a speaker worth a full behavioral analysis")
+    reason: str = Field(description="One sentence justifying the decision")
+    windows: List[TriageWindow] = Field(
+        [], description="Parts of the video with notable behavior, e.g. pointed questions or visible stress"
+    )
+
+class BatchRequest(BaseModel):
+    youtube_urls: List[str] = []
+    playlist_url: Optional[str] = None  # Expanded into its videos
+    offline: bool = False  # Analyze through Gemini batch mode (slower, cheaper)
+
+class BatchItem(BaseModel):
+    url: str
+    analysis_id: str
+    status: str
+    progress: float = 0.0
+    message: Optional[str] = None
+
+class BatchAnalysis(BaseModel):
+    id: str
+    state: AnalysisState
+    items: List[BatchItem] = []
+    duplicates: int = 0   # URLs dropped because they name a video already in the batch
+    completed: int = 0
+    failed: int = 0
+
+class OfflineSegment(BaseModel):
+    index: int
+    start: float
+    end: float
+    owned_start: Optional[float] = None  # None: unbounded
+    owned_end: Optional[float] = None
+
+class OfflineAnalysis(BaseModel):
+    """An analysis waiting for Gemini batch mode, stored so that a restarted server picks its batches up again."""
+    id: str  # Of the analysis
+    state: AnalysisState  # 'queued' until all its requests are submitted, then 'submitted'
+    keys: List[str] = []  # Of the batch requests, one per segment
+    requests: Dict[str, Dict[str, Any]] = {}  # Not submitted yet, by key
+    batches: Dict[str, List[str]] = {}  # Batch name -> keys submitted in it
+    segments: Optional[List[OfflineSegment]] = None
+    followers: List[str] = []  # Analyses of the same video following this one
+    content_id: Optional[str] = None
+    cache_key: Optional[str] = None
+    section: Optional[Tuple[float, Optional[float]]] = None
+    audio_analyzed: bool = False
+    worker: int = 0  # PID of the process polling the batch
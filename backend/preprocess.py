@@ -0,0 +1,104 @@
+import os
+import re
+import shutil
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from loguru import logger
+
+
+@dataclass(frozen=True)
+class TranscodeSettings:
+    """Target format for videos before they are sent to Gemini.
+
+    Gemini samples video at about one frame per second and at modest
+    resolution, so the defaults keep everything the analysis can use.
+    """
+    max_height: int = 480
+    fps: float = 5
+    video_bitrate: str = "400k"
+    keep_audio: bool = True
+    audio_bitrate: str = "64k"
+
+    def signature(self) -> str:
+        # Part of cache keys: a different transcode is a different Gemini input
+        audio = f"a{self.audio_bitrate}" if self.keep_audio else "noaudio"
+        return f"h{self.max_height}-f{self.fps:g}-v{self.video_bitrate}-{audio}"
+
+
+@dataclass
+class TranscodeStats:
+    input_bytes: int
+    output_bytes: int
+    seconds: float
+
+
+def ffmpeg_path() -> Optional[str]:
+    return shutil.which(os.getenv("FFMPEG_BINARY", "ffmpeg"))
+
+
+def build_ffmpeg_command(binary: str, src: str, dst: str, settings: TranscodeSettings) -> List[str]:
+    # Drop frames before scaling; min() keeps the source height when it is already small
+    video_filter = f"fps={settings.fps:g},scale=-2:'min({settings.max_height},ih)'"
+    command = [
+        binary, "-y", "-hide_banner", "-loglevel", "error",
+        "-i", src,
+        "-vf", video_filter,
+        "-c:v", "libx264", "-preset", "ultrafast",
+        "-b:v", settings.video_bitrate,
+        "-maxrate", settings.video_bitrate,
+        "-bufsize", settings.video_bitrate,
+    ]
+    if settings.keep_audio:
+        command += ["-c:a", "aac", "-b:a", settings.audio_bitrate, "-ac", "1"]
+    else:
+        command += ["-an"]
+    command += ["-movflags", "+faststart", dst]
+    return command
+
+
+def transcode_video(src: str, dst: str, settings: TranscodeSettings) -> TranscodeStats:
+    """Runs ffmpeg synchronously; raises RuntimeError when it fails."""
+    binary = ffmpeg_path()
+    if not binary:
+        raise RuntimeError("ffmpeg is not installed")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        build_ffmpeg_command(binary, src, dst, settings),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if completed.returncode != 0:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise RuntimeError(f"ffmpeg failed: {completed.stderr.strip()[-500:]}")
+    stats = TranscodeStats(
+        input_bytes=os.path.getsize(src),
+        output_bytes=os.path.getsize(dst),
+        seconds=time.perf_counter() - started,
+    )
+    logger.info(
+        f"Transcoded {src}: {stats.input_bytes} -> {stats.output_bytes} bytes in {stats.seconds:.1f}s"
+    )
+    return stats
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Reads the container duration in seconds from ffmpeg's input summary."""
+    binary = ffmpeg_path()
+    if not binary or not os.path.exists(path):
+        return None
+    completed = subprocess.run(
+        [binary, "-hide_banner", "-i", path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", completed.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
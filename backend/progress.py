@@ -0,0 +1,104 @@
+import time
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+from metrics import metrics
+
+
+class ProgressThrottle:
+    """Coalesces a stream of progress fractions (0-1).
+
+    A value is let through only when it moved by at least ``min_step`` since
+    the last accepted one and no more than ``max_rate`` times per second.
+    """
+
+    def __init__(self, min_step: float = 0.01, max_rate: float = 4.0):
+        self.min_step = min_step
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self._last_value: Optional[float] = None
+        self._last_time = 0.0
+
+    def ready(self, value: float, final: bool = False) -> bool:
+        now = time.monotonic()
+        if not final and self._last_value is not None:
+            if value - self._last_value < self.min_step:
+                return False
+            if now - self._last_time < self.min_interval:
+                return False
+        self._last_value = value
+        self._last_time = now
+        return True
+
+
+class DownloadProgressReporter:
+    """yt-dlp progress hook that forwards throttled download fractions to ``on_progress``.
+
+    Logging is sampled too: one INFO line per ``log_step`` of progress.
+
+    A merged download (separate video and audio formats) reports each stream
+    from 0 to 1 in turn. Progress is kept per stream, by the format id in
+    ``info_dict``, and the streams are weighted by size into one fraction, so
+    the audio stream does not start over below the finished video stream.
+    """
+
+    def __init__(
+        self,
+        on_progress: Callable[[float], None],
+        min_step: float = 0.01,
+        max_rate: float = 4.0,
+        log_step: float = 0.1,
+    ):
+        self.on_progress = on_progress
+        self.throttle = ProgressThrottle(min_step, max_rate)
+        self.log_step = log_step
+        self._next_log = 0.0
+        self._streams: Dict[str, float] = {}
+        self._sizes: Dict[str, float] = {}
+
+    def __call__(self, d: dict):
+        status = d.get('status')
+        metrics.incr("download_progress_events")
+        if status == 'finished':
+            fraction, final = 1.0, True
+        elif status == 'downloading':
+            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if not total_bytes:
+                return
+            fraction, final = min(d.get('downloaded_bytes', 0) / total_bytes, 1.0), False
+        else:
+            return
+        fraction, final = self._overall(d, fraction, final)
+
+        if not self.throttle.ready(fraction, final=final):
+            return
+        if fraction >= self._next_log:
+            logger.info(f"Download progress: {int(fraction * 100)}%")
+            self._next_log = (int(fraction / self.log_step) + 1) * self.log_step
+        metrics.incr("download_progress_published")
+        try:
+            self.on_progress(fraction)
+        except Exception as e:
+            logger.error(f"Error updating progress: {str(e)}")
+
+    def _overall(self, d: dict, fraction: float, final: bool):
+        """Folds the progress of one stream of a merged download into the progress of all of them."""
+        info = d.get('info_dict') or {}
+        formats = info.get('requested_formats') or []
+        stream = info.get('format_id')
+        if len(formats) < 2 or stream not in [f.get('format_id') for f in formats]:
+            return fraction, final
+        for f in formats:
+            size = f.get('filesize') or f.get('filesize_approx')
+            if size:
+                self._sizes.setdefault(f['format_id'], size)
+        total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if total_bytes:
+            self._sizes[stream] = total_bytes
+        self._streams[stream] = fraction
+        ids = [f['format_id'] for f in formats]
+        # Streams count equally until every size is known
+        sized = all(i in self._sizes for i in ids)
+        weights = [self._sizes[i] if sized else 1.0 for i in ids]
+        overall = sum(w * self._streams.get(i, 0.0) for i, w in zip(ids, weights)) / sum(weights)
+        return min(overall, 1.0), final and all(self._streams.get(i) == 1.0 for i in ids)
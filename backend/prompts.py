@@ -0,0 +1,118 @@
+"""Prompt templates sent to Gemini.
+
+Bump a template's ``version`` whenever its text changes meaning: the
+version is part of the result cache key and of the context cache key, so
+stale analyses and cached contexts are not reused with a new prompt.
+"""
+import hashlib
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    version: int
+    text: str
+
+    def render(self, **values) -> str:
+        return self.text.format(**values) if values else self.text
+
+    @property
+    def signature(self) -> str:
+        """Identifies this exact prompt, e.g. ``analysis-v3-1a2b3c4d5e6f``."""
+        digest = hashlib.sha256(self.text.encode()).hexdigest()[:12]
+        return f"{self.name}-v{self.version}-{digest}"
+
+
+# Sent as the system instruction; the structure of the answer is enforced by
+# the response schema, so the prompt only describes the task
+ANALYSIS_INSTRUCTIONS = PromptTemplate(
+    name="analysis",
+    version=3,
+    text=(
+        "Perform a comprehensive behavioral analysis of the provided video segment of a political speaker: "
+        "facial expression, body posture, hand gestures, the overall emotion and confidence, deception indicators, "
+        "confidence metrics over time, key strengths, areas of note, how the speaker responds to questions, "
+        "and a timeline of notable moments.\n\n"
+        "In addition, identify any specific question during the interview that triggered a significant change in "
+        "the speaker's mood. For each such question, indicate the question (or a description of it), the timestamp, "
+        "whether it made the speaker nervous or confident, and provide a brief analysis with a confidence score."
+    ),
+)
+
+# The user turn of a whole-video analysis
+ANALYSIS_REQUEST = PromptTemplate(
+    name="analysis-request",
+    version=1,
+    text="Analyze this video.",
+)
+
+SEGMENT_REQUEST = PromptTemplate(
+    name="segment",
+    version=1,
+    text=(
+        "This clip is the part of a longer video from {start} to {end}. "
+        "Analyze only this clip and give every timestamp in seconds relative to the start of the clip."
+    ),
+)
+
+# Asks for just the sections a truncated response did not get to
+CONTINUATION_REQUEST = PromptTemplate(
+    name="continuation",
+    version=1,
+    text="Only provide the following sections of the analysis: {sections}.",
+)
+
+# Follow-up questions about an analyzed video; the earlier analysis is passed along as context
+FOLLOW_UP_REQUEST = PromptTemplate(
+    name="follow-up",
+    version=1,
+    text=(
+        "This video was already analyzed; the analysis is below as JSON, with timestamps in seconds "
+        "from the start of the video.\n\n{analysis}\n\n"
+        "Answer the following question about the video. Use the analysis where it helps, but check the "
+        "video itself for anything it does not cover.\n\nQuestion: {question}"
+    ),
+)
+
+# Cheap first pass on a low resolution version of the video, deciding what the full analysis covers
+TRIAGE_INSTRUCTIONS = PromptTemplate(
+    name="triage",
+    version=1,
+    text=(
+        "You screen videos before an expensive behavioral analysis of a political speaker. Decide whether the "
+        "video shows a speaker whose facial expression, posture, gestures and answers can be analyzed at all "
+        "(not e.g. a slideshow, music or b-roll). If so, list the parts where the speaker's behavior is most "
+        "revealing, such as pointed or hostile questions, evasive answers, visible stress or shifts in mood, "
+        "and rate each from 0 to 1. Be brief."
+    ),
+)
+
+TRIAGE_REQUEST = PromptTemplate(
+    name="triage-request",
+    version=1,
+    text="Screen this video.",
+)
+
+# Appended to the analysis request when the soundtrack could be segmented into speaker turns
+AUDIO_TURNS = PromptTemplate(
+    name="audio-turns",
+    version=1,
+    text=(
+        "Speaker turns measured on the audio track, in seconds from the start of the {scope}. Use these times "
+        "for questions, answers and timeline events instead of estimating them, and concentrate on the marked "
+        "questions and the answers that follow them:\n{turns}"
+    ),
+)
+
+# The user turn when the video is sent as keyframes instead of as a file (ANALYSIS_INPUT=keyframes)
+KEYFRAME_REQUEST = PromptTemplate(
+    name="keyframes",
+    version=1,
+    text=(
+        "The video is {duration} long. Instead of the video you are given {count} frames from it, chosen at "
+        "shot changes, moments of motion and across quiet stretches, each after its time in seconds from the "
+        "start of the video, and {soundtrack}. Analyze the video from these; judge movement and gestures from "
+        "how consecutive frames differ, and give every timestamp in seconds from the start of the video."
+    ),
+)
@@ -0,0 +1,63 @@
+from typing import Iterable, Type
+
+from google.genai import types
+from pydantic import BaseModel
+
+_TYPES = {
+    "string": types.Type.STRING,
+    "number": types.Type.NUMBER,
+    "integer": types.Type.INTEGER,
+    "boolean": types.Type.BOOLEAN,
+    "array": types.Type.ARRAY,
+    "object": types.Type.OBJECT,
+}
+
+
+def gemini_schema(model: Type[BaseModel], exclude: Iterable[str] = ()) -> types.Schema:
+    """Converts a Pydantic model to the OpenAPI subset Gemini accepts as ``response_schema``.
+
+    ``$ref``s are inlined, ``Optional[X]`` becomes a nullable ``X`` and
+    properties keep their declaration order. Every property is required, even
+    those with defaults, so that Gemini fills in the whole structure. Top-level
+    fields in ``exclude`` are left out, for values the server fills in itself.
+    """
+    json_schema = model.model_json_schema()
+    definitions = json_schema.get("$defs", {})
+    schema = _convert(json_schema, definitions)
+    excluded = set(exclude)
+    if excluded:
+        schema.properties = {k: v for k, v in schema.properties.items() if k not in excluded}
+        schema.property_ordering = [k for k in schema.property_ordering if k not in excluded]
+        schema.required = [k for k in schema.required or [] if k not in excluded]
+    return schema
+
+
+def _convert(node: dict, definitions: dict) -> types.Schema:
+    if "$ref" in node:
+        node = {**definitions[node["$ref"].split("/")[-1]], **{k: v for k, v in node.items() if k != "$ref"}}
+
+    nullable = None
+    variants = node.get("anyOf")
+    if variants:
+        non_null = [v for v in variants if v.get("type") != "null"]
+        if len(non_null) != 1:
+            raise ValueError(f"Unsupported union in response schema: {variants}")
+        nullable = len(non_null) < len(variants) or None
+        node = {**non_null[0], **{k: v for k, v in node.items() if k not in ("anyOf", "default", "title")}}
+        if "$ref" in node:
+            return _convert(node, definitions).model_copy(update={"nullable": nullable})
+
+    schema = types.Schema(
+        type=_TYPES[node["type"]],
+        description=node.get("description"),
+        nullable=nullable,
+        enum=node.get("enum"),
+    )
+    if node["type"] == "array":
+        schema.items = _convert(node["items"], definitions)
+    elif node["type"] == "object":
+        properties = node.get("properties", {})
+        schema.properties = {name: _convert(prop, definitions) for name, prop in properties.items()}
+        schema.property_ordering = list(properties)
+        schema.required = list(properties) or None
+    return schema
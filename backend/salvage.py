@@ -0,0 +1,175 @@
+import json
+from typing import Any, Dict, List
+
+from pydantic import TypeAdapter, ValidationError
+
+from models import ANALYSIS_SERVER_FIELDS, AnalysisDetail, AnalysisResult, QuestionResponse
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+def _skip(text: str, pos: int, chars: str = _WHITESPACE) -> int:
+    while pos < len(text) and text[pos] in chars:
+        pos += 1
+    return pos
+
+
+def salvage_json_object(text: str) -> Dict[str, Any]:
+    """Returns the top-level members of a JSON object that were fully written.
+
+    Members are decoded one at a time, so a response cut off by the output
+    token limit still yields everything before the member it stopped in.
+    """
+    start = text.find("{")
+    if start < 0:
+        return {}
+    members: Dict[str, Any] = {}
+    pos = start + 1
+    while True:
+        pos = _skip(text, pos, _WHITESPACE + ",")
+        if pos >= len(text) or text[pos] == "}":
+            break
+        try:
+            key, pos = _decoder.raw_decode(text, pos)
+            pos = _skip(text, pos)
+            if not isinstance(key, str) or text[pos:pos + 1] != ":":
+                break
+            value, pos = _decoder.raw_decode(text, _skip(text, pos + 1))
+        except json.JSONDecodeError:
+            break
+        members[key] = value
+    return members
+
+
+def analysis_sections() -> List[str]:
+    """AnalysisResult fields that Gemini is asked to produce."""
+    return [name for name in AnalysisResult.model_fields if name not in ANALYSIS_SERVER_FIELDS]
+
+
+def validate_sections(members: Dict[str, Any]) -> Dict[str, Any]:
+    """Keeps the members that are valid AnalysisResult sections, validated to their model types."""
+    valid = {}
+    for name in analysis_sections():
+        if name not in members:
+            continue
+        try:
+            valid[name] = TypeAdapter(AnalysisResult.model_fields[name].annotation).validate_python(members[name])
+        except ValidationError:
+            continue
+    return valid
+
+
+# Stand-ins for required sections that could not be recovered
+_PLACEHOLDERS = {
+    "facialExpression": lambda: AnalysisDetail(emotion="Unknown", confidence=0.0),
+    "bodyPosture": lambda: AnalysisDetail(emotion="Unknown", confidence=0.0),
+    "handGestures": lambda: AnalysisDetail(emotion="Unknown", confidence=0.0),
+    "overallEmotion": lambda: "Unknown",
+    "confidenceScore": lambda: 0.0,
+    "analysis": lambda: "",
+    "questionResponse": lambda: QuestionResponse(
+        responseStyle="Unknown", topicHandling="Unknown", behavioralPatterns=[]
+    ),
+}
+
+
+def build_partial_result(sections: Dict[str, Any]) -> AnalysisResult:
+    """Fills the sections that are missing with defaults and flags the result as partial."""
+    missing = [name for name in analysis_sections() if name not in sections]
+    values = dict(sections)
+    for name in missing:
+        if name in _PLACEHOLDERS:
+            values[name] = _PLACEHOLDERS[name]()
+    return AnalysisResult(**values, partial=bool(missing), missingSections=missing)
+
+
+def salvage_analysis(text: str) -> AnalysisResult:
+    """Builds a (possibly partial) AnalysisResult from malformed or truncated output.
+
+    Raises ValueError when not a single section could be recovered.
+    """
+    sections = validate_sections(salvage_json_object(text))
+    if not sections:
+        raise ValueError("No analysis sections could be recovered")
+    return build_partial_result(sections)
+
+
+def _delimited(text: str, end: int, delimiters: str) -> bool:
+    # A number at the end of the buffer (e.g. "0" of "0.75") may still be growing
+    pos = _skip(text, end)
+    return pos < len(text) and text[pos] in delimiters
+
+
+class IncrementalObjectParser:
+    """Decodes a streamed JSON object, reporting each top-level member once it is complete.
+
+    ``feed`` returns events for what the new text completed: ``("member",
+    name, value)`` for a whole member and, for members holding an array,
+    ``("item", name, index, value)`` for every array element as it arrives.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.members: Dict[str, Any] = {}
+        self._pos: int = -1
+        self._key = None
+        self._items = None
+
+    def feed(self, chunk: str) -> List[tuple]:
+        self.text += chunk
+        text = self.text
+        events = []
+        if self._pos < 0:
+            start = text.find("{")
+            if start < 0:
+                return events
+            self._pos = start + 1
+
+        while True:
+            pos = self._pos
+            try:
+                if self._key is None:
+                    pos = _skip(text, pos, _WHITESPACE + ",")
+                    if pos >= len(text) or text[pos] == "}":
+                        break
+                    key, pos = _decoder.raw_decode(text, pos)
+                    pos = _skip(text, pos)
+                    if pos >= len(text) or text[pos] != ":":
+                        break
+                    pos = _skip(text, pos + 1)
+                    if pos >= len(text):
+                        break
+                    self._key = key
+                    if text[pos] == "[":
+                        self._items = []
+                        pos += 1
+                    self._pos = pos
+                elif self._items is not None:
+                    pos = _skip(text, pos, _WHITESPACE + ",")
+                    if pos >= len(text):
+                        break
+                    if text[pos] == "]":
+                        self._finish(events, self._items, pos + 1)
+                        continue
+                    item, end = _decoder.raw_decode(text, pos)
+                    if not _delimited(text, end, ",]"):
+                        break
+                    self._items.append(item)
+                    events.append(("item", self._key, len(self._items) - 1, item))
+                    self._pos = end
+                else:
+                    value, end = _decoder.raw_decode(text, pos)
+                    if not _delimited(text, end, ",}"):
+                        break
+                    self._finish(events, value, end)
+            except json.JSONDecodeError:
+                break
+        return events
+
+    def _finish(self, events: List[tuple], value: Any, end: int):
+        self.members[self._key] = value
+        events.append(("member", self._key, value))
+        self._key = None
+        self._items = None
+        self._pos = end
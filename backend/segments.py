@@ -0,0 +1,199 @@
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional, Sequence
+
+from models import AnalysisDetail, AnalysisResult, QuestionResponse
+
+
+@dataclass(frozen=True)
+class Segment:
+    """A window of the full video, in seconds.
+
+    Neighbouring windows overlap; each one only keeps the events that fall in
+    its ``owned_start``-``owned_end`` range (split at the middle of the overlap)
+    so that merged timelines contain no duplicates. The outer ends of the first
+    and last segments are unbounded.
+    """
+    index: int
+    start: float
+    end: float
+    owned_start: float
+    owned_end: float
+
+    @property
+    def length(self) -> float:
+        return self.end - self.start
+
+    @property
+    def weight(self) -> float:
+        """Seconds of the video this segment speaks for."""
+        return max(min(self.owned_end, self.end) - max(self.owned_start, self.start), 0.0)
+
+    def label(self) -> str:
+        return f"{format_timestamp(self.start)}-{format_timestamp(self.end)}"
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def plan_segments(duration: float, length: float, overlap: float) -> List[Segment]:
+    if duration <= length:
+        return [Segment(0, 0.0, duration, float("-inf"), float("inf"))]
+    step = max(length - overlap, 1.0)
+    windows = []
+    start = 0.0
+    while True:
+        end = min(start + length, duration)
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start += step
+
+    segments = []
+    for index, (start, end) in enumerate(windows):
+        owned_start = float("-inf") if index == 0 else (start + windows[index - 1][1]) / 2
+        owned_end = float("inf") if index == len(windows) - 1 else (end + windows[index + 1][0]) / 2
+        segments.append(Segment(index, start, end, owned_start, owned_end))
+    return segments
+
+
+# Sections whose entries carry a ``timestamp`` in seconds
+TIMESTAMPED_SECTIONS = ("timeline", "deceptionIndicators", "confidenceMetrics", "questionImpacts", "areasOfNote")
+
+
+def _timestamps(result: AnalysisResult) -> Iterable[float]:
+    for items in (result.timeline, result.deceptionIndicators, result.confidenceMetrics, result.questionImpacts):
+        for item in items or []:
+            yield item.timestamp
+    for area in result.areasOfNote:
+        if area.timestamp is not None:
+            yield area.timestamp
+
+
+def localize_result(result: AnalysisResult, segment: Segment) -> AnalysisResult:
+    """Shifts a segment's clip-relative timestamps to absolute ones and drops events outside its range."""
+    result = result.model_copy(deep=True)
+    # The prompt asks for clip-relative times; if the model answered with
+    # absolute ones anyway they will not fit in the clip, so leave them alone.
+    offset = segment.start
+    if any(ts > segment.length + 1 for ts in _timestamps(result)):
+        offset = 0.0
+
+    def owned(items):
+        kept = []
+        for item in items or []:
+            item.timestamp += offset
+            if segment.owned_start <= item.timestamp < segment.owned_end:
+                kept.append(item)
+        return kept
+
+    result.timestamp = segment.start
+    result.timeline = owned(result.timeline)
+    result.deceptionIndicators = owned(result.deceptionIndicators)
+    result.confidenceMetrics = owned(result.confidenceMetrics)
+    result.questionImpacts = owned(result.questionImpacts)
+    for area in result.areasOfNote:
+        if area.timestamp is not None:
+            area.timestamp += offset
+    return result
+
+
+def localize_section(name: str, value: Any, segment: Segment, offset: float = 0.0) -> Any:
+    """The streamed counterpart of ``localize_result``, for one section or entry as parsed JSON.
+
+    Timestamps are shifted by the segment's start plus ``offset`` (unless
+    they do not fit in the segment, i.e. were given in absolute time), and
+    entries outside the segment's owned range are dropped; None when
+    ``value`` is such an entry.
+    """
+    if name not in TIMESTAMPED_SECTIONS:
+        return value
+    if isinstance(value, list):
+        entries = (localize_section(name, entry, segment, offset) for entry in value)
+        return [entry for entry in entries if entry is not None]
+    timestamp = value.get("timestamp") if isinstance(value, dict) else None
+    if not isinstance(timestamp, (int, float)):
+        return value
+    if timestamp <= segment.length + 1:
+        timestamp += segment.start
+    if name != "areasOfNote" and not segment.owned_start <= timestamp < segment.owned_end:
+        return None
+    return {**value, "timestamp": timestamp + offset}
+
+
+def _weighted_choice(values: Sequence[str], weights: Sequence[float]) -> str:
+    totals: Counter = Counter()
+    for value, weight in zip(values, weights):
+        if value:
+            totals[value.strip().lower()] += weight
+    if not totals:
+        return "Unknown"
+    winner = totals.most_common(1)[0][0]
+    return next(v.strip() for v in values if v and v.strip().lower() == winner)
+
+
+def _weighted_mean(values: Sequence[Optional[float]], weights: Sequence[float]) -> Optional[float]:
+    pairs = [(v, w) for v, w in zip(values, weights) if v is not None]
+    total = sum(w for _, w in pairs)
+    if not pairs or total <= 0:
+        return None
+    return sum(v * w for v, w in pairs) / total
+
+
+def _merge_detail(details: List[AnalysisDetail], segments: List[Segment], weights: List[float]) -> AnalysisDetail:
+    markers = [m for d in details for m in (d.timeMarkers or [])]
+    contexts = list(OrderedDict.fromkeys(d.context for d in details if d.context))
+    return AnalysisDetail(
+        emotion=_weighted_choice([d.emotion for d in details], weights),
+        confidence=_weighted_mean([d.confidence for d in details], weights) or 0.0,
+        description="\n".join(
+            f"[{s.label()}] {d.description}" for d, s in zip(details, segments) if d.description
+        ),
+        intensity=_weighted_mean([d.intensity for d in details], weights),
+        context="; ".join(contexts) or None,
+        timeMarkers=markers or None,
+        truthfulnessScore=_weighted_mean([d.truthfulnessScore for d in details], weights),
+    )
+
+
+def merge_results(results: List[AnalysisResult], segments: List[Segment]) -> AnalysisResult:
+    """Combines localized per-segment results into one summary covering the whole video."""
+    weights = [s.weight for s in segments]
+
+    key_strengths = OrderedDict()
+    for strength in (k for r in results for k in r.keyStrengths):
+        key = strength.title.strip().lower()
+        if key not in key_strengths or strength.confidence > key_strengths[key].confidence:
+            key_strengths[key] = strength
+    areas_of_note = OrderedDict()
+    for area in (a for r in results for a in r.areasOfNote):
+        areas_of_note.setdefault(area.title.strip().lower(), area)
+
+    def by_time(attribute):
+        return sorted((i for r in results for i in (getattr(r, attribute) or [])), key=lambda i: i.timestamp)
+
+    return AnalysisResult(
+        timestamp=0.0,
+        facialExpression=_merge_detail([r.facialExpression for r in results], segments, weights),
+        bodyPosture=_merge_detail([r.bodyPosture for r in results], segments, weights),
+        handGestures=_merge_detail([r.handGestures for r in results], segments, weights),
+        overallEmotion=_weighted_choice([r.overallEmotion for r in results], weights),
+        confidenceScore=_weighted_mean([r.confidenceScore for r in results], weights) or 0.0,
+        analysis="\n\n".join(f"[{s.label()}] {r.analysis}" for r, s in zip(results, segments)),
+        deceptionIndicators=by_time("deceptionIndicators"),
+        confidenceMetrics=by_time("confidenceMetrics"),
+        keyStrengths=list(key_strengths.values()),
+        areasOfNote=list(areas_of_note.values()),
+        questionResponse=QuestionResponse(
+            responseStyle=_weighted_choice([r.questionResponse.responseStyle for r in results], weights),
+            topicHandling=_weighted_choice([r.questionResponse.topicHandling for r in results], weights),
+            behavioralPatterns=list(OrderedDict.fromkeys(
+                p for r in results for p in r.questionResponse.behavioralPatterns
+            )),
+        ),
+        timeline=by_time("timeline"),
+        questionImpacts=by_time("questionImpacts"),
+    )
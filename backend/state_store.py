@@ -0,0 +1,178 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Generic, List, Optional, Type, TypeVar
+
+from loguru import logger
+from pydantic import BaseModel
+
+from metrics import metrics
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class StateStore(Generic[T]):
+    """Storage for analysis records keyed by ``id``.
+
+    Records returned by ``get`` must be passed back to ``save`` after being
+    modified; depending on the implementation they may be copies.
+    """
+
+    def get(self, record_id: str) -> Optional[T]:
+        raise NotImplementedError
+
+    def save(self, record: T):
+        raise NotImplementedError
+
+    def delete(self, record_id: str):
+        raise NotImplementedError
+
+    def find(self, status: str) -> List[T]:
+        """The unexpired records whose ``state.status`` is ``status``."""
+        raise NotImplementedError
+
+    def __contains__(self, record_id: str) -> bool:
+        return self.get(record_id) is not None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore[T]):
+    """Per-process store bounded by entry count (LRU) and age since the last update."""
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._records: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, record_id: str) -> Optional[T]:
+        with self._lock:
+            entry = self._records.get(record_id)
+            if entry is None:
+                return None
+            record, updated_at = entry
+            if self.ttl is not None and time.time() - updated_at > self.ttl:
+                del self._records[record_id]
+                return None
+            self._records.move_to_end(record_id)
+            return record
+
+    def save(self, record: T):
+        with self._lock:
+            self._records[record.id] = (record, time.time())
+            self._records.move_to_end(record.id)
+            while len(self._records) > self.max_entries:
+                evicted_id, _ = self._records.popitem(last=False)
+                metrics.incr("state_store_evictions")
+                logger.debug(f"Evicted analysis state {evicted_id}")
+
+    def delete(self, record_id: str):
+        with self._lock:
+            self._records.pop(record_id, None)
+
+    def find(self, status: str) -> List[T]:
+        now = time.time()
+        with self._lock:
+            return [
+                record for record, updated_at in self._records.values()
+                if record.state.status == status and (self.ttl is None or now - updated_at <= self.ttl)
+            ]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class SQLiteStateStore(StateStore[T]):
+    """Store shared by every uvicorn worker on the host through a WAL-mode SQLite file."""
+
+    def __init__(
+        self,
+        path: str,
+        model: Type[T],
+        max_entries: int = 100000,
+        ttl: Optional[float] = None,
+        table: str = "analyses",
+    ):
+        self.model = model
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_status ON {table}(status)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_updated_at ON {table}(updated_at)")
+
+    def get(self, record_id: str) -> Optional[T]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT data, updated_at FROM {self.table} WHERE id = ?", (record_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        data, updated_at = row
+        if self.ttl is not None and time.time() - updated_at > self.ttl:
+            self.delete(record_id)
+            return None
+        return self.model.model_validate_json(data)
+
+    def save(self, record: T):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (id, status, data, updated_at) VALUES (?, ?, ?, ?)",
+                (record.id, record.state.status, record.model_dump_json(), time.time()),
+            )
+            self._writes += 1
+            # Pruning scans the updated_at index, so only do it every so often
+            if self._writes % 100 == 0:
+                self._prune()
+
+    def _prune(self):
+        if self.ttl is not None:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE updated_at < ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE id IN ("
+            f"SELECT id FROM {self.table} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, record_id: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (record_id,))
+
+    def find(self, status: str) -> List[T]:
+        oldest = time.time() - self.ttl if self.ttl is not None else float("-inf")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM {self.table} WHERE status = ? AND updated_at >= ?", (status, oldest)
+            ).fetchall()
+        return [self.model.model_validate_json(data) for data, in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def create_state_store(
+    kind: str,
+    path: str,
+    model: Type[T],
+    max_entries: int,
+    ttl: Optional[float],
+    table: str = "analyses",
+) -> StateStore[T]:
+    """Builds the store named by ``kind`` ('memory' or 'sqlite')."""
+    if kind == "sqlite":
+        return SQLiteStateStore(path, model, max_entries=max_entries, ttl=ttl, table=table)
+    if kind == "memory":
+        return MemoryStateStore(max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unknown state store: {kind}")
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules, as they do when the app runs from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """The app module, configured to work in a scratch directory without calling Gemini on its own."""
+    root = tmp_path_factory.mktemp("app")
+    os.environ.update(
+        GEMINI_API_KEY="test",
+        CONTEXT_CACHE_SERVICE="none",
+        PREPROCESS_VIDEO="false",
+        AUDIO_SKELETON="false",
+        STREAM_ANALYSIS="false",
+        WORKSPACE_DIR=str(root / "temp"),
+        RESULT_CACHE_PATH=str(root / "result_cache.sqlite3"),
+        ANALYSIS_WORKERS="1",
+        ANALYSIS_QUEUE_SIZE="2",
+        BATCH_QUEUE_SIZE="2",
+    )
+    cwd = os.getcwd()
+    # The log file is opened relative to the working directory
+    os.chdir(root)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
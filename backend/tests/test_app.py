@@ -0,0 +1,192 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from metrics import metrics
+
+from context_cache import ContextCache, FakeContextCacheService
+from gemini_batch import BatchOutcome, BatchService, BatchStatus, OfflineBatcher
+from models import AnalysisResult, AnalysisState, OfflineAnalysis
+from test_salvage import RESPONSE
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_uploads_are_accepted_while_a_batch_runs(app_module, monkeypatch):
+    handled = []
+    released = threading.Event()
+
+    async def handler(job):
+        handled.append(job.analysis_id)
+        while not released.is_set():
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(app_module.job_queue, "_handler", handler)
+    try:
+        with TestClient(app_module.app) as client:
+            urls = [f"https://youtu.be/batch{i:06d}" for i in range(20)]
+            response = client.post("/analyze/batch", json={"youtube_urls": urls})
+            assert response.status_code == 202
+            # One batch job runs, the lane is full and the feeder waits with the rest
+            wait_until(lambda: len(handled) == 1 and app_module.job_queue.batch_pending == 2)
+
+            uploads = []
+            for i in range(2):
+                response = client.post("/analyze/upload", data={"youtube_url": f"https://youtu.be/upload{i:05d}"})
+                assert response.status_code == 202
+                uploads.append(response.json()["id"])
+
+            released.set()
+            wait_until(lambda: len(handled) >= 3)
+            assert handled[1:3] == uploads
+    finally:
+        released.set()
+
+
+def test_uploads_are_refused_at_once_when_the_workspace_is_full(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.workspace, "reserved", app_module.workspace.quota_bytes)
+    with TestClient(app_module.app) as client:
+        started = time.monotonic()
+        response = client.post("/analyze/upload", files={"file": ("a.mp4", b"video")})
+    assert time.monotonic() - started < 2
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(app_module.UPLOAD_RETRY_AFTER)
+
+
+class RecordingModels:
+    def __init__(self, text="{}"):
+        self.text = text
+        self.configs = []
+
+    async def generate_content(self, model, contents, config=None):
+        self.configs.append(config)
+        return SimpleNamespace(text=self.text, usage_metadata=None)
+
+
+def uploaded_video(seconds):
+    return SimpleNamespace(
+        name="files/video", uri="https://files.test/video", mime_type="video/mp4",
+        video_metadata={"videoDuration": f"{seconds}s"},
+    )
+
+
+def test_contexts_below_the_cache_minimum_are_sent_inline(app_module, monkeypatch):
+    service = FakeContextCacheService()
+    models = RecordingModels()
+    monkeypatch.setattr(app_module, "context_cache", ContextCache(service, min_tokens=4096))
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+    # The instructions alone never reach the minimum
+    assert len(app_module.ANALYSIS_INSTRUCTIONS.text) / 4 < 4096
+
+    async def ask(seconds):
+        await app_module.request_analysis(uploaded_video(seconds), "prompt", None, None, "", cache_video=True)
+        return models.configs[-1]
+
+    short = asyncio.run(ask(1))
+    assert short.cached_content is None and short.system_instruction == app_module.ANALYSIS_INSTRUCTIONS.text
+    assert service.entries == {}
+
+    long = asyncio.run(ask(600))
+    assert long.cached_content in service.entries and long.system_instruction is None
+
+
+class FinishedBatches(BatchService):
+    """Batches submitted before a restart, all finished; answers every request with RESPONSE."""
+
+    def __init__(self):
+        self.polled = []
+        self.submitted = []
+
+    async def submit(self, model, entries):
+        self.submitted.append([entry.key for entry in entries])
+        return f"batches/new-{len(self.submitted)}"
+
+    async def status(self, name):
+        self.polled.append(name)
+        keys = [key for keys in self.submitted for key in keys] + ["old_a:0", "old_a:1", "old_b:0"]
+        return BatchStatus("succeeded", {key: BatchOutcome(text=json.dumps(RESPONSE)) for key in keys})
+
+
+def offline_record(analysis_id, keys, status="submitted", **fields):
+    return OfflineAnalysis(
+        id=analysis_id,
+        state=AnalysisState(status=status, progress=0.75, message="", timestamp=datetime.now()),
+        keys=keys,
+        worker=os.getpid(),
+        **fields,
+    )
+
+
+def test_offline_analyses_are_resumed_after_a_restart(app_module, monkeypatch):
+    service = FinishedBatches()
+    store = app_module.create_state_store("memory", "", OfflineAnalysis, 100, None)
+    monkeypatch.setattr(app_module, "offline_store", store)
+    segments = [
+        {"index": 0, "start": 0, "end": 70, "owned_end": 65},
+        {"index": 1, "start": 60, "end": 120, "owned_start": 65},
+    ]
+    # Left behind by the previous run: two analyses in one submitted batch and one still queued
+    store.save(offline_record("old_a", ["old_a:0", "old_a:1"], batches={"batches/old": ["old_a:0", "old_a:1"]},
+                              segments=segments))
+    store.save(offline_record("old_b", ["old_b:0"], batches={"batches/old": ["old_b:0"]}))
+    store.save(offline_record("old_c", ["old_c:0"], status="queued", requests={"old_c:0": {"contents": []}}))
+    for analysis_id in ("old_a", "old_b", "old_c"):
+        app_module.create_analysis_record(analysis_id)
+
+    async def run():
+        batcher = OfflineBatcher(service, "model", max_wait=0, poll_interval=0.01,
+                                 on_submitted=app_module.record_offline_batch)
+        monkeypatch.setattr(app_module, "offline_batcher", batcher)
+        await batcher.start()
+        try:
+            assert app_module.resume_offline_analyses() == 3
+            await asyncio.wait_for(asyncio.gather(*app_module.offline_completions), 1)
+        finally:
+            await batcher.stop()
+
+    asyncio.run(run())
+    for analysis_id in ("old_a", "old_b", "old_c"):
+        assert app_module.analysis_store.get(analysis_id).state.status == "complete"
+    # One poll for both analyses in the old batch; the request that never made it into one is sent now
+    assert service.polled.count("batches/old") == 1 and service.submitted == [["old_c:0"]]
+    assert len(store) == 0
+
+
+def test_follow_up_answers_are_cached_apart_from_analyses(app_module, monkeypatch):
+    models = RecordingModels('{"answer": "Yes", "timestamps": [12]}')
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+
+    async def registered_file(content_id):
+        return uploaded_video(60)
+
+    monkeypatch.setattr(app_module, "find_registered_file", registered_file)
+    app_module.create_analysis_record("asked")
+    app_module.update_analysis(
+        "asked", status="complete", progress=1, message="Done",
+        results=[AnalysisResult.model_validate(RESPONSE)], content_id="sha256:asked",
+    )
+    answer_hits = metrics.counter("answer_cache_hits")
+
+    with TestClient(app_module.app) as client:
+        answers = [
+            client.post("/analysis/asked/ask", json={"question": question}).json()
+            for question in ("Is the speaker nervous?", "is the speaker  nervous?")
+        ]
+    assert [a["answer"] for a in answers] == ["Yes", "Yes"] and answers[1]["cached"]
+    # Jobs other tests left in the queue may run meanwhile; only the follow-up calls count
+    asked = [config for config in models.configs if config.response_schema is app_module.FOLLOW_UP_SCHEMA]
+    assert len(asked) == 1 and metrics.counter("answer_cache_hits") == answer_hits + 1
+    context = app_module.follow_up_context(app_module.analysis_store.get("asked"))
+    key = app_module.follow_up_cache_key("sha256:asked", context, "Is the speaker nervous?")
+    assert app_module.answer_cache.backend.get(key) is not None and app_module.result_cache.backend.get(key) is None
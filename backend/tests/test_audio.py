@@ -0,0 +1,82 @@
+import pytest
+
+from audio import AudioSettings, AudioSkeleton, Turn
+
+np = pytest.importorskip("numpy")
+
+from audio import SAMPLE_RATE, build_skeleton, detect_speech, frame_features  # noqa: E402
+
+# Two "voices" with energy in different bands
+LOW, HIGH = (200, 300, 450), (1500, 2200, 3000)
+
+
+def tone(frequencies, seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    # Faded in and out; hard onsets splatter energy into every band
+    fade = np.minimum(1, np.minimum(t, seconds - t) / 0.05)
+    return sum(np.sin(2 * np.pi * f * t) for f in frequencies) * 0.3 * fade
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE))
+
+
+def skeleton_of(*parts, settings=AudioSettings()):
+    samples = np.concatenate(parts)
+    samples = (samples + np.random.default_rng(0).normal(0, 0.001, len(samples))).astype(np.float32)
+    energy, band_energy = frame_features(samples, SAMPLE_RATE, settings.bands)
+    return build_skeleton(energy, band_energy, settings)
+
+
+def test_an_interview_splits_into_turns_and_exchanges():
+    skeleton = skeleton_of(silence(1), tone(LOW, 3), tone(HIGH, 5), tone(LOW, 2), tone(HIGH, 4), silence(1))
+    assert skeleton.speakers == 2 and len(skeleton.turns) == 4
+    assert [turn.start for turn in skeleton.turns] == pytest.approx([1, 4, 9, 11], abs=0.1)
+    # The voice that talks the most is the subject; the other one asks
+    assert [turn.speaker == skeleton.subject for turn in skeleton.turns] == [False, True, False, True]
+    assert len(skeleton.exchanges) == 2
+    assert skeleton.speech_seconds == pytest.approx(14, abs=0.2)
+
+
+def test_one_voice_with_pauses_is_one_speaker():
+    skeleton = skeleton_of(silence(1), tone(LOW, 3), silence(3), tone(LOW, 3), silence(1))
+    assert skeleton.speakers == 1 and len(skeleton.turns) == 2 and skeleton.exchanges == []
+
+
+def test_steady_noise_is_not_speech():
+    energy = np.full(1000, -20.0, dtype=np.float32)
+    assert not detect_speech(energy, AudioSettings()).any()
+    assert skeleton_of(silence(5)).turns == []
+
+
+def test_short_pauses_are_bridged_and_short_bursts_dropped():
+    energy = np.full(1000, -60.0, dtype=np.float32)
+    energy[100:300] = energy[320:500] = 0.0  # A 0.2 s pause
+    energy[700:710] = 0.0  # A 0.1 s click
+    speech = detect_speech(energy, AudioSettings())
+    assert speech[100:500].all() and not speech[700:710].any()
+
+
+def interview():
+    return AudioSkeleton(
+        duration=20,
+        turns=[Turn(0, 3, 1), Turn(3.5, 9, 0), Turn(9, 10, 1), Turn(10.5, 18, 0)],
+        subject=0,
+        speakers=2,
+    )
+
+
+def test_speech_between_counts_overlapping_turns():
+    assert interview().speech_between(2, 4) == pytest.approx(1.5)
+
+
+def test_describe_marks_questions_and_shifts_times():
+    assert interview().describe(8, 12, offset=8) == "\n".join([
+        "- 0.0-1.0: speaker",
+        "- 1.0-2.0: interviewer (question)",
+        "- 2.5-4.0: speaker",
+    ])
+
+
+def test_settings_signature_changes_with_the_settings():
+    assert AudioSettings().signature() != AudioSettings(turn_gap=1.0).signature()
@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+import cache
+from cache import MemoryCacheBackend, ResultCache, SQLiteCacheBackend, create_cache_backend, make_cache_key
+from metrics import metrics
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make(max_entries=1000, ttl=None):
+        return create_cache_backend(request.param, str(tmp_path / "cache.sqlite3"), max_entries, ttl)
+
+    return make
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+
+def test_cache_keys_depend_on_every_part():
+    assert make_cache_key("sha256:abc", "model", "v1") == make_cache_key("sha256:abc", "model", "v1")
+    assert make_cache_key("sha256:abc", "model", "v1") != make_cache_key("sha256:abc", "model", "v2")
+    # Parts are separated, so they cannot run into each other
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+
+
+def test_backends_store_and_delete(make_backend):
+    backend = make_backend()
+    assert backend.get("k") is None
+    backend.set("k", "v")
+    backend.set("k", "w")
+    assert backend.get("k") == "w" and len(backend) == 1
+    backend.delete("k")
+    assert backend.get("k") is None and len(backend) == 0
+
+
+def test_backends_evict_the_least_recently_used(make_backend, clock):
+    backend = make_backend(max_entries=2)
+    backend.set("a", "1")
+    clock.now += 1
+    backend.set("b", "2")
+    clock.now += 1
+    assert backend.get("a") == "1"
+    clock.now += 1
+    backend.set("c", "3")
+    assert backend.get("b") is None and backend.get("a") == "1" and backend.get("c") == "3"
+
+
+def test_backends_expire_entries(make_backend, clock):
+    backend = make_backend(ttl=60)
+    backend.set("k", "v")
+    clock.now += 59
+    assert backend.get("k") == "v"
+    clock.now += 2
+    assert backend.get("k") is None
+
+
+def test_sqlite_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCacheBackend(path).set("k", "v")
+    assert SQLiteCacheBackend(path).get("k") == "v"
+    # Tables keep caches sharing a file apart
+    assert SQLiteCacheBackend(path, table="other").get("k") is None
+
+
+def test_result_cache_counts_hits_and_misses():
+    results = ResultCache(MemoryCacheBackend(), name="test_cache")
+    hits, misses = metrics.counter("test_cache_hits"), metrics.counter("test_cache_misses")
+    assert results.get("k") is None
+    results.set("k", "v")
+    assert results.get("k") == "v"
+    assert metrics.counter("test_cache_hits") == hits + 1
+    assert metrics.counter("test_cache_misses") == misses + 1
+
+
+def test_result_cache_survives_backend_errors():
+    class Broken(MemoryCacheBackend):
+        def get(self, key):
+            raise OSError("disk I/O error")
+
+        def set(self, key, value):
+            raise OSError("disk I/O error")
+
+    results = ResultCache(Broken())
+    results.set("k", "v")
+    assert results.get("k") is None
+
+
+def test_unknown_backends_are_rejected():
+    assert create_cache_backend("none", "", 1, None) is None
+    with pytest.raises(ValueError):
+        create_cache_backend("redis", "", 1, None)
@@ -0,0 +1,102 @@
+import asyncio
+
+from context_cache import ContextCache, FakeContextCacheService
+
+
+class CountingService(FakeContextCacheService):
+    def __init__(self, fail: bool = False, delay: float = 0.0):
+        super().__init__()
+        self.fail = fail
+        self.delay = delay
+        self.creates = 0
+        self.extends = 0
+
+    async def create(self, model, system_instruction, contents, ttl):
+        self.creates += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("quota")
+        return await super().create(model, system_instruction, contents, ttl)
+
+    async def extend(self, name, ttl):
+        self.extends += 1
+        await super().extend(name, ttl)
+
+
+def test_small_contexts_are_not_cached():
+    async def run():
+        service = CountingService()
+        cache = ContextCache(service, min_tokens=100)
+        assert await cache.get("k", "model", "system", tokens=99) is None
+        assert service.creates == 0
+
+    asyncio.run(run())
+
+
+def test_entries_are_reused_until_they_near_expiry():
+    async def run():
+        service = CountingService()
+        cache = ContextCache(service, ttl=3600, refresh_margin=60, min_tokens=0)
+        name = await cache.get("k", "model", "system", ["video"])
+        assert name and await cache.get("k", "model", "system") == name
+        assert cache.peek("k") == name and cache.peek("other") is None
+        assert service.creates == 1 and service.extends == 0
+        assert service.entries[name]["contents"] == ["video"]
+
+        # Within the refresh margin the TTL is extended instead of creating another
+        cache.refresh_margin = 3600
+        assert cache.peek("k") is None
+        assert await cache.get("k", "model", "system") == name
+        assert service.creates == 1 and service.extends == 1
+
+    asyncio.run(run())
+
+
+def test_entries_the_api_lost_are_created_again():
+    async def run():
+        service = CountingService()
+        cache = ContextCache(service, ttl=3600, refresh_margin=3600, min_tokens=0)
+        first = await cache.get("k", "model", "system")
+        del service.entries[first]
+        second = await cache.get("k", "model", "system")
+        assert second != first and service.creates == 2
+
+    asyncio.run(run())
+
+
+def test_concurrent_callers_share_one_creation():
+    async def run():
+        service = CountingService(delay=0.02)
+        cache = ContextCache(service, min_tokens=0)
+        names = await asyncio.gather(*(cache.get("k", "model", "system") for _ in range(5)))
+        assert len(set(names)) == 1 and service.creates == 1 and len(cache) == 1
+
+    asyncio.run(run())
+
+
+def test_failures_are_not_retried_until_failure_ttl():
+    async def run():
+        service = CountingService(fail=True)
+        cache = ContextCache(service, min_tokens=0, failure_ttl=60)
+        assert await cache.get("k", "model", "system") is None
+        assert await cache.get("k", "model", "system") is None
+        assert service.creates == 1
+
+        cache.failure_ttl = 0
+        service.fail = False
+        assert await cache.get("k", "model", "system") is not None
+        assert service.creates == 2
+
+    asyncio.run(run())
+
+
+def test_close_deletes_live_entries():
+    async def run():
+        service = CountingService()
+        cache = ContextCache(service, min_tokens=0)
+        await cache.get("a", "model", "system")
+        await cache.get("b", "model", "system")
+        await cache.close()
+        assert len(cache) == 0 and service.entries == {}
+
+    asyncio.run(run())
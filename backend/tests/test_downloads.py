@@ -0,0 +1,81 @@
+from functools import partial
+
+import pytest
+import yt_dlp
+
+import downloads
+from downloads import DownloadSettings, YoutubeDownloader, choose_formats, extract_youtube_id
+
+DURATION = 300
+
+FORMATS = [
+    # Known by bitrate only: 800 kbit/s over 300 s is 30 MB
+    {"format_id": "135", "ext": "mp4", "vcodec": "avc1.4d401f", "acodec": "none", "height": 480, "tbr": 800,
+     "url": "https://example.com/135", "protocol": "https"},
+    {"format_id": "137", "ext": "mp4", "vcodec": "avc1.640028", "acodec": "none", "height": 1080,
+     "filesize": 50_000_000, "url": "https://example.com/137", "protocol": "https"},
+    {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.2", "abr": 128,
+     "filesize": 4_800_000, "url": "https://example.com/140", "protocol": "https"},
+]
+
+
+@pytest.fixture
+def downloader(monkeypatch):
+    # Separate streams are only chosen when ffmpeg can merge them
+    monkeypatch.setattr(downloads, "ffmpeg_path", lambda: "/usr/bin/ffmpeg")
+    return YoutubeDownloader(DownloadSettings(min_height=480))
+
+
+def ids(formats):
+    return [f["format_id"] for f in formats]
+
+
+def test_extract_youtube_id():
+    for url in [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=3",
+        "https://youtu.be/dQw4w9WgXcQ",
+        "https://youtube.com/shorts/dQw4w9WgXcQ",
+        "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    ]:
+        assert extract_youtube_id(url) == "dQw4w9WgXcQ"
+    assert extract_youtube_id("https://example.com/video") is None
+
+
+def test_choose_formats_sizes_bitrate_only_formats_by_duration():
+    settings = DownloadSettings(min_height=480)
+    assert ids(choose_formats(FORMATS, settings, DURATION)) == ["135", "140"]
+    # Without the duration the 480p size is unknown and the known 1080p one wins
+    assert ids(choose_formats(FORMATS, settings, None)) == ["137", "140"]
+
+
+def test_choose_formats_without_merging_takes_muxed_mp4():
+    muxed = {"format_id": "18", "ext": "mp4", "vcodec": "avc1", "acodec": "mp4a", "height": 360, "filesize": 9e6}
+    assert ids(choose_formats(FORMATS + [muxed], DownloadSettings(), DURATION, can_merge=False)) == ["18"]
+
+
+def test_choose_formats_avoids_av1():
+    av1 = {"format_id": "397", "ext": "mp4", "vcodec": "av01.0.04M.08", "acodec": "none", "height": 480,
+           "filesize": 1_000_000}
+    assert ids(choose_formats(FORMATS + [av1], DownloadSettings(), DURATION)) == ["135", "140"]
+
+
+def test_select_with_yt_dlp_context(downloader):
+    # Shaped as yt-dlp builds it: formats and flags, no duration
+    ctx = {"formats": FORMATS, "has_merged_format": False, "incomplete_formats": False}
+    [selected] = downloader._select(ctx, duration=DURATION)
+    assert selected["format_id"] == "135+140"
+    assert ids(selected["requested_formats"]) == ["135", "140"]
+
+
+def test_select_through_yt_dlp(downloader):
+    # The selector as download() passes it, run by yt-dlp's own format selection
+    with yt_dlp.YoutubeDL({"quiet": True}) as ydl:
+        [selected] = ydl._select_formats(FORMATS, partial(downloader._select, duration=DURATION))
+    assert selected["format_id"] == "135+140"
+
+
+def test_expected_size_matches_selection(downloader, monkeypatch):
+    info = {"id": "dQw4w9WgXcQ", "duration": DURATION, "formats": FORMATS}
+    monkeypatch.setattr(downloader, "extract_info", lambda url: info)
+    assert downloader.expected_size("https://youtu.be/dQw4w9WgXcQ") == 30_000_000 + 4_800_000
+    assert downloader.expected_size("https://youtu.be/dQw4w9WgXcQ", (0, 30)) == 3_480_000
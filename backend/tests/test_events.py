@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import events
+from events import PreviewBuffer, ProgressBroker, format_sse
+
+
+def test_format_sse():
+    assert format_sse("state", {"progress": 0.5}) == 'event: state\ndata: {"progress": 0.5}\n\n'
+
+
+def test_broker_delivers_events_published_from_other_threads():
+    async def run():
+        broker = ProgressBroker()
+        queue = broker.subscribe("a")
+        other = broker.subscribe("b")
+        assert broker.has_subscribers("a")
+        thread = threading.Thread(target=broker.publish, args=("a", "state", {"progress": 0.1}))
+        thread.start()
+        thread.join()
+        assert await asyncio.wait_for(queue.get(), 1) == ("state", {"progress": 0.1})
+        assert other.empty()
+        broker.unsubscribe("a", queue)
+        assert not broker.has_subscribers("a") and broker.has_subscribers("b")
+        # Events for an analysis without subscribers go nowhere
+        broker.publish("a", "state", {})
+
+    asyncio.run(run())
+
+
+def test_slow_subscribers_keep_the_newest_events(monkeypatch):
+    monkeypatch.setattr(events, "SUBSCRIBER_QUEUE_SIZE", 2)
+
+    async def run():
+        broker = ProgressBroker()
+        queue = broker.subscribe("a")
+        for index in range(5):
+            broker.publish("a", "state", index)
+        await asyncio.sleep(0)
+        assert [queue.get_nowait()[1] for _ in range(queue.qsize())] == [3, 4]
+
+    asyncio.run(run())
+
+
+def test_preview_buffer_collects_sections_by_part():
+    previews = PreviewBuffer()
+    assert previews.add("a", "video", ("member", "summary", "Cats")) == (
+        {"part": "video", "section": "summary", "value": "Cats"}, 1
+    )
+    previews.add("a", "video", ("item", "scenes", 0, {"t": 1}))
+    data, members = previews.add("a", "video", ("item", "scenes", 1, {"t": 2}))
+    assert data["index"] == 1 and members == 2
+    previews.add("a", "0:00-1:00", ("member", "summary", "Dogs"))
+    assert previews.get("a")["video"] == {"summary": "Cats", "scenes": [{"t": 1}, {"t": 2}]}
+    # A retried part starts over without touching the others
+    previews.reset("a", "video")
+    assert list(previews.get("a")) == ["0:00-1:00"]
+
+
+def test_preview_buffer_copies_and_discards():
+    previews = PreviewBuffer()
+    previews.add("a", "video", ("item", "scenes", 0, {"t": 1}))
+    previews.set_offset("a", 60)
+    previews.copy("a", "b")
+    previews.add("b", "video", ("item", "scenes", 1, {"t": 2}))
+    assert len(previews.get("a")["video"]["scenes"]) == 1 and len(previews) == 2
+    previews.copy("missing", "c")
+    assert previews.get("c") is None
+    assert previews.offset("a") == 60 and previews.offset("b") == 0
+    previews.discard("a")
+    assert previews.get("a") is None and previews.offset("a") == 0 and len(previews) == 1
@@ -0,0 +1,179 @@
+import asyncio
+import json
+
+import httpx
+
+from gemini_batch import BatchEntry, BatchStatus, FakeBatchService, GeminiBatchService, OfflineBatcher
+
+
+def gemini_service(handler) -> GeminiBatchService:
+    service = GeminiBatchService("key", base_url="https://gemini.test/v1beta")
+    service._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+def test_gemini_service_submits_inline_requests():
+    sent = []
+
+    def handler(request):
+        sent.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json={"name": "operations/1", "metadata": {"name": "batches/1"}})
+
+    async def run():
+        entries = [BatchEntry("a", {"contents": []}), BatchEntry("b", {"contents": []})]
+        return await gemini_service(handler).submit("gemini-2.0-flash", entries)
+
+    assert asyncio.run(run()) == "batches/1"
+    path, body = sent[0]
+    assert path == "/v1beta/models/gemini-2.0-flash:batchGenerateContent"
+    requests = body["batch"]["input_config"]["requests"]["requests"]
+    assert [r["metadata"]["key"] for r in requests] == ["a", "b"]
+
+
+def test_gemini_service_reads_states_and_outcomes():
+    batches = {
+        "batches/running": {"metadata": {"state": "BATCH_STATE_RUNNING"}},
+        "batches/failed": {"metadata": {"state": "BATCH_STATE_FAILED"}, "error": {"message": "quota"}},
+        "batches/done": {
+            "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+            "response": {"inlinedResponses": {"inlinedResponses": [
+                {"metadata": {"key": "a"}, "response": {"candidates": [{"content": {"parts": [
+                    {"text": '{"x": '}, {"text": "1}"},
+                ]}}]}},
+                {"metadata": {"key": "b"}, "error": {"message": "blocked"}},
+                {"metadata": {"key": "c"}, "response": {"candidates": []}},
+                {"response": {}},
+            ]}},
+        },
+    }
+
+    def handler(request):
+        return httpx.Response(200, json=batches[request.url.path.split("/v1beta/")[1]])
+
+    async def run():
+        service = gemini_service(handler)
+        return [await service.status(name) for name in batches]
+
+    running, failed, done = asyncio.run(run())
+    assert running.state == "running" and not running.done
+    assert failed.state == "failed" and failed.error == "quota"
+    assert done.state == "succeeded"
+    assert done.outcomes["a"].text == '{"x": 1}'
+    assert done.outcomes["b"].error == "blocked"
+    assert done.outcomes["c"].error == "Empty response"
+    assert len(done.outcomes) == 3
+
+
+def test_fake_service_answers_after_the_delay():
+    async def respond(request):
+        if request.get("fail"):
+            raise RuntimeError("no")
+        return "ok"
+
+    async def run():
+        service = FakeBatchService(respond, delay=0.01)
+        name = await service.submit("model", [BatchEntry("a", {}), BatchEntry("b", {"fail": True})])
+        assert (await service.status(name)).state == "running"
+        await asyncio.sleep(0.05)
+        status = await service.status(name)
+        assert status.outcomes["a"].text == "ok" and status.outcomes["b"].error == "no"
+        # Results are handed out once
+        assert (await service.status(name)).state == "failed"
+
+    asyncio.run(run())
+
+
+class RecordingService(FakeBatchService):
+    def __init__(self, respond, delay=0.0):
+        super().__init__(respond, delay)
+        self.sizes = []
+
+    async def submit(self, model, entries):
+        self.sizes.append(len(entries))
+        return await super().submit(model, entries)
+
+
+async def echo(request):
+    return request["text"]
+
+
+def entries(*keys):
+    return [BatchEntry(key, {"text": key.upper()}) for key in keys]
+
+
+def test_batcher_submits_full_batches_at_once():
+    async def run():
+        service = RecordingService(echo)
+        batcher = OfflineBatcher(service, "model", max_batch_size=2, max_wait=60, poll_interval=0.01)
+        await batcher.start()
+        try:
+            futures = batcher.add(entries("a", "b", "c"))
+            outcomes = await asyncio.wait_for(asyncio.gather(*futures[:2]), 1)
+            assert [o.text for o in outcomes] == ["A", "B"]
+            # The third waits for more requests (or max_wait)
+            assert not futures[2].done() and batcher.pending == 1
+            assert service.sizes == [2]
+        finally:
+            await batcher.stop()
+
+    asyncio.run(run())
+
+
+def test_batcher_submits_partial_batches_after_max_wait():
+    async def run():
+        service = RecordingService(echo)
+        batcher = OfflineBatcher(service, "model", max_batch_size=10, max_wait=0.05, poll_interval=0.01)
+        await batcher.start()
+        try:
+            futures = batcher.add(entries("a"))
+            futures += batcher.add(entries("b"))
+            outcomes = await asyncio.wait_for(asyncio.gather(*futures), 1)
+            assert [o.text for o in outcomes] == ["A", "B"] and service.sizes == [2]
+        finally:
+            await batcher.stop()
+
+    asyncio.run(run())
+
+
+def test_batcher_fails_every_request_of_a_failed_batch():
+    class FailingService(FakeBatchService):
+        async def status(self, name):
+            return BatchStatus("failed", error="expired")
+
+    async def run():
+        batcher = OfflineBatcher(FailingService(echo), "model", max_batch_size=2, poll_interval=0.01)
+        await batcher.start()
+        try:
+            outcomes = await asyncio.wait_for(asyncio.gather(*batcher.add(entries("a", "b"))), 1)
+            assert [o.error for o in outcomes] == ["expired", "expired"]
+        finally:
+            await batcher.stop()
+
+    asyncio.run(run())
+
+
+def test_batcher_reports_submitted_batches_and_resumes_them():
+    async def run():
+        service = RecordingService(echo, delay=0.05)
+        submitted = []
+        batcher = OfflineBatcher(
+            service, "model", max_batch_size=2, poll_interval=0.01,
+            on_submitted=lambda name, batch: submitted.append((name, [e.key for e in batch])),
+        )
+        await batcher.start()
+        batcher.add(entries("a", "b"))
+        await asyncio.sleep(0.02)
+        # Stopped before the batch finished, as at a restart
+        await batcher.stop()
+        assert submitted == [("batches/fake-1", ["a", "b"])]
+
+        restarted = OfflineBatcher(service, "model", poll_interval=0.01)
+        await restarted.start()
+        try:
+            futures = restarted.resume("batches/fake-1", ["b", "a"])
+            outcomes = await asyncio.wait_for(asyncio.gather(*futures), 1)
+            assert [o.text for o in outcomes] == ["B", "A"] and service.sizes == [2]
+        finally:
+            await restarted.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from gemini_poller import FileActivationPoller, FileProcessingError, video_duration
+
+
+def gemini_file(state, **fields):
+    return SimpleNamespace(name="files/video", state=state, **fields)
+
+
+class Files:
+    """Answers get_file with the next of ``states``, repeating the last one."""
+
+    def __init__(self, *states):
+        self.states = list(states)
+        self.calls = 0
+
+    async def get(self, name):
+        self.calls += 1
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        return gemini_file(state)
+
+
+def poller(files, **options):
+    return FileActivationPoller(files.get, **{"initial_interval": 0.001, "max_interval": 0.004, **options})
+
+
+def test_active_files_are_returned_without_polling():
+    files = Files("ACTIVE")
+    active = gemini_file("ACTIVE")
+    assert asyncio.run(poller(files).wait(active)) is active and files.calls == 0
+
+
+def test_wait_polls_until_active():
+    files = Files("PROCESSING", "PROCESSING", "ACTIVE")
+    assert asyncio.run(poller(files).wait(gemini_file("PROCESSING"))).state == "ACTIVE"
+    assert files.calls == 3
+
+
+def test_failed_files_raise():
+    with pytest.raises(FileProcessingError, match="failed"):
+        asyncio.run(poller(Files("FAILED")).wait(gemini_file("PROCESSING")))
+
+
+def test_wait_gives_up_at_the_deadline():
+    files = Files("PROCESSING")
+    with pytest.raises(FileProcessingError, match="timeout"):
+        asyncio.run(poller(files, base_timeout=0.05, seconds_per_mb=0).wait(gemini_file("PROCESSING")))
+    # The interval backs off instead of polling every millisecond
+    assert 1 < files.calls < 40
+
+
+def test_waiters_on_one_file_share_a_loop():
+    async def run():
+        files = Files("PROCESSING", "ACTIVE")
+        shared = poller(files)
+        first, second = await asyncio.gather(
+            shared.wait(gemini_file("PROCESSING")), shared.wait(gemini_file("PROCESSING"))
+        )
+        assert first is second and files.calls == 2 and shared.in_progress == 0
+
+    asyncio.run(run())
+
+
+def test_a_cancelled_waiter_leaves_the_others_waiting():
+    async def run():
+        files = Files("PROCESSING", "PROCESSING", "ACTIVE")
+        shared = poller(files)
+        cancelled = asyncio.create_task(shared.wait(gemini_file("PROCESSING")))
+        waiting = asyncio.create_task(shared.wait(gemini_file("PROCESSING")))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        assert (await waiting).state == "ACTIVE"
+
+    asyncio.run(run())
+
+
+def test_deadline_grows_with_size_and_duration():
+    shared = FileActivationPoller(None, base_timeout=60, seconds_per_mb=1, max_timeout=1800)
+    assert shared.deadline_for(gemini_file("PROCESSING"), size_bytes=100 * 1024 * 1024) == 160
+    assert shared.deadline_for(gemini_file("PROCESSING", video_metadata={"videoDuration": "600s"})) == 360
+    assert shared.deadline_for(gemini_file("PROCESSING"), size_bytes=10 * 1024 ** 3) == 1800
+
+
+def test_video_duration():
+    assert video_duration(gemini_file("ACTIVE", video_metadata={"videoDuration": "123.5s"})) == 123.5
+    assert video_duration(gemini_file("ACTIVE", video_metadata={"videoDuration": "soon"})) is None
+    assert video_duration(gemini_file("ACTIVE")) is None
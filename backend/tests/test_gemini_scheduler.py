@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+from gemini_scheduler import FairSlots, GeminiScheduler, OperationLimits, TokenBucket
+
+
+class ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def test_token_bucket_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(per_minute=600)  # 10 per second
+        started = time.monotonic()
+        await bucket.acquire(600)
+        assert time.monotonic() - started < 0.05
+        await bucket.acquire(1)
+        assert time.monotonic() - started >= 0.09
+
+    asyncio.run(run())
+
+
+def test_token_bucket_debt_delays_later_callers():
+    async def run():
+        bucket = TokenBucket(per_minute=600)
+        await bucket.acquire(600)
+        # The request used more than it reserved
+        bucket.adjust(2)
+        started = time.monotonic()
+        await bucket.acquire(1)
+        assert time.monotonic() - started >= 0.25
+
+    asyncio.run(run())
+
+
+def test_token_bucket_drain_and_oversized_requests():
+    async def run():
+        bucket = TokenBucket(per_minute=6000)
+        # Larger than the bucket: goes through once it is full rather than never
+        await asyncio.wait_for(bucket.acquire(10 ** 9), 0.1)
+        bucket.adjust(-6000)
+        bucket.drain()
+        started = time.monotonic()
+        await bucket.acquire(10)
+        assert time.monotonic() - started >= 0.09
+
+    asyncio.run(run())
+
+
+def test_fair_slots_rotate_between_clients():
+    async def run():
+        slots = FairSlots(1)
+        await slots.acquire("a")
+        order = []
+
+        async def wait(client_id, label):
+            await slots.acquire(client_id)
+            order.append(label)
+
+        tasks = [asyncio.create_task(wait("a", label)) for label in ("a1", "a2", "a3")]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(wait("b", "b1")))
+        await asyncio.sleep(0)
+        assert slots.waiting == 4
+        for _ in tasks:
+            slots.release()
+            await asyncio.sleep(0)
+        assert order == ["a1", "b1", "a2", "a3"]
+
+    asyncio.run(run())
+
+
+def test_fair_slots_forget_cancelled_waiters():
+    async def run():
+        slots = FairSlots(1)
+        await slots.acquire("a")
+        waiter = asyncio.create_task(slots.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert slots.waiting == 0
+        slots.release()
+        # The slot is free again rather than handed to the cancelled waiter
+        await asyncio.wait_for(slots.acquire("c"), 0.1)
+
+    asyncio.run(run())
+
+
+def test_scheduler_retries_rate_limit_errors():
+    async def run():
+        scheduler = GeminiScheduler(
+            {"generate": OperationLimits(requests_per_minute=6000)}, backoff_base=0.01, backoff_cap=0.01
+        )
+        attempts = []
+
+        async def fn():
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise ApiError(429 if len(attempts) == 1 else 503)
+            return "ok"
+
+        assert await scheduler.call("generate", fn) == "ok"
+        assert len(attempts) == 3
+        assert scheduler._operation("generate").slots._in_use == 0
+
+    asyncio.run(run())
+
+
+def test_scheduler_gives_up_on_other_errors_and_after_max_retries():
+    async def run():
+        scheduler = GeminiScheduler({}, max_retries=2, backoff_base=0.001)
+        calls = {"400": 0, "429": 0}
+
+        async def fail(code):
+            calls[str(code)] += 1
+            raise ApiError(code)
+
+        with pytest.raises(ApiError):
+            await scheduler.call("generate", lambda: fail(400))
+        with pytest.raises(ApiError):
+            await scheduler.call("generate", lambda: fail(429))
+        assert calls == {"400": 1, "429": 3}
+
+    asyncio.run(run())
+
+
+def test_scheduler_corrects_token_estimates():
+    async def run():
+        scheduler = GeminiScheduler({"generate": OperationLimits(tokens_per_minute=1000)})
+
+        async def fn():
+            return 900
+
+        await scheduler.call("generate", fn, tokens=100, used_tokens=lambda used: used)
+        # 1000 - 100 reserved - 800 more than estimated
+        assert scheduler._operation("generate").tokens._tokens == pytest.approx(100, abs=1)
+
+    asyncio.run(run())
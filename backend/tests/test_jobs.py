@@ -0,0 +1,167 @@
+import asyncio
+import threading
+
+import pytest
+
+from jobs import AnalysisJob, InFlightJobs, JobQueue, QueueFullError
+
+
+def test_submit_rejects_jobs_beyond_max_pending():
+    async def run():
+        queue = JobQueue(lambda job: asyncio.sleep(0), workers=1, max_pending=2)
+        queue.submit(AnalysisJob(analysis_id="a"))
+        queue.submit(AnalysisJob(analysis_id="b"))
+        with pytest.raises(QueueFullError):
+            queue.submit(AnalysisJob(analysis_id="c"))
+        assert queue.pending == 2
+
+    asyncio.run(run())
+
+
+def test_workers_run_jobs_concurrently_and_survive_failures():
+    async def run():
+        running = []
+        peak = 0
+
+        async def handler(job):
+            nonlocal peak
+            running.append(job.analysis_id)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.02)
+            running.remove(job.analysis_id)
+            if job.analysis_id == "fails":
+                raise RuntimeError("boom")
+
+        queue = JobQueue(handler, workers=3, max_pending=10)
+        await queue.start()
+        for name in ("fails", "b", "c", "d", "e", "f"):
+            queue.submit(AnalysisJob(analysis_id=name))
+        await asyncio.wait_for(queue.join(), 1)
+        assert peak == 3 and queue.active == 0 and queue.pending == 0
+        # The worker that ran the failing job keeps taking jobs
+        queue.submit(AnalysisJob(analysis_id="g"))
+        await asyncio.wait_for(queue.join(), 1)
+        await queue.stop()
+
+    asyncio.run(run())
+
+
+def test_put_waits_for_room():
+    async def run():
+        queue = JobQueue(lambda job: asyncio.sleep(0), workers=1, max_batch_pending=1)
+        await queue.put(AnalysisJob(analysis_id="a"))
+        waiting = asyncio.create_task(queue.put(AnalysisJob(analysis_id="b")))
+        await asyncio.sleep(0.01)
+        assert not waiting.done() and queue.batch_pending == 1
+        await queue.start()
+        await asyncio.wait_for(waiting, 1)
+        await asyncio.wait_for(queue.join(), 1)
+        await queue.stop()
+
+    asyncio.run(run())
+
+
+def test_submitted_jobs_go_before_batch_jobs():
+    async def run():
+        handled = []
+
+        async def handler(job):
+            handled.append(job.analysis_id)
+
+        queue = JobQueue(handler, workers=1, max_pending=2, max_batch_pending=2)
+        for name in ("batch_a", "batch_b"):
+            await queue.put(AnalysisJob(analysis_id=name))
+        queue.submit(AnalysisJob(analysis_id="upload"))
+        assert queue.pending == 1 and queue.batch_pending == 2
+        await queue.start()
+        await asyncio.wait_for(queue.join(), 1)
+        await queue.stop()
+        assert handled == ["upload", "batch_a", "batch_b"]
+
+    asyncio.run(run())
+
+
+def test_a_full_batch_lane_leaves_room_for_submissions():
+    async def run():
+        queue = JobQueue(lambda job: asyncio.sleep(0), workers=1, max_pending=1, max_batch_pending=1)
+        await queue.put(AnalysisJob(analysis_id="batch_a"))
+        waiting = asyncio.create_task(queue.put(AnalysisJob(analysis_id="batch_b")))
+        await asyncio.sleep(0.01)
+        # The batch feeder waits; an interactive job is still accepted
+        assert not waiting.done()
+        queue.submit(AnalysisJob(analysis_id="upload"))
+        await queue.start()
+        await asyncio.wait_for(waiting, 1)
+        await asyncio.wait_for(queue.join(), 1)
+        await queue.stop()
+
+    asyncio.run(run())
+
+
+def job(analysis_id, cache_key="key"):
+    return AnalysisJob(analysis_id=analysis_id, cache_key=cache_key)
+
+
+def test_jobs_with_the_same_key_follow_the_first():
+    jobs = InFlightJobs()
+    leader = job("a")
+    assert jobs.attach(leader) is None
+    assert jobs.attach(job("b")) is leader
+    assert jobs.attach(job("c")) is leader
+    assert jobs.attach(job("d", cache_key="other")) is None
+    assert jobs.followers("a") == ["b", "c"] and jobs.following == 2 and len(jobs) == 2
+    # Jobs without a key always run
+    assert jobs.attach(job("e", cache_key=None)) is None and len(jobs) == 2
+
+
+def test_release_ends_the_run():
+    jobs = InFlightJobs()
+    jobs.attach(job("a"))
+    jobs.attach(job("b"))
+    assert jobs.release("a") == ["b"]
+    assert jobs.followers("a") == [] and len(jobs) == 0
+    assert jobs.release("a") == []
+    # The next job for the key runs again
+    assert jobs.attach(job("c")) is None
+
+
+def test_attach_is_thread_safe():
+    jobs = InFlightJobs()
+    barrier = threading.Barrier(16)
+    leaders = []
+
+    def attach(index):
+        barrier.wait()
+        leaders.append(jobs.attach(job(f"j{index}")))
+
+    threads = [threading.Thread(target=attach, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert leaders.count(None) == 1 and jobs.following == 15
+    leader = next(j for j in leaders if j is not None)
+    assert sorted(jobs.followers(leader.analysis_id) + [leader.analysis_id]) == sorted(f"j{i}" for i in range(16))
+
+
+def test_followers_mirror_the_leader_until_it_fails(app_module):
+    # Other tests may leave runs of their own behind
+    in_flight = len(app_module.in_flight_jobs)
+    leader, follower = job("analysis_leader", "flight"), job("analysis_follower", "flight")
+    for analysis_id in (leader.analysis_id, follower.analysis_id):
+        app_module.create_analysis_record(analysis_id)
+    assert app_module.follow_in_flight(leader) is None
+    assert app_module.follow_in_flight(follower) is leader
+
+    app_module.update_analysis(leader.analysis_id, status="processing", progress=0.4, message="Uploading")
+    assert app_module.analysis_store.get(follower.analysis_id).state.message == "Uploading"
+    app_module.update_analysis(leader.analysis_id, status="error", progress=0, message="Download failed")
+    state = app_module.analysis_store.get(follower.analysis_id).state
+    assert (state.status, state.message) == ("error", "Download failed")
+
+    # A request after the failure runs the analysis again instead of following a dead job
+    retry = job("analysis_retry", "flight")
+    app_module.create_analysis_record(retry.analysis_id)
+    assert app_module.follow_in_flight(retry) is None
+    app_module.update_analysis(retry.analysis_id, status="complete", progress=1, message="Done")
+    assert len(app_module.in_flight_jobs) == in_flight
@@ -0,0 +1,61 @@
+import pytest
+
+from keyframes import KeyframeSettings, frame_path
+
+np = pytest.importorskip("numpy")
+
+from keyframes import motion_peaks, scene_cuts, select_keyframes  # noqa: E402
+
+# One minute scanned at 2 samples per second
+SETTINGS = KeyframeSettings(max_frames=8, sample_fps=2.0, min_gap=2.0)
+
+
+def differences(count=120, cuts=(), motion=()):
+    values = np.full(count, 0.01, dtype=np.float32)
+    for index, value in cuts:
+        values[index] = value
+    for start, end in motion:
+        values[start:end] = 0.08
+    return values
+
+
+def test_cuts_are_isolated_spikes():
+    values = differences(cuts=[(30, 0.5), (80, 0.4)])
+    assert list(scene_cuts(values, SETTINGS)) == [30, 80]
+    # Sustained change is motion, not a cut, however large
+    assert list(scene_cuts(differences(motion=[(40, 60)]) * 5, SETTINGS)) == []
+    # Small spikes stay below the threshold
+    assert list(scene_cuts(differences(cuts=[(30, 0.05)]), SETTINGS)) == []
+
+
+def test_motion_peaks_leave_cuts_out():
+    values = differences(cuts=[(30, 0.5)], motion=[(55, 62)])
+    peaks, strengths = motion_peaks(values, scene_cuts(values, SETTINGS), SETTINGS)
+    assert set(peaks) <= set(range(54, 63)) and (strengths > 0.05).all()
+
+
+def test_selection_spends_the_budget_on_events_then_coverage():
+    selected = select_keyframes(differences(cuts=[(30, 0.5), (80, 0.4)], motion=[(55, 62)]), SETTINGS)
+    reasons = dict(selected)
+    assert len(selected) == SETTINGS.max_frames
+    assert reasons[0] == "start"
+    # Cuts are shown a moment after the change
+    assert reasons[31] == reasons[81] == "scene"
+    assert any(reason == "motion" and 55 <= index < 62 for index, reason in selected)
+    assert "coverage" in reasons.values()
+    indexes = [index for index, _ in selected]
+    assert indexes == sorted(indexes)
+    assert all(b - a >= SETTINGS.min_gap * SETTINGS.sample_fps for a, b in zip(indexes, indexes[1:]))
+
+
+def test_short_videos_get_fewer_frames():
+    assert select_keyframes(differences(count=10), SETTINGS) == [(0, "start"), (5, "coverage")]
+    assert select_keyframes(np.zeros(0, dtype=np.float32), SETTINGS) == []
+
+
+def test_frame_paths_follow_ffmpeg_numbering(tmp_path):
+    assert frame_path(str(tmp_path), 0).endswith("000001.jpg")
+
+
+def test_settings_signature_changes_with_the_settings():
+    assert KeyframeSettings().signature() != KeyframeSettings(keep_audio=False).signature()
@@ -0,0 +1,79 @@
+import pytest
+
+import progress
+from progress import DownloadProgressReporter, ProgressThrottle
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(progress.time, "monotonic", clock)
+    return clock
+
+
+def test_throttle_lets_through_steps_of_min_step(clock):
+    throttle = ProgressThrottle(min_step=0.1, max_rate=0)
+    assert throttle.ready(0.0)
+    assert not throttle.ready(0.05)
+    assert throttle.ready(0.1)
+    assert not throttle.ready(0.15)
+
+
+def test_throttle_limits_the_rate(clock):
+    throttle = ProgressThrottle(min_step=0.01, max_rate=4)
+    assert throttle.ready(0.1)
+    clock.now += 0.1
+    assert not throttle.ready(0.5)
+    clock.now += 0.2
+    assert throttle.ready(0.5)
+
+
+def test_final_values_always_pass(clock):
+    throttle = ProgressThrottle(min_step=0.1, max_rate=4)
+    assert throttle.ready(0.95)
+    assert throttle.ready(1.0, final=True)
+
+
+def test_reporter_forwards_throttled_fractions(clock):
+    published = []
+    reporter = DownloadProgressReporter(published.append, min_step=0.25, max_rate=0)
+    for downloaded in range(0, 101, 10):
+        reporter({"status": "downloading", "downloaded_bytes": downloaded, "total_bytes": 100})
+    # Without a size there is nothing to report
+    reporter({"status": "downloading", "downloaded_bytes": 10})
+    reporter({"status": "finished"})
+    assert published == [0.0, 0.3, 0.6, 0.9, 1.0]
+
+
+def test_reporter_survives_callback_errors(clock):
+    def fail(fraction):
+        raise RuntimeError("loop closed")
+
+    DownloadProgressReporter(fail)({"status": "finished"})
+
+
+def merged(format_id, downloaded=None, total=None):
+    formats = [{"format_id": "137", "filesize": 900}, {"format_id": "140", "filesize": 100}]
+    info = {"format_id": format_id, "requested_formats": formats}
+    if downloaded is None:
+        return {"status": "finished", "info_dict": info}
+    return {"status": "downloading", "downloaded_bytes": downloaded, "total_bytes": total, "info_dict": info}
+
+
+def test_reporter_weights_the_streams_of_a_merged_download(clock):
+    published = []
+    reporter = DownloadProgressReporter(published.append, min_step=0.01, max_rate=0)
+    reporter(merged("137", 450, 900))
+    reporter(merged("137"))
+    # The audio stream continues from the video stream instead of starting over
+    reporter(merged("140", 50, 100))
+    reporter(merged("140"))
+    assert published == [0.45, 0.9, 0.95, 1.0]
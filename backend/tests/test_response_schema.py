@@ -0,0 +1,61 @@
+from typing import List, Literal, Optional, Union
+
+import pytest
+from google.genai import types
+from pydantic import BaseModel, Field
+
+from models import ANALYSIS_SERVER_FIELDS, AnalysisResult
+from response_schema import gemini_schema
+
+
+class Scene(BaseModel):
+    start: float = Field(description="Seconds from the start")
+    label: str
+
+
+class Report(BaseModel):
+    title: str
+    mood: Literal["calm", "tense"]
+    scenes: List[Scene]
+    highlight: Optional[Scene] = None
+    rating: Optional[int] = None
+    id: str = ""
+
+
+def test_models_are_converted_with_refs_inlined():
+    schema = gemini_schema(Report)
+    assert schema.type == types.Type.OBJECT
+    assert schema.property_ordering == ["title", "mood", "scenes", "highlight", "rating", "id"]
+    # Fields with defaults are required too, so Gemini fills in the whole structure
+    assert schema.required == schema.property_ordering
+    assert schema.properties["mood"].enum == ["calm", "tense"]
+    scene = schema.properties["scenes"].items
+    assert scene.type == types.Type.OBJECT and scene.properties["start"].description == "Seconds from the start"
+
+
+def test_optional_fields_become_nullable():
+    properties = gemini_schema(Report).properties
+    assert properties["rating"].type == types.Type.INTEGER and properties["rating"].nullable
+    assert properties["highlight"].nullable and properties["highlight"].properties["label"].type == types.Type.STRING
+    assert not properties["title"].nullable
+
+
+def test_excluded_fields_are_left_out():
+    schema = gemini_schema(Report, exclude=["id"])
+    assert "id" not in schema.properties and "id" not in schema.property_ordering and "id" not in schema.required
+
+
+def test_unions_are_rejected():
+    class Mixed(BaseModel):
+        value: Union[int, str]
+
+    with pytest.raises(ValueError):
+        gemini_schema(Mixed)
+
+
+def test_analysis_schema_leaves_server_fields_out():
+    schema = gemini_schema(AnalysisResult, exclude=ANALYSIS_SERVER_FIELDS)
+    assert not set(ANALYSIS_SERVER_FIELDS) & set(schema.properties)
+    # The schema is accepted as a generation config
+    types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from salvage import IncrementalObjectParser, analysis_sections, salvage_analysis, salvage_json_object
+
+DETAIL = {"emotion": "calm", "confidence": 0.8}
+RESPONSE = {
+    "facialExpression": DETAIL,
+    "bodyPosture": DETAIL,
+    "handGestures": DETAIL,
+    "overallEmotion": "calm",
+    "confidenceScore": 0.75,
+    "analysis": "Composed throughout.",
+    "timeline": [{"timestamp": 1.5, "description": "Smiles"}, {"timestamp": 12, "description": "Frowns"}],
+    "deceptionIndicators": [],
+    "confidenceMetrics": [],
+    "keyStrengths": [],
+    "areasOfNote": [],
+    "questionResponse": {"responseStyle": "direct", "topicHandling": "on topic", "behavioralPatterns": []},
+    "questionImpacts": [],
+}
+
+
+def test_salvage_json_object_keeps_complete_members():
+    text = json.dumps(RESPONSE)
+    cut = text[:text.index('"analysis"') + 20]
+    members = salvage_json_object("```json\n" + cut)
+    assert list(members) == ["facialExpression", "bodyPosture", "handGestures", "overallEmotion", "confidenceScore"]
+    assert salvage_json_object("no json here") == {}
+
+
+def test_salvage_analysis_fills_missing_sections():
+    text = json.dumps({**RESPONSE, "confidenceScore": "high", "timeline": [{"oops": 1}]})
+    result = salvage_analysis(text[:text.index('"questionResponse"')])
+    assert result.partial
+    assert result.missingSections == ["confidenceScore", "questionResponse", "timeline", "questionImpacts"]
+    assert result.confidenceScore == 0.0 and result.questionResponse.responseStyle == "Unknown"
+    assert result.facialExpression.emotion == "calm"
+
+
+def test_salvage_analysis_of_a_complete_response_is_not_partial():
+    assert sorted(analysis_sections()) == sorted(RESPONSE)
+    result = salvage_analysis(json.dumps(RESPONSE))
+    assert not result.partial and result.missingSections == []
+
+
+def test_salvage_analysis_without_sections_fails():
+    with pytest.raises(ValueError):
+        salvage_analysis('{"unrelated": 1')
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalObjectParser()
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return parser, events
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 10_000])
+def test_incremental_parser_reports_each_member_and_item_once(size):
+    text = "Here you go: " + json.dumps(RESPONSE, indent=2)
+    parser, events = feed_in_chunks(text, size)
+    assert parser.members == RESPONSE
+    assert [e[1] for e in events if e[0] == "member"] == list(RESPONSE)
+    items = [e for e in events if e[0] == "item"]
+    assert items == [("item", "timeline", i, entry) for i, entry in enumerate(RESPONSE["timeline"])]
+    # Items come before the member holding them
+    assert events.index(items[-1]) < events.index(("member", "timeline", RESPONSE["timeline"]))
+
+
+def test_incremental_parser_waits_for_numbers_to_end():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"confidenceScore": 0') == []
+    assert parser.feed(".75") == []
+    assert parser.feed(", ") == [("member", "confidenceScore", 0.75)]
+    assert parser.feed('"scores": [1, 2') == [("item", "scores", 0, 1)]
+    assert parser.feed("]}") == [("item", "scores", 1, 2), ("member", "scores", [1, 2])]
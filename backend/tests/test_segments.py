@@ -0,0 +1,71 @@
+import pytest
+
+from models import AnalysisDetail, AnalysisResult, KeyStrength, QuestionResponse, TimelineEvent
+from segments import Segment, format_timestamp, localize_result, localize_section, merge_results, plan_segments
+
+
+def result(emotion="calm", confidence=0.5, timeline=(), strengths=()):
+    return AnalysisResult(
+        facialExpression=AnalysisDetail(emotion=emotion, confidence=confidence),
+        bodyPosture=AnalysisDetail(emotion=emotion, confidence=confidence),
+        handGestures=AnalysisDetail(emotion=emotion, confidence=confidence),
+        overallEmotion=emotion,
+        confidenceScore=confidence,
+        analysis=f"Looks {emotion}.",
+        questionResponse=QuestionResponse(responseStyle="direct", topicHandling="on topic", behavioralPatterns=[]),
+        timeline=[TimelineEvent(timestamp=t, description=f"at {t}") for t in timeline],
+        keyStrengths=list(strengths),
+    )
+
+
+def test_short_videos_are_one_segment():
+    [segment] = plan_segments(200, length=300, overlap=15)
+    assert (segment.start, segment.end, segment.owned_start, segment.owned_end) == (0, 200, float("-inf"), float("inf"))
+
+
+def test_segments_overlap_and_split_ownership_in_the_middle():
+    segments = plan_segments(700, length=300, overlap=15)
+    assert [(s.start, s.end) for s in segments] == [(0, 300), (285, 585), (570, 700)]
+    assert [(s.owned_start, s.owned_end) for s in segments] == [
+        (float("-inf"), 292.5), (292.5, 577.5), (577.5, float("inf"))
+    ]
+    assert sum(s.weight for s in segments) == 700
+    assert segments[1].label() == "04:45-09:45"
+    assert format_timestamp(3725) == "1:02:05"
+
+
+def test_localize_result_shifts_and_drops_overlap_events():
+    segment = plan_segments(700, length=300, overlap=15)[1]
+    localized = localize_result(result(timeline=[1, 10, 295]), segment)
+    assert localized.timestamp == 285
+    # 286 belongs to the first segment; 580 to the last
+    assert [e.timestamp for e in localized.timeline] == [295]
+
+
+def test_localize_result_keeps_absolute_timestamps():
+    segment = plan_segments(700, length=300, overlap=15)[1]
+    localized = localize_result(result(timeline=[300, 400]), segment)
+    assert [e.timestamp for e in localized.timeline] == [300, 400]
+
+
+def test_localize_section_matches_localize_result():
+    segment = plan_segments(700, length=300, overlap=15)[1]
+    timeline = [{"timestamp": t, "description": f"at {t}"} for t in (1, 10, 295)]
+    assert localize_section("timeline", timeline, segment) == [{"timestamp": 295, "description": "at 10"}]
+    assert localize_section("timeline", timeline[0], segment) is None
+    # Clip offsets are added on top; other sections are left alone
+    assert localize_section("timeline", timeline[1], segment, offset=60)["timestamp"] == 355
+    assert localize_section("overallEmotion", "calm", segment, offset=60) == "calm"
+
+
+def test_merge_results_weights_segments_by_owned_time():
+    segments = [Segment(0, 0, 100, float("-inf"), 90), Segment(1, 80, 120, 90, float("inf"))]
+    first = result("calm", 0.8, timeline=[50], strengths=[KeyStrength(title="Poise", description="", confidence=0.6)])
+    strength = KeyStrength(title="poise ", description="", confidence=0.9)
+    second = result("tense", 0.2, timeline=[20, 95], strengths=[strength])
+    merged = merge_results([first, second], segments)
+    assert merged.overallEmotion == "calm"
+    assert merged.confidenceScore == pytest.approx((0.8 * 90 + 0.2 * 30) / 120)
+    assert [e.timestamp for e in merged.timeline] == [20, 50, 95]
+    assert [k.confidence for k in merged.keyStrengths] == [0.9]
+    assert merged.analysis == "[00:00-01:40] Looks calm.\n\n[01:20-02:00] Looks tense."
@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import state_store
+from models import AnalysisState, VideoAnalysis
+from state_store import SQLiteStateStore, create_state_store
+
+
+def record(record_id, status="processing"):
+    return VideoAnalysis(
+        id=record_id, state=AnalysisState(status=status, progress=0.5, message="", timestamp=datetime.now())
+    )
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(state_store.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(max_entries=1000, ttl=None):
+        return create_state_store(request.param, str(tmp_path / "states.sqlite3"), VideoAnalysis, max_entries, ttl)
+
+    return make
+
+
+def test_stores_save_and_delete(make_store):
+    store = make_store()
+    store.save(record("a"))
+    saved = store.get("a")
+    saved.state.status = "complete"
+    store.save(saved)
+    assert store.get("a").state.status == "complete" and "a" in store and len(store) == 1
+    store.delete("a")
+    assert store.get("a") is None and "a" not in store
+
+
+def test_stores_expire_records_not_updated_within_ttl(make_store, clock):
+    store = make_store(ttl=60)
+    store.save(record("a"))
+    clock.now += 30
+    store.save(record("a"))
+    clock.now += 59
+    assert store.get("a") is not None
+    clock.now += 2
+    assert store.get("a") is None
+
+
+def test_stores_find_records_by_status(make_store, clock):
+    store = make_store(ttl=60)
+    store.save(record("a"))
+    store.save(record("b", status="complete"))
+    clock.now += 30
+    store.save(record("c"))
+    assert sorted(r.id for r in store.find("processing")) == ["a", "c"]
+    clock.now += 45
+    assert [r.id for r in store.find("processing")] == ["c"]
+
+
+def test_memory_store_evicts_the_least_recently_used():
+    store = create_state_store("memory", "", VideoAnalysis, max_entries=2, ttl=None)
+    store.save(record("a"))
+    store.save(record("b"))
+    store.get("a")
+    store.save(record("c"))
+    assert store.get("b") is None and store.get("a") is not None and len(store) == 2
+
+
+def test_sqlite_store_prunes_beyond_max_entries(tmp_path, clock):
+    store = SQLiteStateStore(str(tmp_path / "states.sqlite3"), VideoAnalysis, max_entries=10)
+    for index in range(100):
+        clock.now += 1
+        store.save(record(f"r{index}"))
+    # Pruning runs every 100 writes and keeps the most recently updated
+    assert len(store) == 10 and store.get("r99") is not None and store.get("r89") is None
+
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "states.sqlite3")
+    first, second = (SQLiteStateStore(path, VideoAnalysis) for _ in range(2))
+    first.save(record("a", status="complete"))
+    assert second.get("a").state.status == "complete"
+
+
+def test_sqlite_store_takes_concurrent_writes(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "states.sqlite3"), VideoAnalysis)
+
+    def write(offset):
+        for index in range(50):
+            store.save(record(f"{offset}-{index}"))
+
+    threads = [threading.Thread(target=write, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store) == 200
+
+
+def test_unknown_stores_are_rejected():
+    with pytest.raises(ValueError):
+        create_state_store("redis", "", VideoAnalysis, 1, None)
@@ -0,0 +1,40 @@
+from models import TriageResult, TriageWindow
+from segments import plan_segments
+from triage import segment_interest, select_segments
+
+# Segments of 0-70, 60-130, 120-190 and 180-240 seconds
+SEGMENTS = plan_segments(240, 70, 10)
+
+
+def triage(*windows):
+    return TriageResult(
+        analyze=True, reason="", windows=[TriageWindow(start=s, end=e, interest=i) for s, e, i in windows]
+    )
+
+
+def indexes(segments):
+    return [segment.index for segment in segments]
+
+
+def test_segment_interest_is_the_best_overlapping_window():
+    rated = triage((0, 30, 0.2), (50, 65, 0.9), (200, 210, 0.4))
+    assert [segment_interest(segment, rated) for segment in SEGMENTS] == [0.9, 0.9, 0.0, 0.4]
+
+
+def test_segments_overlapping_interesting_windows_are_selected_in_order():
+    rated = triage((200, 230, 0.8), (10, 20, 0.6), (140, 150, 0.1))
+    assert indexes(select_segments(SEGMENTS, rated, min_interest=0.5)) == [0, 3]
+
+
+def test_max_segments_keeps_the_most_interesting():
+    rated = triage((10, 20, 0.6), (90, 100, 0.9), (200, 230, 0.7))
+    assert indexes(select_segments(SEGMENTS, rated, min_interest=0.5, max_segments=2)) == [1, 3]
+
+
+def test_without_windows_every_segment_is_kept():
+    assert select_segments(SEGMENTS, triage(), min_interest=0.5) == SEGMENTS
+
+
+def test_the_best_segment_is_kept_when_none_is_interesting_enough():
+    rated = triage((140, 150, 0.3), (10, 20, 0.1))
+    assert indexes(select_segments(SEGMENTS, rated, min_interest=0.5)) == [2]
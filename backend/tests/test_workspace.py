@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+import pytest
+
+from workspace import JOB_PREFIX, Workspace, WorkspaceFullError
+
+DEAD_PID = 2 ** 22 + 1  # Above the kernel's pid_max
+
+
+def test_collect_orphans_removes_only_dead_job_directories(tmp_path):
+    root = tmp_path / "temp"
+    (root / f"{JOB_PREFIX}{DEAD_PID}-analysis_a").mkdir(parents=True)
+    (root / f"{JOB_PREFIX}{DEAD_PID}-analysis_a" / "video.mp4").write_bytes(b"x")
+    (root / f"{JOB_PREFIX}{os.getppid()}-analysis_b").mkdir()
+    (root / "unrelated.txt").write_text("kept")
+    (root / f"{DEAD_PID}-no-prefix").mkdir()
+
+    assert Workspace(str(root), quota_bytes=100).collect_orphans() == 1
+    assert sorted(os.listdir(root)) == sorted(
+        [f"{JOB_PREFIX}{os.getppid()}-analysis_b", "unrelated.txt", f"{DEAD_PID}-no-prefix"]
+    )
+
+
+def test_collect_orphans_removes_earlier_runs_of_this_process(tmp_path):
+    (tmp_path / f"{JOB_PREFIX}{os.getpid()}-analysis_a").mkdir()
+    assert Workspace(str(tmp_path), quota_bytes=100).collect_orphans() == 1
+
+
+def test_job_file_names_stay_in_the_directory(tmp_path):
+    async def run():
+        workspace = Workspace(str(tmp_path), quota_bytes=1000, overhead=1)
+        directory = await workspace.allocate("analysis_a", 10, default_bytes=10)
+        assert os.path.dirname(directory.file("../../etc/my clip.mp4")) == directory.path
+        assert directory.file("../../etc/my clip.mp4").endswith("my_clip.mp4")
+        assert directory.file("").endswith("video")
+
+    asyncio.run(run())
+
+
+def test_allocate_waits_for_released_space(tmp_path):
+    async def run():
+        workspace = Workspace(str(tmp_path), quota_bytes=100, overhead=2)
+        first = await workspace.allocate("a", 40, default_bytes=10)
+        assert workspace.reserved == 80
+        waiting = asyncio.create_task(workspace.allocate("b", 40, default_bytes=10))
+        await asyncio.sleep(0.05)
+        assert not waiting.done() and workspace.waiting == 1
+        workspace.release(first)
+        second = await asyncio.wait_for(waiting, 1)
+        assert workspace.reserved == 80 and not os.path.exists(first.path)
+        workspace.resize(second, 10)
+        assert workspace.reserved == 20
+
+    asyncio.run(run())
+
+
+def test_allocate_times_out(tmp_path):
+    async def run():
+        workspace = Workspace(str(tmp_path), quota_bytes=100, overhead=1)
+        await workspace.allocate("a", 80, default_bytes=10)
+        with pytest.raises(WorkspaceFullError):
+            await workspace.allocate("b", 80, default_bytes=10, timeout=0.05)
+        assert workspace.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_oversized_job_runs_alone(tmp_path):
+    async def run():
+        workspace = Workspace(str(tmp_path), quota_bytes=100, overhead=1)
+        directory = await workspace.allocate("a", 500, default_bytes=10)
+        assert workspace.reserved == 500
+        workspace.release(directory)
+        assert workspace.reserved == 0 and workspace.jobs == 0
+
+    asyncio.run(run())
+
+
+def test_small_videos_go_to_tmpfs(tmp_path):
+    async def run():
+        workspace = Workspace(
+            str(tmp_path / "disk"), quota_bytes=10_000, overhead=1,
+            tmpfs_root=str(tmp_path / "shm"), tmpfs_quota_bytes=150, tmpfs_max_bytes=100,
+        )
+        small = await workspace.allocate("a", 100, default_bytes=1000)
+        assert small.tmpfs and small.path.startswith(str(tmp_path / "shm"))
+        # The tmpfs quota is used up, unknown sizes never go there
+        assert not (await workspace.allocate("b", 100, default_bytes=1000)).tmpfs
+        assert not (await workspace.allocate("c", None, default_bytes=10)).tmpfs
+        workspace.release(small)
+        assert workspace.tmpfs_reserved == 0
+
+    asyncio.run(run())
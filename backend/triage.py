@@ -0,0 +1,33 @@
+from typing import List
+
+from models import TriageResult
+from segments import Segment
+
+
+def segment_interest(segment: Segment, triage: TriageResult) -> float:
+    """The highest interest of the triage windows that overlap the segment."""
+    return max(
+        (w.interest for w in triage.windows if w.start < segment.end and w.end > segment.start),
+        default=0.0,
+    )
+
+
+def select_segments(
+    segments: List[Segment], triage: TriageResult, min_interest: float, max_segments: int = 0
+) -> List[Segment]:
+    """Picks the segments the full model should analyze, in video order.
+
+    Segments overlapping a window rated at least ``min_interest`` qualify, the
+    most interesting first when ``max_segments`` (0 = no limit) cuts them
+    short. Without any windows the triage gave no guidance, so every segment
+    is kept; when no window is interesting enough, the best segment still is.
+    """
+    if not triage.windows:
+        return list(segments)
+    scores = {segment: segment_interest(segment, triage) for segment in segments}
+    selected = [segment for segment in segments if scores[segment] >= min_interest]
+    if not selected:
+        selected = [max(segments, key=lambda s: scores[s])]
+    if max_segments and len(selected) > max_segments:
+        selected = sorted(selected, key=lambda s: scores[s], reverse=True)[:max_segments]
+    return sorted(selected, key=lambda s: s.index)
@@ -0,0 +1,202 @@
+"""Scratch directories for jobs, with a disk quota.
+
+Every job gets its own directory for the video and everything derived from
+it (transcodes, keyframes), so concurrent jobs never share a path and
+cleanup is one ``rmtree``. Before a job writes anything it reserves the
+space it is expected to need; when the quota (or the free space on the
+disk) cannot take it, the job waits until other jobs release theirs instead
+of failing halfway with ENOSPC. Small videos can be kept on a memory-backed
+tmpfs instead.
+
+Directories are named after the process that owns them, so on startup the
+ones left behind by processes that are gone are removed without touching
+those of other workers sharing the directory. Only entries carrying
+``JOB_PREFIX`` are ever removed; anything else in the root is left alone.
+"""
+import asyncio
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from loguru import logger
+
+from metrics import metrics
+
+# Marks the directories this module creates: "job-{pid}-{name}"
+JOB_PREFIX = "job-"
+# How often a waiting job rechecks the free disk space, which other processes change too
+FREE_SPACE_POLL_INTERVAL = 5.0
+
+
+class WorkspaceFullError(Exception):
+    """Raised when a job's space could not be reserved before the timeout."""
+
+
+@dataclass
+class JobDirectory:
+    path: str
+    reserved: int  # Bytes counted against the quota of its root
+    tmpfs: bool = False
+
+    def file(self, filename: str) -> str:
+        """A path in the directory for ``filename``, reduced to a safe base name."""
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "")).lstrip(".")
+        return os.path.join(self.path, name or "video")
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Workspace:
+    """Allocates job directories under ``root`` (or ``tmpfs_root``) within their quotas.
+
+    ``overhead`` is the space reserved per byte of video, for the files
+    derived from it. A job larger than the whole quota runs once nothing else
+    holds space. Reservations are counted per process; the free-space check
+    (``min_free_bytes``) covers everything else writing to the disk.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        quota_bytes: int,
+        overhead: float = 2.0,
+        min_free_bytes: int = 0,
+        tmpfs_root: Optional[str] = None,
+        tmpfs_quota_bytes: int = 0,
+        tmpfs_max_bytes: int = 0,
+    ):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.overhead = overhead
+        self.min_free_bytes = min_free_bytes
+        self.tmpfs_root = tmpfs_root
+        self.tmpfs_quota_bytes = tmpfs_quota_bytes
+        self.tmpfs_max_bytes = tmpfs_max_bytes
+        self.reserved = 0
+        self.tmpfs_reserved = 0
+        self.jobs = 0
+        self.waiting = 0
+        # Set (and replaced) whenever space is returned, waking the jobs waiting for it
+        self._released: Optional[asyncio.Event] = None
+
+    def _roots(self) -> List[str]:
+        return [self.root] + ([self.tmpfs_root] if self.tmpfs_root else [])
+
+    def collect_orphans(self) -> int:
+        """Removes what dead processes (and earlier runs of this one) left behind; returns the count."""
+        removed = 0
+        for root in self._roots():
+            os.makedirs(root, exist_ok=True)
+            for name in os.listdir(root):
+                if not name.startswith(JOB_PREFIX):
+                    continue
+                owner = name[len(JOB_PREFIX):].split("-", 1)[0]
+                if owner.isdigit() and int(owner) != os.getpid() and process_alive(int(owner)):
+                    continue
+                path = os.path.join(root, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+                removed += 1
+        if removed:
+            metrics.incr("workspace_orphans_removed", removed)
+            logger.info(f"Removed {removed} orphaned job directories from the workspace")
+        return removed
+
+    def _fits(self, need: int) -> bool:
+        if self.reserved and self.reserved + need > self.quota_bytes:
+            return False
+        if self.min_free_bytes:
+            os.makedirs(self.root, exist_ok=True)
+            if shutil.disk_usage(self.root).free - need < self.min_free_bytes and self.reserved:
+                return False
+        return True
+
+    def _use_tmpfs(self, need: int, expected_bytes: Optional[int]) -> bool:
+        return (
+            bool(self.tmpfs_root)
+            and expected_bytes is not None
+            and expected_bytes <= self.tmpfs_max_bytes
+            and self.tmpfs_reserved + need <= self.tmpfs_quota_bytes
+        )
+
+    async def allocate(
+        self, name: str, expected_bytes: Optional[int], default_bytes: int, timeout: Optional[float] = None
+    ) -> JobDirectory:
+        """Reserves space for a video of ``expected_bytes`` (``default_bytes`` when unknown) and
+        creates its directory, waiting up to ``timeout`` seconds for other jobs to release space.
+        """
+        need = int((expected_bytes if expected_bytes is not None else default_bytes) * self.overhead)
+        if self._use_tmpfs(need, expected_bytes):
+            self.tmpfs_reserved += need
+            metrics.incr("workspace_tmpfs_jobs")
+            return self._create(self.tmpfs_root, name, need, tmpfs=True)
+
+        if not self._fits(need):
+            metrics.incr("workspace_waits")
+            logger.info(f"Waiting for {need} bytes of workspace ({self.reserved} of {self.quota_bytes} reserved)")
+            started = time.monotonic()
+            self.waiting += 1
+            try:
+                while not self._fits(need):
+                    remaining = FREE_SPACE_POLL_INTERVAL
+                    if timeout is not None:
+                        remaining = min(remaining, timeout - (time.monotonic() - started))
+                        if remaining <= 0:
+                            raise WorkspaceFullError("Not enough scratch space for the video, try again later")
+                    if self._released is None:
+                        self._released = asyncio.Event()
+                    try:
+                        await asyncio.wait_for(self._released.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.waiting -= 1
+            metrics.observe("workspace_wait_seconds", time.monotonic() - started)
+        self.reserved += need
+        return self._create(self.root, name, need, tmpfs=False)
+
+    def _create(self, root: str, name: str, need: int, tmpfs: bool) -> JobDirectory:
+        path = os.path.join(root, f"{JOB_PREFIX}{os.getpid()}-{name}")
+        os.makedirs(path, exist_ok=True)
+        self.jobs += 1
+        return JobDirectory(path=path, reserved=need, tmpfs=tmpfs)
+
+    def resize(self, directory: JobDirectory, video_bytes: int):
+        """Replaces the estimate with the actual size of the video once it is on disk."""
+        need = int(video_bytes * self.overhead)
+        if directory.tmpfs:
+            self.tmpfs_reserved += need - directory.reserved
+        else:
+            self.reserved += need - directory.reserved
+            if need < directory.reserved:
+                self._notify()
+        directory.reserved = need
+
+    def release(self, directory: JobDirectory):
+        """Deletes the directory with everything in it and returns its space."""
+        shutil.rmtree(directory.path, ignore_errors=True)
+        self.jobs -= 1
+        if directory.tmpfs:
+            self.tmpfs_reserved -= directory.reserved
+        else:
+            self.reserved -= directory.reserved
+            self._notify()
+        directory.reserved = 0
+
+    def _notify(self):
+        if self._released is not None:
+            self._released.set()
+            self._released = None
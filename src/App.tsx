@@ -1,11 +1,11 @@
 import React, { useState, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
-import { VideoUploader } from './components/VideoUploader';
+import { VideoUploader, type VideoClip } from './components/VideoUploader';
 import { AnalysisResults } from './components/AnalysisResults';
 import { AnalysisProgress } from './components/AnalysisProgress';
 import { Video, Eye, Activity, Hand } from 'lucide-react';
 import type { AnalysisResult, VideoMetadata, VideoAnalysis, AnalysisState } from './types/analysis';
-import { analyzeVideo, getAnalysisStatus } from './services/api';
+import { analyzeVideo, getAnalysisStatus, subscribeToAnalysis } from './services/api';
 import { Tabs, TabsList, TabsTrigger, TabsContent } from "./components/ui/tabs";
 import { AnalysisReport } from "./components/AnalysisReport";
 
@@ -97,7 +97,7 @@ function App() {
     }
   };
 
-  const handleYoutubeUrl = async (url: string) => {
+  const handleYoutubeUrl = async (url: string, clip?: VideoClip) => {
     try {
       setError(null);
       setUploadState({
@@ -107,7 +107,7 @@ function App() {
         timestamp: new Date().toISOString()
       });
 
-      const id = await analyzeVideo(url);
+      const id = await analyzeVideo(url, clip);
       setAnalysisId(id);
       setVideoMetadata({
         id,
@@ -135,9 +135,12 @@ function App() {
   };
 
   useEffect(() => {
-    let pollInterval: number;
+    if (!analysisId) return;
+    let pollInterval: number | undefined;
+    let latestState: AnalysisState | null = null;
 
-    if (analysisId && (!analysis?.state.status || ['uploading', 'processing'].includes(analysis.state.status))) {
+    // Fallback when the progress stream is unavailable
+    const startPolling = () => {
       pollInterval = window.setInterval(async () => {
         try {
           const status = await getAnalysisStatus(analysisId);
@@ -156,12 +159,43 @@ function App() {
           clearInterval(pollInterval);
         }
       }, 1000);
+    };
+
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return () => clearInterval(pollInterval);
     }
 
+    const unsubscribe = subscribeToAnalysis(analysisId, {
+      onState: (state) => {
+        latestState = state;
+        setUploadState(state);
+        // The completed state is shown together with the result event
+        if (state.status !== 'complete') {
+          setAnalysis(prev => ({ id: analysisId, state, results: prev?.results ?? null }));
+        }
+        if (state.status === 'error') {
+          setError(state.message);
+        }
+      },
+      onResult: (results) => {
+        if (latestState) {
+          setAnalysis({ id: analysisId, state: latestState, results });
+        }
+      },
+      onError: (err) => {
+        console.error('Analysis progress stream error:', err);
+        if (latestState?.status !== 'complete' && latestState?.status !== 'error') {
+          startPolling();
+        }
+      }
+    });
+
     return () => {
+      unsubscribe();
       if (pollInterval) clearInterval(pollInterval);
     };
-  }, [analysisId, analysis?.state.status]);
+  }, [analysisId]);
 
   return (
     <div className="min-h-screen bg-gradient-to-b from-gray-50 to-gray-100">
@@ -357,7 +391,7 @@ function App() {
                     </TabsContent>
                     
                     <TabsContent value="report">
-                      <AnalysisReport result={analysis.results?.[0]} />
+                      <AnalysisReport result={analysis.results?.[0]} analysisId={analysis.id} />
                     </TabsContent>
                   </Tabs>
                 )}
@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { motion } from 'framer-motion';
 import {
   FileText,
@@ -7,16 +7,60 @@ import {
   AlertTriangle,
   BarChart2,
   MessageCircle,
+  Send,
 } from 'lucide-react';
-import { AnalysisResult } from '../types/analysis';
+import { AnalysisResult, FollowUpAnswer } from '../types/analysis';
+import { askAboutAnalysis } from '../services/api';
 
 interface AnalysisReportProps {
   result?: AnalysisResult;
+  // Enables follow-up questions about the analyzed video
+  analysisId?: string;
 }
 
-export const AnalysisReport: React.FC<AnalysisReportProps> = ({ result }) => {
+const formatTime = (seconds: number) => {
+  const minutes = Math.floor(seconds / 60);
+  const secs = Math.floor(seconds % 60);
+  return `${minutes}:${secs.toString().padStart(2, '0')}`;
+};
+
+export const AnalysisReport: React.FC<AnalysisReportProps> = ({ result, analysisId }) => {
+  const [question, setQuestion] = useState('');
+  const [answers, setAnswers] = useState<FollowUpAnswer[]>([]);
+  const [asking, setAsking] = useState(false);
+  const [askError, setAskError] = useState<string | null>(null);
+  const currentAnalysisId = useRef(analysisId);
+
+  // Answers belong to the analysis they were asked about
+  useEffect(() => {
+    currentAnalysisId.current = analysisId;
+    setQuestion('');
+    setAnswers([]);
+    setAsking(false);
+    setAskError(null);
+  }, [analysisId]);
+
   if (!result) return null;
 
+  const handleAsk = async (e: React.FormEvent) => {
+    e.preventDefault();
+    if (!analysisId || !question.trim()) return;
+    setAsking(true);
+    setAskError(null);
+    try {
+      const answer = await askAboutAnalysis(analysisId, question.trim());
+      // Dropped when another analysis was opened while the question was being answered
+      if (currentAnalysisId.current !== analysisId) return;
+      setAnswers(prev => [...prev, answer]);
+      setQuestion('');
+    } catch (err) {
+      if (currentAnalysisId.current !== analysisId) return;
+      setAskError(err instanceof Error ? err.message : 'Failed to answer question');
+    } finally {
+      if (currentAnalysisId.current === analysisId) setAsking(false);
+    }
+  };
+
   const confidenceColor = (score: number) => {
     if (score >= 0.8) return 'bg-green-500';
     if (score >= 0.6) return 'bg-yellow-500';
@@ -36,6 +80,12 @@ export const AnalysisReport: React.FC<AnalysisReportProps> = ({ result }) => {
           Political Communication Analysis
         </h2>
         <p className="text-gray-600 text-lg">{result.analysis}</p>
+        {result.partial && (
+          <p className="mt-4 flex items-center text-sm text-yellow-700">
+            <AlertTriangle className="w-4 h-4 mr-2" />
+            This analysis is incomplete. Missing: {result.missingSections?.join(', ')}
+          </p>
+        )}
       </div>
 
       {/* Key Findings Grid */}
@@ -279,6 +329,50 @@ export const AnalysisReport: React.FC<AnalysisReportProps> = ({ result }) => {
           </ul>
         </div>
       )}
+
+      {/* Follow-up Questions */}
+      {analysisId && (
+        <div className="mt-8 border-t pt-6">
+          <h3 className="text-lg font-semibold mb-4 flex items-center">
+            <MessageCircle className="w-5 h-5 mr-2 text-blue-600" />
+            Ask About This Video
+          </h3>
+          <div className="space-y-4 mb-4">
+            {answers.map((answer, idx) => (
+              <div key={idx} className="bg-gray-50 rounded-lg p-4">
+                <p className="font-medium text-gray-900 mb-2">{answer.question}</p>
+                <p className="text-gray-700">{answer.answer}</p>
+                {answer.timestamps.length > 0 && (
+                  <p className="mt-2 text-sm text-gray-500">
+                    At {answer.timestamps.map(formatTime).join(', ')}
+                  </p>
+                )}
+              </div>
+            ))}
+          </div>
+          <form onSubmit={handleAsk} className="flex gap-2">
+            <input
+              type="text"
+              placeholder="e.g. When does the speaker seem most uncomfortable?"
+              value={question}
+              onChange={(e) => setQuestion(e.target.value)}
+              maxLength={2000}
+              aria-label="Follow-up question"
+              className="flex-1 px-4 py-2 border rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-blue-500"
+              disabled={asking}
+            />
+            <button
+              type="submit"
+              disabled={asking || !question.trim()}
+              className="px-4 py-2 rounded-lg bg-blue-600 text-white hover:bg-blue-700 disabled:bg-gray-200 disabled:text-gray-400 flex items-center"
+            >
+              <Send className="w-4 h-4 mr-2" />
+              {asking ? 'Asking...' : 'Ask'}
+            </button>
+          </form>
+          {askError && <p className="mt-2 text-sm text-red-600">{askError}</p>}
+        </div>
+      )}
     </motion.div>
   );
 };
@@ -4,14 +4,36 @@ import { motion, AnimatePresence } from 'framer-motion';
 import { Upload, Youtube, X } from 'lucide-react';
 import { AnalysisState } from '../types/analysis';
 
+export interface VideoClip {
+  start: number;
+  end?: number;
+}
+
 interface VideoUploaderProps {
   onFileUpload: (file: File) => void;
-  onYoutubeUrl: (url: string) => void;
+  onYoutubeUrl: (url: string, clip?: VideoClip) => void;
   uploadState?: AnalysisState;
 }
 
+// Reads "90", "1:30" or "1:01:30" as seconds; undefined when empty or malformed
+const parseTime = (value: string): number | undefined => {
+  if (!/^\d+(:\d{1,2}){0,2}$/.test(value.trim())) return undefined;
+  return value.trim().split(':').reduce((total, part) => total * 60 + Number(part), 0);
+};
+
 export const VideoUploader: React.FC<VideoUploaderProps> = ({ onFileUpload, onYoutubeUrl, uploadState }) => {
   const [youtubeUrl, setYoutubeUrl] = useState('');
+  const [clipStart, setClipStart] = useState('');
+  const [clipEnd, setClipEnd] = useState('');
+
+  const start = parseTime(clipStart);
+  const end = parseTime(clipEnd);
+  const clipInvalid =
+    (clipStart !== '' && start === undefined) ||
+    (clipEnd !== '' && end === undefined) ||
+    (end !== undefined && end <= (start ?? 0));
+  const clip = start !== undefined || end !== undefined ? { start: start ?? 0, end } : undefined;
+  const busy = uploadState?.status === 'uploading' || uploadState?.status === 'processing';
 
   const onDrop = useCallback((acceptedFiles: File[]) => {
     if (acceptedFiles[0]) {
@@ -133,16 +155,41 @@ export const VideoUploader: React.FC<VideoUploaderProps> = ({ onFileUpload, onYo
             )}
           </div>
 
+          {/* Optional clip: only that part of the video is downloaded and analyzed */}
+          <div className="mt-3 flex items-center gap-2 text-sm text-gray-600">
+            <span>Analyze only from</span>
+            <input
+              type="text"
+              placeholder="0:00"
+              value={clipStart}
+              onChange={(e) => setClipStart(e.target.value)}
+              aria-label="Clip start"
+              className="w-20 px-2 py-1 border rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-blue-500"
+              disabled={busy}
+            />
+            <span>to</span>
+            <input
+              type="text"
+              placeholder="end"
+              value={clipEnd}
+              onChange={(e) => setClipEnd(e.target.value)}
+              aria-label="Clip end"
+              className="w-20 px-2 py-1 border rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-blue-500"
+              disabled={busy}
+            />
+            {clipInvalid && <span className="text-red-600">Use m:ss, with the end after the start</span>}
+          </div>
+
           {/* Submit Button */}
           <motion.button
             whileHover={{ scale: 1.02 }}
             whileTap={{ scale: 0.98 }}
-            onClick={() => onYoutubeUrl(youtubeUrl)}
-            disabled={!youtubeUrl || uploadState?.status === 'uploading' || uploadState?.status === 'processing'}
+            onClick={() => onYoutubeUrl(youtubeUrl, clip)}
+            disabled={!youtubeUrl || clipInvalid || busy}
             className={`
               mt-3 w-full py-3 rounded-xl font-medium text-white
               transition-all duration-300 shadow-lg
-              ${youtubeUrl
+              ${youtubeUrl && !clipInvalid
                 ? 'bg-gradient-to-r from-blue-600 to-blue-700 hover:from-blue-700 hover:to-blue-800'
                 : 'bg-gray-200 text-gray-400 cursor-not-allowed'}
             `}
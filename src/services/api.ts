@@ -1,13 +1,20 @@
-import type { VideoAnalysis } from '../types/analysis';
+import type { AnalysisResult, AnalysisState, FollowUpAnswer, VideoAnalysis } from '../types/analysis';
 
 // const API_BASE_URL = 'http://localhost:8000';
 const API_BASE_URL = 'https://focused-achievement-production.up.railway.app';
 
-export const analyzeVideo = async (file: File | string): Promise<string> => {
+// For YouTube URLs, `clip` limits the download and analysis to that part of the video (in seconds).
+export const analyzeVideo = async (file: File | string, clip?: { start: number; end?: number }): Promise<string> => {
   const formData = new FormData();
   
   if (typeof file === 'string') {
     formData.append('youtube_url', file);
+    if (clip) {
+      formData.append('clip_start', String(clip.start));
+      if (clip.end !== undefined) {
+        formData.append('clip_end', String(clip.end));
+      }
+    }
   } else {
     formData.append('file', file);
   }
@@ -41,3 +48,44 @@ export const getAnalysisStatus = async (id: string): Promise<VideoAnalysis> => {
   
   return data;
 };
+
+// Asks a follow-up question about a completed analysis.
+export const askAboutAnalysis = async (id: string, question: string): Promise<FollowUpAnswer> => {
+  const response = await fetch(`${API_BASE_URL}/analysis/${id}/ask`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ question }),
+  });
+  const data = await response.json();
+
+  if (!response.ok) {
+    throw new Error(data.detail || 'Failed to answer question');
+  }
+
+  return data;
+};
+
+export interface AnalysisEventHandlers {
+  onState: (state: AnalysisState) => void;
+  onResult: (results: AnalysisResult[]) => void;
+  onError: (error: Error) => void;
+}
+
+// Subscribes to the server-sent progress stream; returns a function that closes it.
+export const subscribeToAnalysis = (id: string, handlers: AnalysisEventHandlers): (() => void) => {
+  const source = new EventSource(`${API_BASE_URL}/analysis/${id}/events`);
+
+  source.addEventListener('state', (event) => {
+    handlers.onState(JSON.parse((event as MessageEvent).data));
+  });
+  source.addEventListener('result', (event) => {
+    handlers.onResult(JSON.parse((event as MessageEvent).data));
+  });
+  source.addEventListener('end', () => source.close());
+  source.onerror = () => {
+    source.close();
+    handlers.onError(new Error('Lost connection to analysis progress stream'));
+  };
+
+  return () => source.close();
+};
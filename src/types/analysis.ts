@@ -84,12 +84,22 @@ export interface AnalysisResult {
   questionResponse: QuestionResponse;
   timeline: TimelineEvent[];
   questionImpacts?: QuestionImpact[];  // New field added here
+  partial?: boolean;            // Salvaged from a truncated response
+  missingSections?: string[];   // Sections that were filled with defaults
 }
 
 export interface VideoAnalysis {
   id: string;
   state: AnalysisState;
   results: AnalysisResult[] | null;
+  contentId?: string | null;
+}
+
+export interface FollowUpAnswer {
+  question: string;
+  answer: string;
+  timestamps: number[];
+  cached: boolean;
 }
 
 export interface VideoMetadata {